@@ -0,0 +1,64 @@
+# benchmarks/cumulative_or.py
+"""
+Micro-benchmark of the "once true, stays true" flag of `respiratory_support.tracheostomy_imputed`:
+`cumulative_or` (a vectorized cummax per group, see src/utils.py) against the per-hospitalization python
+lambda it replaced, on a synthetic frame at the scale of the full MIMIC-IV respiratory_support table.
+
+Usage:
+    python -m benchmarks.cumulative_or --hospitalizations 75000 --rows 6000000
+"""
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from src.logging_config import get_logger, setup_logging
+from src.utils import cumulative_or
+
+logger = get_logger('benchmark.cumulative_or')
+
+def synthetic_flags(n_hospitalizations: int, n_rows: int, true_rate: float = 0.002, seed: int = 0) -> pd.DataFrame:
+    '''
+    Rows sorted by hospitalization_id as in respiratory_support, with a rarely true `trach_implied`.
+    '''
+    rng = np.random.default_rng(seed)
+    hospitalization_ids = np.sort(rng.integers(20_000_000, 30_000_000, n_hospitalizations))
+    return pd.DataFrame({
+        "hospitalization_id": pd.Series(np.sort(rng.choice(hospitalization_ids, n_rows)).astype(str), dtype="string"),
+        "trach_implied": rng.random(n_rows) < true_rate,
+    })
+
+def _lambda_per_group(df: pd.DataFrame) -> pd.Series:
+    return df.groupby("hospitalization_id")["trach_implied"].transform(lambda x: x.cumsum().astype(bool))
+
+def _best_of(fn, df: pd.DataFrame, repeat: int) -> tuple[float, pd.Series]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(df)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+def run(n_hospitalizations: int, n_rows: int, repeat: int = 3) -> dict:
+    df = synthetic_flags(n_hospitalizations, n_rows)
+    lambda_seconds, expected = _best_of(_lambda_per_group, df, repeat)
+    vectorized_seconds, result = _best_of(
+        lambda df: cumulative_or(df, "trach_implied", "hospitalization_id"), df, repeat
+    )
+    pd.testing.assert_series_equal(result, expected, check_names=False)
+    return {
+        "rows": n_rows, "hospitalizations": df["hospitalization_id"].nunique(),
+        "lambda_seconds": round(lambda_seconds, 3), "cumulative_or_seconds": round(vectorized_seconds, 3),
+        "speedup": round(lambda_seconds / vectorized_seconds, 1),
+    }
+
+def _main():
+    parser = argparse.ArgumentParser(description="Benchmark cumulative_or against a lambda per group.")
+    parser.add_argument("--hospitalizations", type=int, default=75_000)
+    parser.add_argument("--rows", type=int, default=6_000_000)
+    parser.add_argument("--repeat", type=int, default=3, help="the best of this many runs is reported")
+    args = parser.parse_args()
+    logger.info(run(args.hospitalizations, args.rows, args.repeat))
+
+if __name__ == "__main__":
+    setup_logging()
+    _main()
@@ -0,0 +1,273 @@
+# src/benchmark.py
+"""
+Table-level benchmark of the pipeline on synthetic MIMIC-IV data (see src/synthetic_mimic.py), compared
+against a committed baseline.
+
+For each scale (number of admissions), a synthetic dataset is generated once under output/benchmark/ and
+every job is run in its own process, through `run_job` as in a regular run, with a config that points to
+the dataset (see `CLIF_MIMIC_CONFIG` in src/utils.py). For each job, the wall time, the rows written per
+second and the peak resident memory of its process are recorded, along with the timings of its Hamilton
+nodes from their run manifest (see src/node_manifest.py). The results are saved to
+output/benchmark/results.json.
+
+A job regresses when its time or peak memory exceeds its baseline at the same scale by more than the
+threshold (and by more than a small absolute margin, so that jobs of a few seconds are not flagged by noise),
+or when it fails. The run then exits with an error, listing the regressions and the nodes that slowed down
+the most. The baseline depends on the machine: refresh it with `--update-baseline` on the machine the
+benchmark is compared on.
+
+Usage:
+    python -m src.benchmark --scales 1000 10000 100000 --threshold 0.2
+    python -m src.benchmark --scales 1000 --tables vitals labs --update-baseline
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+from pathlib import Path
+from src.logging_config import get_logger, setup_logging
+from src.utils import config, REPO_ROOT, CLIF_VERSION, clif_manifest_pathfinder, shared_extract_pathfinder
+from src.scheduler import plan_jobs, run_job, job_kwargs
+from src.node_manifest import NODE_MANIFEST_DIR
+from src.resource_monitor import MB, process_peak_rss_bytes
+
+logger = get_logger('benchmark')
+
+BENCHMARK_DIR = Path(REPO_ROOT) / "output/benchmark"
+BASELINE_PATH = Path(REPO_ROOT) / "benchmarks/baseline.json"
+DEFAULT_SCALES = [1000, 10000, 100000]
+DEFAULT_THRESHOLD = 0.2
+# regressions smaller than these absolute margins are ignored as noise
+MIN_DELTAS = {"seconds": 2.0, "peak_rss_mb": 100.0}
+PATIENTS_PER_ADMISSION = 2 / 3
+
+def synthetic_dataset(scale: int, seed: int = 0) -> Path:
+    '''
+    The synthetic MIMIC-IV of `scale` admissions, generated unless it already exists with the same parameters.
+    '''
+    from src.synthetic_mimic import generate_synthetic_mimic
+    data_dir = BENCHMARK_DIR / f"mimic-{scale}"
+    params = {"n_patients": max(1, int(scale * PATIENTS_PER_ADMISSION)), "n_admissions": scale, "seed": seed}
+    params_path = data_dir / "synthetic_params.json"
+    if params_path.exists() and json.loads(params_path.read_text()) == params:
+        logger.info(f"reusing the synthetic MIMIC-IV of {scale} admissions in {data_dir}")
+        return data_dir
+    generate_synthetic_mimic(data_dir, **params)
+    params_path.write_text(json.dumps(params))
+    return data_dir
+
+def benchmark_config(scale: int, data_dir: Path) -> Path:
+    '''
+    Write a copy of config.json that reads from the synthetic dataset, writes the CLIF tables to their own
+    output directory and always rebuilds them from scratch, one at a time.
+    '''
+    bench_config = json.loads(json.dumps(config))
+    bench_config["current_workspace"] = "benchmark"
+    bench_config["benchmark"] = {"mimic_csv_dir": "", "mimic_parquet_dir": str(data_dir)}
+    bench_config["create_mimic_parquet_from_csv"] = 0
+    bench_config["clif_output_dir_name"] = f"benchmark-{scale}"
+    bench_config["skip_unchanged_tables"] = 0
+    bench_config["node_cache"] = {**bench_config.get("node_cache", {}), "enabled": 0}
+    bench_config["scheduler"] = {**bench_config.get("scheduler", {}), "max_workers": 1}
+    config_path = BENCHMARK_DIR / f"config-{scale}.json"
+    config_path.parent.mkdir(parents=True, exist_ok=True)
+    config_path.write_text(json.dumps(bench_config, indent=4))
+    return config_path
+
+def _rows_written(job: str) -> int | None:
+    import duckdb
+    if job == "chartevents_extract":
+        manifest_path = Path(shared_extract_pathfinder("chartevents", suffix="json"))
+        return json.loads(manifest_path.read_text())["rows"] if manifest_path.exists() else None
+    manifest_path = Path(clif_manifest_pathfinder(job))
+    if not manifest_path.exists():
+        return None
+    outputs = [path for path in json.loads(manifest_path.read_text())["outputs"] if path.endswith(".parquet")]
+    return sum(duckdb.execute(f"SELECT COUNT(*) FROM '{path}'").fetchone()[0] for path in outputs)
+
+def _node_timings(since: float) -> dict:
+    '''
+    Timings of the nodes in the run manifests written since `since`, by manifest name and node.
+    '''
+    timings = {}
+    for manifest_path in sorted(Path(NODE_MANIFEST_DIR).glob("*.json")):
+        if manifest_path.stat().st_mtime < since:
+            continue
+        manifest = json.loads(manifest_path.read_text())
+        timings[manifest["name"]] = {
+            node["node"]: {
+                "seconds": node["seconds"],
+                "rows": node["rows"],
+                "rows_per_second": round(node["rows"] / node["seconds"]) if node["rows"] and node["seconds"] else None,
+            }
+            for node in manifest["nodes"]
+        }
+    return timings
+
+def benchmark_job(job: str, tables: list[str]) -> dict:
+    '''
+    Run one job in the current process and measure it. Called in a fresh process for each job,
+    so that its peak memory is its own.
+    '''
+    started = time.time()
+    result = run_job(job, kwargs=job_kwargs(job, plan_jobs(tables)))
+    rows = _rows_written(job)
+    peak_rss_bytes = process_peak_rss_bytes()
+    return {
+        "seconds": result["seconds"],
+        "rows": rows,
+        "rows_per_second": round(rows / result["seconds"]) if rows and result["seconds"] else None,
+        "peak_rss_mb": round(peak_rss_bytes / MB, 1) if peak_rss_bytes is not None else result.get("process_peak_rss_mb"),
+        "duckdb_peak_memory_mb": result.get("duckdb_peak_memory_mb"),
+        "nodes": _node_timings(since=started),
+    }
+
+def run_benchmark(scales: list[int], tables: list[str], seed: int = 0) -> dict:
+    '''
+    Benchmark the jobs that build `tables` at each scale. Returns {scale: {job: measurements or None if it failed}}.
+    '''
+    results = {}
+    for scale in scales:
+        data_dir = synthetic_dataset(scale, seed=seed)
+        env = {**os.environ, "CLIF_MIMIC_CONFIG": str(benchmark_config(scale, data_dir))}
+        results[str(scale)] = {}
+        for job in plan_jobs(tables):
+            logger.info(f"benchmarking {job} at {scale} admissions...")
+            result_path = BENCHMARK_DIR / f"{job}-{scale}.json"
+            result_path.unlink(missing_ok=True)
+            process = subprocess.run(
+                [sys.executable, "-m", "src.benchmark", "--job", job, "--tables", *tables, "--result-path", str(result_path)],
+                cwd=REPO_ROOT, env=env,
+            )
+            if process.returncode != 0 or not result_path.exists():
+                logger.error(f"{job} failed at {scale} admissions (exit code {process.returncode})")
+                results[str(scale)][job] = None
+                continue
+            results[str(scale)][job] = json.loads(result_path.read_text())
+            logger.info(
+                f"{job} at {scale} admissions: {results[str(scale)][job]['seconds']}s, "
+                f"{results[str(scale)][job]['rows_per_second']} rows/s, {results[str(scale)][job]['peak_rss_mb']} MB peak"
+            )
+    return results
+
+def compare_to_baseline(
+    results: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD, min_deltas: dict = None
+) -> list[dict]:
+    '''
+    The jobs that failed, or whose time or peak memory exceed their baseline at the same scale by more than
+    `threshold` (relative) and `min_deltas` (absolute). Jobs and scales missing from the baseline are skipped.
+    '''
+    min_deltas = {**MIN_DELTAS, **(min_deltas or {})}
+    regressions = []
+    for scale, jobs in results.items():
+        for job, result in jobs.items():
+            base = baseline.get(scale, {}).get(job)
+            if base is None:
+                continue
+            if result is None:
+                regressions.append({"scale": scale, "job": job, "metric": "failed", "baseline": None, "current": None})
+                continue
+            for metric, min_delta in min_deltas.items():
+                if base.get(metric) is None or result.get(metric) is None:
+                    continue
+                if result[metric] > base[metric] * (1 + threshold) and result[metric] - base[metric] > min_delta:
+                    regressions.append({
+                        "scale": scale, "job": job, "metric": metric,
+                        "baseline": base[metric], "current": result[metric],
+                        "change": round(result[metric] / base[metric] - 1, 3) if base[metric] else None,
+                        "slowest_nodes": _slowed_down_nodes(base.get("nodes", {}), result.get("nodes", {})),
+                    })
+    return regressions
+
+def _slowed_down_nodes(base_nodes: dict, nodes: dict, top: int = 3) -> list[str]:
+    changes = []
+    for name, timings in nodes.items():
+        for node, timing in timings.items():
+            base_seconds = base_nodes.get(name, {}).get(node, {}).get("seconds")
+            if base_seconds is not None:
+                changes.append((timing["seconds"] - base_seconds, f"{name}.{node} ({base_seconds}s -> {timing['seconds']}s)"))
+    return [description for _, description in sorted(changes, reverse=True)[:top]]
+
+def load_baseline(baseline_path: str | Path = BASELINE_PATH) -> dict:
+    baseline_path = Path(baseline_path)
+    if not baseline_path.exists():
+        return {}
+    return json.loads(baseline_path.read_text())["scales"]
+
+def save_baseline(results: dict, baseline_path: str | Path = BASELINE_PATH):
+    '''
+    Merge the results into the baseline file, keeping the scales and jobs that were not benchmarked.
+    '''
+    baseline_path = Path(baseline_path)
+    scales = load_baseline(baseline_path)
+    for scale, jobs in results.items():
+        scales.setdefault(scale, {}).update({job: result for job, result in jobs.items() if result is not None})
+    baseline = {
+        "updated_at": time.strftime("%Y-%m-%d"),
+        "clif_version": CLIF_VERSION,
+        "machine": {"platform": platform.platform(), "processor": platform.machine(), "cpu_count": os.cpu_count()},
+        "scales": scales,
+    }
+    baseline_path.parent.mkdir(parents=True, exist_ok=True)
+    baseline_path.write_text(json.dumps(baseline, indent=2) + "\n")
+    logger.info(f"saved the baseline to {baseline_path}")
+
+def report(results: dict, baseline: dict):
+    logger.info(f"{'scale':>8} {'job':<30} {'seconds':>8} {'baseline':>9} {'rows/s':>10} {'peak MB':>9} {'baseline':>9}")
+    for scale, jobs in results.items():
+        for job, result in jobs.items():
+            base = baseline.get(scale, {}).get(job) or {}
+            if result is None:
+                logger.info(f"{scale:>8} {job:<30} {'FAILED':>8}")
+                continue
+            logger.info(
+                f"{scale:>8} {job:<30} {result['seconds']:>8} {str(base.get('seconds', '-')):>9} "
+                f"{str(result['rows_per_second']):>10} {str(result['peak_rss_mb']):>9} {str(base.get('peak_rss_mb', '-')):>9}"
+            )
+
+def _main():
+    parser = argparse.ArgumentParser(description="Benchmark the CLIF tables on synthetic MIMIC-IV data.")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES, help="numbers of admissions")
+    parser.add_argument("--tables", nargs="+", default=list(config["clif_tables"]), help="CLIF tables to build")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="relative increase of time or peak memory over the baseline that fails the run")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    parser.add_argument("--update-baseline", action="store_true", help="save the results as the new baseline")
+    parser.add_argument("--seed", type=int, default=0)
+    # internal: run a single job in this process and save its measurements
+    parser.add_argument("--job", help=argparse.SUPPRESS)
+    parser.add_argument("--result-path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    # the job processes append to the logs of the benchmark run
+    setup_logging(file_mode="a" if args.job else "w")
+
+    if args.job:
+        result = benchmark_job(args.job, args.tables)
+        Path(args.result_path).write_text(json.dumps(result, indent=2))
+        return
+
+    results = run_benchmark(args.scales, args.tables, seed=args.seed)
+    results_path = BENCHMARK_DIR / "results.json"
+    results_path.write_text(json.dumps({"scales": results}, indent=2))
+    logger.info(f"saved the results to {results_path}")
+    baseline = load_baseline(args.baseline)
+    report(results, baseline)
+    if args.update_baseline:
+        save_baseline(results, args.baseline)
+        return
+    regressions = compare_to_baseline(results, baseline, threshold=args.threshold)
+    if regressions:
+        for regression in regressions:
+            logger.error(
+                f"REGRESSION in {regression['job']} at {regression['scale']} admissions: {regression['metric']} "
+                f"{regression['baseline']} -> {regression['current']}"
+                + (f"; slowest nodes: {', '.join(regression['slowest_nodes'])}" if regression.get("slowest_nodes") else "")
+            )
+        sys.exit(f"{len(regressions)} benchmark regression(s) over the {args.threshold:.0%} threshold")
+    logger.info(f"no regressions over the {args.threshold:.0%} threshold")
+
+if __name__ == "__main__":
+    _main()
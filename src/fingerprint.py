@@ -0,0 +1,144 @@
+# src/fingerprint.py
+"""
+Fingerprints of the inputs of each table build, so that tables whose inputs have not changed
+since their last build can be skipped.
+
+While a job runs, the path finders in src/utils.py (`mimic_table_pathfinder`, `mapping_path_finder`,
+`mcide_pathfinder`) and `save_to_rclif` record the files it reads and writes. After a successful build,
+the fingerprints of these inputs are saved to a manifest next to the outputs, along with those of
+the CLIF vocabularies in data/mcide and the source code of the job (its module and the `src` modules it
+imports). The next run skips the job if none of them changed and all of its outputs still exist.
+
+- parquet files are fingerprinted by their size and footer (schema, row groups and statistics),
+  so that multi-GB MIMIC tables do not need to be read in full;
+- all other files by a hash of their content.
+"""
+import os
+import ast
+import json
+import hashlib
+from pathlib import Path
+from contextlib import contextmanager
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+_tracked_inputs: set[str] = set()
+_tracked_outputs: set[str] = set()
+# the inputs read within each active `tracking_inputs()`, innermost last
+_input_scopes: list[set[str]] = []
+
+def track_input(path) -> str:
+    '''
+    Record a file read by the current job. Returns the path unchanged so that it can wrap a path in place.
+    '''
+    _tracked_inputs.add(str(path))
+    for scope in _input_scopes:
+        scope.add(str(path))
+    return path
+
+@contextmanager
+def tracking_inputs():
+    '''
+    Collect the files read within the block (e.g. by a single node, see src/node_cache.py).
+    '''
+    scope: set[str] = set()
+    _input_scopes.append(scope)
+    try:
+        yield scope
+    finally:
+        _input_scopes.remove(scope)
+
+def track_output(path) -> str:
+    '''
+    Record a file written by the current job. Returns the path unchanged.
+    '''
+    _tracked_outputs.add(str(path))
+    return path
+
+def start_tracking():
+    _tracked_inputs.clear()
+    _tracked_outputs.clear()
+
+def _parquet_footer_hash(path: str) -> str:
+    # a parquet file ends with its footer, followed by the footer length (4 bytes) and "PAR1"
+    with open(path, "rb") as file:
+        file.seek(-8, os.SEEK_END)
+        footer_length = int.from_bytes(file.read(4), "little")
+        file.seek(-8 - footer_length, os.SEEK_END)
+        return hashlib.sha256(file.read(footer_length)).hexdigest()
+
+def file_fingerprint(path: str) -> str | None:
+    '''
+    Fingerprint of a file (None if it does not exist).
+    '''
+    if not os.path.isfile(path):
+        return None
+    if path.endswith(".parquet"):
+        return f"{os.path.getsize(path)}:{_parquet_footer_hash(path)}"
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+def source_files(module_name: str) -> list[str]:
+    '''
+    Source files of a module under `src` and, recursively, of the `src` modules it imports.
+    '''
+    files, to_visit = set(), [module_name]
+    while to_visit:
+        name = to_visit.pop()
+        path = REPO_ROOT / (name.replace(".", "/") + ".py")
+        if str(path) in files or not path.exists():
+            continue
+        files.add(str(path))
+        for node in ast.walk(ast.parse(path.read_text())):
+            if isinstance(node, ast.Import):
+                to_visit.extend(alias.name for alias in node.names if alias.name.startswith("src."))
+            elif isinstance(node, ast.ImportFrom) and node.module and node.module.startswith("src"):
+                to_visit.append(node.module)
+                # e.g. `from src.tables import labs`
+                to_visit.extend(f"{node.module}.{alias.name}" for alias in node.names)
+    return sorted(files)
+
+def input_fingerprints(module_name: str, input_paths) -> dict:
+    '''
+    Fingerprints of the given input files, of the data/mcide files and of the source code of the module.
+    '''
+    mcide_paths = [str(path) for path in sorted((REPO_ROOT / "data/mcide").glob("*"))]
+    paths = sorted(set(map(str, input_paths)) | set(mcide_paths) | set(source_files(module_name)))
+    return {path: file_fingerprint(path) for path in paths}
+
+def load_manifest(manifest_path: str) -> dict | None:
+    if not Path(manifest_path).exists():
+        return None
+    with open(manifest_path, "r") as file:
+        return json.load(file)
+
+def save_manifest(manifest_path: str, module_name: str, settings: dict = None):
+    '''
+    Save the fingerprints of the inputs read and the list of outputs written since `start_tracking()`,
+    and the settings (e.g. the cohort) that the outputs were built with.
+    '''
+    manifest = {
+        "module": module_name,
+        "inputs": input_fingerprints(module_name, _tracked_inputs),
+        "outputs": sorted(_tracked_outputs),
+        "settings": settings or {},
+    }
+    Path(manifest_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(manifest_path, "w") as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+def is_up_to_date(manifest_path: str, module_name: str, settings: dict = None) -> bool:
+    '''
+    Whether the outputs recorded in the manifest exist, were built with the same settings
+    and all of the recorded inputs are unchanged.
+    '''
+    manifest = load_manifest(manifest_path)
+    if manifest is None or manifest.get("module") != module_name or not manifest["outputs"]:
+        return False
+    if manifest.get("settings", {}) != (settings or {}):
+        return False
+    if not all(Path(output).exists() for output in manifest["outputs"]):
+        return False
+    current = input_fingerprints(module_name, manifest["inputs"].keys())
+    return current == manifest["inputs"]
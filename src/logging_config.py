@@ -41,7 +41,8 @@ def setup_logging(
     output_directory: Optional[str] = None,
     level: int = logging.INFO,
     console_output: bool = True,
-    separate_error_log: bool = True
+    separate_error_log: bool = True,
+    file_mode: str = 'w'
 ) -> logging.Logger:
     """
     Configure centralized logging for the clif_mimic package.
@@ -65,6 +66,9 @@ def setup_logging(
         Whether to show log messages in console (maintains print() experience)
     separate_error_log : bool, default=True
         Whether to create separate log file for warnings/errors only
+    file_mode : str, default='w'
+        Mode used to open the log files; use 'a' to append to the log files of
+        an ongoing run (e.g. from worker processes)
 
     Returns
     -------
@@ -110,7 +114,7 @@ def setup_logging(
     # Handler 1: Main log file (all messages INFO and above)
     all_handler = logging.FileHandler(
         os.path.join(log_dir, 'clif_mimic_all.log'),
-        mode='w',
+        mode=file_mode,
         encoding='utf-8'
     )
     all_handler.setLevel(level)
@@ -121,7 +125,7 @@ def setup_logging(
     if separate_error_log:
         error_handler = logging.FileHandler(
             os.path.join(log_dir, 'clif_mimic_errors.log'),
-            mode='w',
+            mode=file_mode,
             encoding='utf-8'
         )
         error_handler.setLevel(logging.WARNING)
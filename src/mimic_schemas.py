@@ -0,0 +1,222 @@
+# src/mimic_schemas.py
+"""
+Column types of the MIMIC-IV 3.1 tables needed for CLIF, used when converting them from csv to parquet
+instead of letting duckdb sniff the types. Ids are INTEGER (the largest, labevent_id, is well below 2^31),
+flags and small counts SMALLINT, times TIMESTAMP, dates DATE, and measurements DOUBLE.
+Strings stay VARCHAR, which parquet dictionary-encodes.
+"""
+
+MIMIC_CSV_SCHEMAS: dict[str, dict[str, str]] = {
+    # -- hosp --
+    "admissions": {
+        "subject_id": "INTEGER",
+        "hadm_id": "INTEGER",
+        "admittime": "TIMESTAMP",
+        "dischtime": "TIMESTAMP",
+        "deathtime": "TIMESTAMP",
+        "admission_type": "VARCHAR",
+        "admit_provider_id": "VARCHAR",
+        "admission_location": "VARCHAR",
+        "discharge_location": "VARCHAR",
+        "insurance": "VARCHAR",
+        "language": "VARCHAR",
+        "marital_status": "VARCHAR",
+        "race": "VARCHAR",
+        "edregtime": "TIMESTAMP",
+        "edouttime": "TIMESTAMP",
+        "hospital_expire_flag": "SMALLINT",
+    },
+    "d_labitems": {
+        "itemid": "INTEGER",
+        "label": "VARCHAR",
+        "fluid": "VARCHAR",
+        "category": "VARCHAR",
+    },
+    "labevents": {
+        "labevent_id": "INTEGER",
+        "subject_id": "INTEGER",
+        "hadm_id": "INTEGER",
+        "specimen_id": "INTEGER",
+        "itemid": "INTEGER",
+        "order_provider_id": "VARCHAR",
+        "charttime": "TIMESTAMP",
+        "storetime": "TIMESTAMP",
+        "value": "VARCHAR",
+        "valuenum": "DOUBLE",
+        "valueuom": "VARCHAR",
+        "ref_range_lower": "DOUBLE",
+        "ref_range_upper": "DOUBLE",
+        "flag": "VARCHAR",
+        "priority": "VARCHAR",
+        "comments": "VARCHAR",
+    },
+    "patients": {
+        "subject_id": "INTEGER",
+        "gender": "VARCHAR",
+        "anchor_age": "SMALLINT",
+        "anchor_year": "SMALLINT",
+        "anchor_year_group": "VARCHAR",
+        "dod": "DATE",
+    },
+    "transfers": {
+        "subject_id": "INTEGER",
+        "hadm_id": "INTEGER",
+        "transfer_id": "INTEGER",
+        "eventtype": "VARCHAR",
+        "careunit": "VARCHAR",
+        "intime": "TIMESTAMP",
+        "outtime": "TIMESTAMP",
+    },
+    "hcpcsevents": {
+        "subject_id": "INTEGER",
+        "hadm_id": "INTEGER",
+        "chartdate": "DATE",
+        "hcpcs_cd": "VARCHAR",
+        "seq_num": "SMALLINT",
+        "short_description": "VARCHAR",
+    },
+    "procedures_icd": {
+        "subject_id": "INTEGER",
+        "hadm_id": "INTEGER",
+        "seq_num": "SMALLINT",
+        "chartdate": "DATE",
+        "icd_code": "VARCHAR",
+        "icd_version": "SMALLINT",
+    },
+    "diagnoses_icd": {
+        "subject_id": "INTEGER",
+        "hadm_id": "INTEGER",
+        "seq_num": "SMALLINT",
+        "icd_code": "VARCHAR",
+        "icd_version": "SMALLINT",
+    },
+    # -- icu --
+    "chartevents": {
+        "subject_id": "INTEGER",
+        "hadm_id": "INTEGER",
+        "stay_id": "INTEGER",
+        "caregiver_id": "INTEGER",
+        "charttime": "TIMESTAMP",
+        "storetime": "TIMESTAMP",
+        "itemid": "INTEGER",
+        "value": "VARCHAR",
+        "valuenum": "DOUBLE",
+        "valueuom": "VARCHAR",
+        "warning": "SMALLINT",
+    },
+    "d_items": {
+        "itemid": "INTEGER",
+        "label": "VARCHAR",
+        "abbreviation": "VARCHAR",
+        "linksto": "VARCHAR",
+        "category": "VARCHAR",
+        "unitname": "VARCHAR",
+        "param_type": "VARCHAR",
+        "lownormalvalue": "DOUBLE",
+        "highnormalvalue": "DOUBLE",
+    },
+    "datetimeevents": {
+        "subject_id": "INTEGER",
+        "hadm_id": "INTEGER",
+        "stay_id": "INTEGER",
+        "caregiver_id": "INTEGER",
+        "charttime": "TIMESTAMP",
+        "storetime": "TIMESTAMP",
+        "itemid": "INTEGER",
+        "value": "TIMESTAMP",
+        "valueuom": "VARCHAR",
+        "warning": "SMALLINT",
+    },
+    "icustays": {
+        "subject_id": "INTEGER",
+        "hadm_id": "INTEGER",
+        "stay_id": "INTEGER",
+        "first_careunit": "VARCHAR",
+        "last_careunit": "VARCHAR",
+        "intime": "TIMESTAMP",
+        "outtime": "TIMESTAMP",
+        "los": "DOUBLE",
+    },
+    "ingredientevents": {
+        "subject_id": "INTEGER",
+        "hadm_id": "INTEGER",
+        "stay_id": "INTEGER",
+        "caregiver_id": "INTEGER",
+        "starttime": "TIMESTAMP",
+        "endtime": "TIMESTAMP",
+        "storetime": "TIMESTAMP",
+        "itemid": "INTEGER",
+        "amount": "DOUBLE",
+        "amountuom": "VARCHAR",
+        "rate": "DOUBLE",
+        "rateuom": "VARCHAR",
+        "orderid": "INTEGER",
+        "linkorderid": "INTEGER",
+        "statusdescription": "VARCHAR",
+        "originalamount": "DOUBLE",
+        "originalrate": "DOUBLE",
+    },
+    "inputevents": {
+        "subject_id": "INTEGER",
+        "hadm_id": "INTEGER",
+        "stay_id": "INTEGER",
+        "caregiver_id": "INTEGER",
+        "starttime": "TIMESTAMP",
+        "endtime": "TIMESTAMP",
+        "storetime": "TIMESTAMP",
+        "itemid": "INTEGER",
+        "amount": "DOUBLE",
+        "amountuom": "VARCHAR",
+        "rate": "DOUBLE",
+        "rateuom": "VARCHAR",
+        "orderid": "INTEGER",
+        "linkorderid": "INTEGER",
+        "ordercategoryname": "VARCHAR",
+        "secondaryordercategoryname": "VARCHAR",
+        "ordercomponenttypedescription": "VARCHAR",
+        "ordercategorydescription": "VARCHAR",
+        "patientweight": "DOUBLE",
+        "totalamount": "DOUBLE",
+        "totalamountuom": "VARCHAR",
+        "isopenbag": "SMALLINT",
+        "continueinnextdept": "SMALLINT",
+        "statusdescription": "VARCHAR",
+        "originalamount": "DOUBLE",
+        "originalrate": "DOUBLE",
+    },
+    "outputevents": {
+        "subject_id": "INTEGER",
+        "hadm_id": "INTEGER",
+        "stay_id": "INTEGER",
+        "caregiver_id": "INTEGER",
+        "charttime": "TIMESTAMP",
+        "storetime": "TIMESTAMP",
+        "itemid": "INTEGER",
+        "value": "DOUBLE",
+        "valueuom": "VARCHAR",
+    },
+    "procedureevents": {
+        "subject_id": "INTEGER",
+        "hadm_id": "INTEGER",
+        "stay_id": "INTEGER",
+        "caregiver_id": "INTEGER",
+        "starttime": "TIMESTAMP",
+        "endtime": "TIMESTAMP",
+        "storetime": "TIMESTAMP",
+        "itemid": "INTEGER",
+        "value": "DOUBLE",
+        "valueuom": "VARCHAR",
+        "location": "VARCHAR",
+        "locationcategory": "VARCHAR",
+        "orderid": "INTEGER",
+        "linkorderid": "INTEGER",
+        "ordercategoryname": "VARCHAR",
+        "ordercategorydescription": "VARCHAR",
+        "patientweight": "DOUBLE",
+        "isopenbag": "SMALLINT",
+        "continueinnextdept": "SMALLINT",
+        "statusdescription": "VARCHAR",
+        "originalamount": "DOUBLE",
+        "originalrate": "DOUBLE",
+    },
+}
@@ -0,0 +1,190 @@
+# src/node_cache.py
+"""
+Persistent cache of the Hamilton nodes that build the CLIF tables, so that a rebuild only re-runs the
+nodes whose inputs changed since an earlier run.
+
+`NodeCacheAdapter` extends Hamilton's cache adapter, which keys each node by the version of its code and
+of the data of its dependencies. Nodes that read files on their own (the MIMIC tables, the mapping and
+mCIDE csv files) are not covered by that key, so for each cache key the adapter also records the files
+the node read while it ran (see `track_input` in src/fingerprint.py), fingerprinted like the inputs of
+a table build, along with the cohort and shard the run was restricted to and the source code of the
+table's module and the `src` modules it imports. A cached result is only reused if none of them changed.
+For example, rebuilding `labs` after editing the lab order categories reuses the extracted events and
+only re-runs the nodes downstream of `lab_order_category_mapping`.
+
+Nodes returning lazy duckdb relations are never cached (nor the nodes downstream of them), as a relation
+is only a query over the results of its upstream nodes; savers always run. Results are stored under
+output/node_cache/ (or the "dir" set under "node_cache" in config.json, by shard in a sharded build). After
+each run, the least recently used results are evicted until the cache is within "max_size_gb".
+"""
+import os
+import json
+import hashlib
+import duckdb
+import pandas as pd
+from pathlib import Path
+from hamilton.caching.adapter import HamiltonCacheAdapter, CachingBehavior
+from hamilton.lifecycle import GraphExecutionHook
+from src import fingerprint
+from src.logging_config import get_logger
+from src.utils import config, cohort_settings, OUTPUT_DIR, SHARD_NAME
+
+logger = get_logger('node_cache')
+
+NODE_CACHE_CONFIG = config.get("node_cache", {})
+NODE_CACHE_ENABLED = NODE_CACHE_CONFIG.get("enabled", 1) == 1
+NODE_CACHE_DIR = NODE_CACHE_CONFIG.get("dir") or f"{OUTPUT_DIR}/node_cache"
+if NODE_CACHE_CONFIG.get("dir") and SHARD_NAME:
+    # the shards must not share their cache since each holds the results of different admissions
+    NODE_CACHE_DIR = f"{NODE_CACHE_DIR}/{SHARD_NAME}"
+NODE_CACHE_MAX_BYTES = int(float(NODE_CACHE_CONFIG.get("max_size_gb", 50)) * 1024**3)
+
+# the sqlite database of the cache keys, which is never evicted
+_METADATA_STORE_PREFIX = "metadata_store.db"
+
+def _fingerprints(paths) -> dict:
+    return {path: fingerprint.file_fingerprint(path) for path in sorted(paths)}
+
+class NodeCacheAdapter(HamiltonCacheAdapter, GraphExecutionHook):
+    '''
+    Hamilton's cache adapter, invalidating a cached node when the files it read, the cohort or the source
+    code of `module_name` changed, and evicting the least recently used results past `max_bytes`.
+    '''
+    def __init__(self, module_name: str, path: str | Path = None, max_bytes: int = None):
+        path = Path(path or NODE_CACHE_DIR)
+        super().__init__(path=path, default_saver_behavior="recompute")
+        self.cache_path = path
+        self.sources_path = path / "sources"
+        self.sources_path.mkdir(parents=True, exist_ok=True)
+        self.module_name = module_name
+        self.max_bytes = NODE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self._settings = {
+            "cohort": cohort_settings(),
+            "code": _fingerprints(fingerprint.source_files(module_name)),
+        }
+        self._node_inputs: dict[str, set] = {}
+
+    def resolve_behaviors(self, run_id: str) -> dict[str, CachingBehavior]:
+        behaviors = super().resolve_behaviors(run_id)
+        lazy: dict[str, bool] = {}
+
+        def is_lazy(node_) -> bool:
+            # a relation, or computed from one: its cache key would differ on every run
+            if node_.name not in lazy:
+                lazy[node_.name] = node_.type is duckdb.DuckDBPyRelation or any(
+                    is_lazy(dependency) for dependency in node_.dependencies
+                )
+            return lazy[node_.name]
+
+        for node_ in self._fn_graphs[run_id].get_nodes():
+            if is_lazy(node_) and behaviors[node_.name] == CachingBehavior.DEFAULT:
+                behaviors[node_.name] = CachingBehavior.DISABLE
+        return behaviors
+
+    def _sources_file(self, cache_key: str) -> Path:
+        return self.sources_path / f"{hashlib.sha256(cache_key.encode()).hexdigest()}.json"
+
+    def _load_sources(self, cache_key: str) -> dict | None:
+        try:
+            return json.loads(self._sources_file(cache_key).read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _is_valid(self, sources: dict | None) -> bool:
+        if sources is None or sources["settings"] != self._settings:
+            return False
+        return all(fingerprint.file_fingerprint(path) == fp for path, fp in sources["inputs"].items())
+
+    def pre_node_execute(self, *, run_id: str, node_, kwargs: dict, task_id: str = None, **future_kwargs):
+        super().pre_node_execute(run_id=run_id, node_=node_, kwargs=kwargs, task_id=task_id, **future_kwargs)
+        if self.behaviors[run_id][node_.name] != CachingBehavior.DEFAULT:
+            return
+        cache_key = self.get_cache_key(run_id=run_id, node_name=node_.name, task_id=task_id)
+        data_version = self.metadata_store.get(cache_key)
+        if data_version is None:
+            return
+        sources = self._load_sources(cache_key)
+        if not self._is_valid(sources):
+            logger.info(f"recomputing {node_.name}: the files it read or the code changed since it was cached")
+            self.metadata_store.delete(cache_key)
+            return
+        # mark the result as recently used before it is read, so that it is the last to be evicted
+        for path in [self._sources_file(cache_key), *self.cache_path.glob(f"{data_version}*")]:
+            path.touch(exist_ok=True)
+
+    def do_node_execute(self, *, run_id: str, node_, kwargs: dict, task_id: str = None, **future_kwargs):
+        with fingerprint.tracking_inputs() as inputs:
+            self._node_inputs[node_.name] = inputs
+            return super().do_node_execute(
+                run_id=run_id, node_=node_, kwargs=kwargs, task_id=task_id, **future_kwargs
+            )
+
+    def _version_data(self, node_name: str, run_id: str, result, task_id: str = None) -> str:
+        # hashing the content of a large frame takes longer than the node itself (9s for the 1.4M
+        # labevents of 10k admissions), so frames are versioned by what they were computed from instead
+        inputs = self._node_inputs.get(node_name)
+        if inputs is None or not isinstance(result, (pd.DataFrame, pd.Series)):
+            return super()._version_data(node_name=node_name, run_id=run_id, result=result, task_id=task_id)
+        cache_key = self.get_cache_key(run_id=run_id, node_name=node_name, task_id=task_id)
+        provenance = json.dumps([cache_key, _fingerprints(inputs), self._settings], sort_keys=True)
+        return hashlib.sha256(provenance.encode()).hexdigest()
+
+    def post_node_execute(self, *, run_id: str, node_, result, success: bool = True, error=None,
+                          task_id: str = None, **future_kwargs):
+        super().post_node_execute(
+            run_id=run_id, node_=node_, result=result, success=success, error=error, task_id=task_id,
+            **future_kwargs,
+        )
+        inputs = self._node_inputs.pop(node_.name, set())
+        if not success or self.behaviors[run_id][node_.name] != CachingBehavior.DEFAULT:
+            return
+        cache_key = self.get_cache_key(run_id=run_id, node_name=node_.name, task_id=task_id)
+        sources = self._load_sources(cache_key)
+        if self._is_valid(sources) and not inputs:
+            # retrieved from the cache: the job still depends on the files the node read when it ran
+            for path in sources["inputs"]:
+                fingerprint.track_input(path)
+            return
+        sources = {
+            "node": node_.name,
+            "inputs": _fingerprints(inputs),
+            "settings": self._settings,
+        }
+        sources_file = self._sources_file(cache_key)
+        tmp_file = sources_file.with_suffix(f".{os.getpid()}.tmp")
+        tmp_file.write_text(json.dumps(sources))
+        os.replace(tmp_file, sources_file)
+
+    def run_before_graph_execution(self, **future_kwargs):
+        pass
+
+    def run_after_graph_execution(self, **future_kwargs):
+        evict_least_recently_used(self.cache_path, self.max_bytes)
+
+def evict_least_recently_used(cache_path: str | Path, max_bytes: int) -> int:
+    '''
+    Delete the least recently used files of the cache until it holds at most `max_bytes`.
+    Returns the number of bytes freed.
+    '''
+    files = [
+        (stat.st_mtime, stat.st_size, path)
+        for path in Path(cache_path).rglob("*")
+        if path.is_file() and not path.name.startswith(_METADATA_STORE_PREFIX)
+        for stat in [path.stat()]
+    ]
+    total = sum(size for _, size, _ in files)
+    freed = 0
+    for _, size, path in sorted(files, key=lambda file: file[0]):
+        if total - freed <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        freed += size
+    if freed:
+        logger.info(f"evicted {freed / 1024**2:.1f} MB of least recently used results from the node cache")
+    return freed
+
+def node_cache_adapters(module) -> list:
+    '''
+    The adapters to cache the nodes of a table module across runs: none if "node_cache" is disabled.
+    '''
+    return [NodeCacheAdapter(module.__name__)] if NODE_CACHE_ENABLED else []
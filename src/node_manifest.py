@@ -0,0 +1,90 @@
+# src/node_manifest.py
+"""
+Per-node run manifest of the Hamilton drivers that build the CLIF tables.
+
+`NodeManifestAdapter` is a lifecycle adapter attached to every driver built in `src/tables/`. For each node
+it records the wall time, the CPU time of the process (which includes the threads of DuckDB), the number
+of rows and approximate memory of its output, and the resident memory of the process after it ran.
+At the end of each run, the nodes are saved to output/logs/node_manifests/{name}.json (or under the shard's
+directory in a sharded build), so that the nodes that dominate a table's build can be spotted and compared
+across releases.
+
+Row counts and memory are only recorded for pandas outputs: counting the rows of a lazy duckdb relation
+would execute it.
+"""
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+import duckdb
+import pandas as pd
+from hamilton.lifecycle import GraphExecutionHook, NodeExecutionHook
+from src.logging_config import get_logger
+from src.resource_monitor import MB, process_rss_bytes
+from src.utils import LOG_DIR
+
+logger = get_logger('node_manifest')
+
+NODE_MANIFEST_DIR = Path(LOG_DIR) / "node_manifests"
+
+def _output_stats(result) -> dict:
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return {"rows": len(result), "memory_mb": round(result.memory_usage(index=True).sum() / MB, 1)}
+    if isinstance(result, duckdb.DuckDBPyRelation):
+        return {"rows": None, "memory_mb": None, "lazy": True}
+    return {"rows": None, "memory_mb": None}
+
+class NodeManifestAdapter(GraphExecutionHook, NodeExecutionHook):
+    '''
+    Record the timing, row count and memory of every node executed by a driver, and save them
+    to a json manifest named after `name` (e.g. the table) when the run ends.
+    '''
+    def __init__(self, name: str, manifest_dir: str | Path = None):
+        self.name = name
+        self.manifest_dir = Path(manifest_dir or NODE_MANIFEST_DIR)
+        self.nodes: list[dict] = []
+        self._started: dict[str, tuple[float, float]] = {}
+
+    def run_before_graph_execution(self, *, final_vars: list[str], run_id: str, **future_kwargs):
+        self.nodes = []
+        self.final_vars = list(final_vars)
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self._run_start = time.perf_counter()
+
+    def run_before_node_execution(self, *, node_name: str, **future_kwargs):
+        self._started[node_name] = (time.perf_counter(), time.process_time())
+
+    def run_after_node_execution(
+        self, *, node_name: str, node_tags: dict, result, success: bool, **future_kwargs
+    ):
+        wall_start, cpu_start = self._started.pop(node_name)
+        rss_bytes = process_rss_bytes()
+        self.nodes.append({
+            "node": node_name,
+            "seconds": round(time.perf_counter() - wall_start, 3),
+            "cpu_seconds": round(time.process_time() - cpu_start, 3),
+            **_output_stats(result),
+            "process_rss_mb": round(rss_bytes / MB, 1) if rss_bytes is not None else None,
+            "property": node_tags.get("property"),
+            "success": success,
+        })
+
+    def run_after_graph_execution(self, *, success: bool, run_id: str, **future_kwargs):
+        manifest = {
+            "name": self.name,
+            "run_id": str(run_id),
+            "started_at": self.started_at,
+            "seconds": round(time.perf_counter() - self._run_start, 3),
+            "success": success,
+            "final_vars": self.final_vars,
+            "nodes": self.nodes,
+        }
+        self.manifest_dir.mkdir(parents=True, exist_ok=True)
+        manifest_path = self.manifest_dir / f"{self.name}.json"
+        with open(manifest_path, "w") as file:
+            json.dump(manifest, file, indent=2)
+        slowest = sorted(self.nodes, key=lambda node: node["seconds"], reverse=True)[:3]
+        logger.info(
+            f"saved the timings of {len(self.nodes)} nodes to {manifest_path}; slowest: "
+            + ", ".join(f"{node['node']} ({node['seconds']:.1f}s)" for node in slowest)
+            )
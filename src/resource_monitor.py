@@ -0,0 +1,84 @@
+# src/resource_monitor.py
+"""
+Peak memory and spill of the duckdb connections while a job runs, to size the `memory_limit`
+(under "duckdb" or "scheduler" in config.json) that the tables need.
+
+A background thread samples `duckdb_memory()` on a cursor of each connection, i.e. the memory held by
+the buffer manager of its database and the bytes it has spilled to the temp directory, along with the
+resident memory of the process (Linux only), which also counts the pandas DataFrames.
+"""
+import os
+import threading
+import duckdb
+
+MB = 1024 ** 2
+
+def process_rss_bytes() -> int | None:
+    try:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+def process_peak_rss_bytes() -> int | None:
+    # high-water mark of the resident memory of this process (Linux only); unlike `ru_maxrss`,
+    # it is not inherited from the parent of a subprocess
+    try:
+        with open("/proc/self/status", "r") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        return None
+    return None
+
+class DuckDBResourceMonitor:
+    '''
+    Context manager recording the peak duckdb memory, peak spilled bytes and peak process memory
+    while the block runs.
+    '''
+    def __init__(self, connections: list[duckdb.DuckDBPyConnection], interval: float = 0.5):
+        self.cursors = [conn.cursor() for conn in connections]
+        self.interval = interval
+        self.peak_memory_bytes = 0
+        self.peak_spilled_bytes = 0
+        self.peak_rss_bytes = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        memory_bytes, spilled_bytes = 0, 0
+        for cursor in self.cursors:
+            memory, spilled = cursor.execute(
+                "SELECT SUM(memory_usage_bytes), SUM(temporary_storage_bytes) FROM duckdb_memory()"
+            ).fetchone()
+            memory_bytes += memory or 0
+            spilled_bytes += spilled or 0
+        self.peak_memory_bytes = max(self.peak_memory_bytes, memory_bytes)
+        self.peak_spilled_bytes = max(self.peak_spilled_bytes, spilled_bytes)
+        rss_bytes = process_rss_bytes()
+        if rss_bytes is not None:
+            self.peak_rss_bytes = max(self.peak_rss_bytes or 0, rss_bytes)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        for cursor in self.cursors:
+            cursor.close()
+
+    def report(self) -> dict:
+        return {
+            "duckdb_peak_memory_mb": round(self.peak_memory_bytes / MB, 1),
+            "duckdb_peak_spilled_mb": round(self.peak_spilled_bytes / MB, 1),
+            "process_peak_rss_mb": round(self.peak_rss_bytes / MB, 1) if self.peak_rss_bytes is not None else None,
+        }
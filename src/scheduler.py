@@ -0,0 +1,279 @@
+# src/scheduler.py
+"""
+Dependency-aware scheduler for building the selected CLIF tables.
+
+Each "job" is one module under `src/tables/` whose `_main()` builds one or more CLIF tables.
+Jobs whose dependencies have finished are dispatched to a process pool, so independent tables
+(e.g. `adt`, `vitals`, `hospital_diagnosis`) are built at the same time. With `max_workers = 1`
+(the default), jobs run one after another in the current process, as before.
+
+Configured under `"scheduler"` in config.json:
+- max_workers: number of jobs to run at the same time.
+- memory_budget_gb: total memory budget for the run, split evenly across the concurrent jobs
+  and applied as each job's DuckDB `memory_limit` (0 = no limit).
+The other DuckDB settings (temp directory to spill to, threads, ...) come from "duckdb" in config.json.
+
+The peak DuckDB memory, spilled bytes and process memory of each job are logged at the end of the run
+and saved to output/logs/resource_report.json (see src/resource_monitor.py).
+
+A table whose inputs (MIMIC tables, mapping and mCIDE csv files, source code) are unchanged since its
+last successful build, and that was built with the same settings (`"cohort"`, `"rclif_parquet"` and the
+`preserve_insertion_order` of `"duckdb"` in config.json), is skipped (see src/fingerprint.py), unless
+`"skip_unchanged_tables": 0`.
+
+Besides the table modules, a run may include shared extraction stages (see src/shared_extracts.py)
+that the tables depend on. These stages are optional: if one fails, the tables that depend on it
+still run and read from the full MIMIC tables instead.
+"""
+import os
+import json
+import time
+import importlib
+import multiprocessing as mp
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import duckdb
+from src.logging_config import setup_logging, get_logger
+from src.utils import config, clif_manifest_pathfinder, configure_duckdb, duckdb_settings, cohort_settings, \
+    set_shard_key, OUTPUT_DIR, LOG_DIR
+from src import fingerprint
+from src.resource_monitor import DuckDBResourceMonitor
+from src.shared_extracts import EXTRACT_CHARTEVENTS_ONCE, CHARTEVENTS_CONSUMERS
+
+logger = get_logger('scheduler')
+
+SCHEDULER_CONFIG = config.get("scheduler", {})
+MAX_WORKERS = int(SCHEDULER_CONFIG.get("max_workers", 1))
+MEMORY_BUDGET_GB = float(SCHEDULER_CONFIG.get("memory_budget_gb", 0))
+SKIP_UNCHANGED_TABLES = config.get("skip_unchanged_tables", 1) == 1
+
+# CLIF tables that are built together by one module when they are all selected
+JOB_GROUPS = {
+    "medication_admin": ["medication_admin_continuous", "medication_admin_intermittent"],
+    # both read MIMIC outputevents, which is then scanned once (see `extract_for_clif_tables` in src/utils.py)
+    "input_output": ["input", "output"],
+}
+
+# jobs that are not table modules under src/tables/
+JOB_MODULES = {
+    "chartevents_extract": "src.shared_extracts",
+}
+
+# jobs that must finish before a given job can start
+JOB_DEPENDENCIES: dict[str, list[str]] = {
+    table: ["chartevents_extract"] for table in CHARTEVENTS_CONSUMERS
+}
+
+# jobs whose failure does not stop the jobs depending on them
+OPTIONAL_JOBS = {"chartevents_extract"}
+
+def plan_jobs(clif_tables: list[str]) -> list[str]:
+    '''
+    Translate the list of CLIF tables to build into the list of jobs (module names) to run.
+    '''
+    jobs = list(clif_tables)
+    for job, grouped_tables in JOB_GROUPS.items():
+        if all(table in jobs for table in grouped_tables):
+            logger.info(f"since you elect to build all of {grouped_tables}, we use the {job} module to build them together")
+            position = jobs.index(grouped_tables[0])
+            jobs = [table for table in jobs if table not in grouped_tables]
+            jobs.insert(position, job)
+    # the shared extract only pays off when at least two tables read from it
+    if EXTRACT_CHARTEVENTS_ONCE and len([table for table in jobs if table in CHARTEVENTS_CONSUMERS]) >= 2:
+        jobs.insert(0, "chartevents_extract")
+    return _dependencies_first(jobs)
+
+def _dependencies_first(jobs: list[str]) -> list[str]:
+    '''
+    Reorder the jobs (stably) so that every job comes after its dependencies.
+    '''
+    ordered = []
+    while len(ordered) < len(jobs):
+        for job in jobs:
+            if job not in ordered and all(dep in ordered for dep in job_dependencies(job, jobs)):
+                ordered.append(job)
+                break
+        else:
+            raise ValueError(f"circular dependencies among jobs: {[job for job in jobs if job not in ordered]}")
+    return ordered
+
+def job_dependencies(job: str, jobs: list[str]) -> list[str]:
+    '''
+    Return the dependencies of a job that are part of the current run.
+    '''
+    return [dep for dep in JOB_DEPENDENCIES.get(job, []) if dep in jobs]
+
+def _failed_dependencies(job: str, jobs: list[str], results: dict) -> list[str]:
+    return [
+        dep for dep in job_dependencies(job, jobs)
+        if dep in results and results[dep] is None and dep not in OPTIONAL_JOBS
+    ]
+
+def job_kwargs(job: str, jobs: list[str]) -> dict:
+    '''
+    Keyword arguments to pass to the `_main()` of a job.
+    '''
+    if job == "chartevents_extract":
+        return {"clif_tables": [table for table in jobs if table in CHARTEVENTS_CONSUMERS]}
+    return {}
+
+def duckdb_job_settings(n_concurrent_jobs: int) -> dict:
+    '''
+    Split the DuckDB threads and the memory budget fairly between concurrent jobs.
+    '''
+    total_threads = int(duckdb_settings().get("threads") or os.cpu_count() or 1)
+    settings = {"threads": max(1, total_threads // n_concurrent_jobs)}
+    if MEMORY_BUDGET_GB > 0:
+        settings["memory_limit"] = f"{MEMORY_BUDGET_GB / n_concurrent_jobs:.2f}GB"
+    return settings
+
+def _configure_duckdb(settings: dict):
+    import src.utils
+    for name, conn in (("default", duckdb.default_connection()), ("con", src.utils.con)):
+        configure_duckdb(conn, name, **settings)
+
+def _init_worker():
+    # workers are spawned fresh, so they need their own handlers (appending to the parent's log files)
+    setup_logging(OUTPUT_DIR, file_mode="a")
+
+def _build_settings() -> dict:
+    # settings that change the outputs of a job without changing any of its input files: the cohort, how the
+    # tables are written to parquet ("rclif_parquet") and whether duckdb keeps the order of their rows
+    import src.utils
+    settings = {
+        "rclif_parquet": {
+            "compression": src.utils.RCLIF_COMPRESSION,
+            "row_group_size": src.utils.RCLIF_ROW_GROUP_SIZE,
+            "order_by": src.utils.RCLIF_ORDER_BY,
+        },
+        "preserve_insertion_order": duckdb_settings()["preserve_insertion_order"],
+    }
+    cohort = cohort_settings()
+    if cohort:
+        settings["cohort"] = cohort
+    return settings
+
+def run_job(job: str, duckdb_settings: dict = None, kwargs: dict = None) -> dict:
+    '''
+    Build the CLIF table(s) of one job by calling the `_main()` of its module.
+    '''
+    module_name = JOB_MODULES.get(job, f"src.tables.{job}")
+    # the shared extraction stages keep track of their own freshness
+    fingerprinted = job not in JOB_MODULES
+    manifest_path = clif_manifest_pathfinder(job)
+    settings = _build_settings()
+    if fingerprinted and SKIP_UNCHANGED_TABLES and fingerprint.is_up_to_date(manifest_path, module_name, settings):
+        logger.info(f"skipping {job} since none of its inputs have changed since its last build")
+        return {"job": job, "seconds": 0.0, "skipped": True}
+    if duckdb_settings:
+        _configure_duckdb(duckdb_settings)
+    module = importlib.import_module(module_name)
+    # e.g. the patient table is built per subject rather than per admission (see src/sharding.py)
+    set_shard_key(getattr(module, "SHARD_KEY", "hadm_id"))
+    if fingerprinted:
+        # drop the old manifest first so that a failed build is never mistaken for an up-to-date one
+        Path(manifest_path).unlink(missing_ok=True)
+        fingerprint.start_tracking()
+    import src.utils
+    start = time.perf_counter()
+    try:
+        with DuckDBResourceMonitor([duckdb.default_connection(), src.utils.con]) as monitor:
+            module._main(**(kwargs or {}))
+    finally:
+        # the checkpoints of a job are never read by the next ones
+        src.utils.drop_materialized()
+    seconds = round(time.perf_counter() - start, 1)
+    if fingerprinted:
+        fingerprint.save_manifest(manifest_path, module_name, settings)
+    return {"job": job, "seconds": seconds, **monitor.report()}
+
+def _run_serially(jobs: list[str]) -> dict:
+    results = {}
+    for counter, job in enumerate(jobs, start=1):
+        failed_deps = _failed_dependencies(job, jobs, results)
+        if failed_deps:
+            logger.error(f"skipping {job} since its dependencies failed: {failed_deps}")
+            results[job] = None
+            continue
+        logger.info(f"building job {counter} out of {len(jobs)}: {job}")
+        try:
+            results[job] = run_job(
+                job, duckdb_job_settings(1) if MEMORY_BUDGET_GB > 0 else None, job_kwargs(job, jobs)
+            )
+            logger.info(f"finished {job} in {results[job]['seconds']}s")
+        except Exception as e:
+            logger.error(f"error building {job}: {e}")
+            results[job] = None
+        logger.info(f"------------------------------")
+    return results
+
+def _run_in_parallel(jobs: list[str], max_workers: int) -> dict:
+    results = {}
+    pending = list(jobs)
+    running = {}
+    settings = duckdb_job_settings(max_workers)
+    logger.info(f"running up to {max_workers} jobs at a time with duckdb settings {settings} per job")
+    with ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=mp.get_context("spawn"), initializer=_init_worker
+    ) as executor:
+        while pending or running:
+            for job in list(pending):
+                deps = job_dependencies(job, jobs)
+                failed_deps = _failed_dependencies(job, jobs, results)
+                if failed_deps:
+                    logger.error(f"skipping {job} since its dependencies failed: {failed_deps}")
+                    results[job] = None
+                    pending.remove(job)
+                elif all(dep in results for dep in deps) and len(running) < max_workers:
+                    logger.info(f"starting {job} ({len(results) + len(running) + 1} out of {len(jobs)} jobs)")
+                    running[executor.submit(run_job, job, settings, job_kwargs(job, jobs))] = job
+                    pending.remove(job)
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = running.pop(future)
+                try:
+                    results[job] = future.result()
+                    logger.info(f"finished {job} in {results[job]['seconds']}s")
+                except Exception as e:
+                    logger.error(f"error building {job}: {e}")
+                    results[job] = None
+    return results
+
+def build_clif_tables(clif_tables: list[str], max_workers: int = None) -> dict:
+    '''
+    Build the given CLIF tables, running independent jobs concurrently.
+
+    Returns a dict of job name -> result of `run_job`: None for jobs that failed or whose dependencies failed,
+    and {"job": ..., "seconds": 0.0, "skipped": True} for jobs skipped since their inputs are unchanged
+    (their tables are the ones from the last build).
+    '''
+    max_workers = max_workers or MAX_WORKERS
+    jobs = plan_jobs(clif_tables)
+    logger.info(f"scheduled {len(jobs)} jobs: {jobs}")
+    if max_workers <= 1 or len(jobs) <= 1:
+        results = _run_serially(jobs)
+    else:
+        results = _run_in_parallel(jobs, min(max_workers, len(jobs)))
+    report_resources(results)
+    return results
+
+def report_resources(results: dict, report_path: str = None) -> list[dict]:
+    '''
+    Log the time, peak memory and spilled bytes of each job that ran, and save them as a json file.
+    '''
+    report = [result for result in results.values() if result is not None and not result.get("skipped")]
+    if not report:
+        return report
+    logger.info(f"{'job':<30} {'seconds':>8} {'duckdb peak MB':>15} {'spilled MB':>11} {'process peak MB':>16}")
+    for result in report:
+        logger.info(
+            f"{result['job']:<30} {result['seconds']:>8} {result['duckdb_peak_memory_mb']:>15} "
+            f"{result['duckdb_peak_spilled_mb']:>11} {str(result['process_peak_rss_mb']):>16}"
+            )
+    report_path = report_path or f"{LOG_DIR}/resource_report.json"
+    Path(report_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(report_path, "w") as file:
+        json.dump({"duckdb_settings": duckdb_settings(), "jobs": report}, file, indent=2)
+    return report
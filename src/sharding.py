@@ -0,0 +1,130 @@
+# src/sharding.py
+"""
+Hash-sharded build of the CLIF tables across several nodes (or processes).
+
+With the environment variable CLIF_MIMIC_SHARD="k/K", `python main.py` builds every selected table only
+for the admissions with hash(hadm_id) % K == k: the condition is pushed down into every MIMIC scan along
+with the cohort (see `cohort_predicate` in src/utils.py). The tables built per patient (`patient`,
+`code_status`) are sharded by hash(subject_id) instead, as declared by `SHARD_KEY` in their modules.
+Each shard writes its tables, manifests, logs and intermediate files under output/shards/shard-k-of-K/,
+so the shards can run at the same time on nodes sharing a file system, e.g. as a SLURM job array:
+
+    CLIF_MIMIC_SHARD=$SLURM_ARRAY_TASK_ID/$SLURM_ARRAY_TASK_COUNT python main.py
+
+Once every shard has finished, `python -m src.sharding merge --shards K` concatenates the shards of each
+table and sorts them into the final output/{clif_output_dir_name}/clif_*.parquet. The result does not
+depend on K or on the order the shards finished in.
+
+`python -m src.sharding launch --shards K` runs the K shards as local processes and then merges them,
+standing in for the cluster scheduler, e.g. to test a sharded build on one machine.
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+from pathlib import Path
+from src.logging_config import get_logger, setup_logging
+from src.utils import (
+    con, config, clif_table_pathfinder, save_to_rclif, resave_select_mimic_tables_from_csv_to_parquet,
+    create_dir_if_not_exists, MIMIC_TABLES_NEEDED_FOR_CLIF, MIMIC_PARQUET_DIR, REPO_ROOT, RCLIF_ORDER_BY,
+)
+
+logger = get_logger('sharding')
+
+SHARDS_DIR = REPO_ROOT / "output/shards"
+
+# the merged tables are sorted by these columns (those present in the table), unless "order_by" is set for
+# the table under "rclif_parquet" in config.json, and then by all of their other columns
+MERGE_SORT_KEYS = ["patient_id", "hospitalization_id"]
+
+def shard_name(index: int, count: int) -> str:
+    return f"shard-{index}-of-{count}"
+
+def shard_clif_dirs(shard_count: int) -> list[Path]:
+    '''
+    Directories the CLIF tables of each shard are saved to, e.g. output/shards/shard-0-of-4/rclif-2.1.
+    '''
+    clif_dir_name = Path(clif_table_pathfinder("patient")).parent.name
+    return [SHARDS_DIR / shard_name(index, shard_count) / clif_dir_name for index in range(shard_count)]
+
+def merge_shards(shard_count: int, tables: list[str] = None) -> dict:
+    '''
+    Concatenate the shards of each CLIF table into the final table, sorted so that the result is the same
+    however the rows were split. `tables` defaults to every table built by the first shard.
+    Returns the number of rows of each merged table.
+    '''
+    shard_dirs = shard_clif_dirs(shard_count)
+    if tables is None:
+        tables = sorted(path.stem.removeprefix("clif_") for path in shard_dirs[0].glob("clif_*.parquet"))
+    if not tables:
+        raise FileNotFoundError(f"found no tables to merge under {shard_dirs[0]}")
+    rows = {}
+    for table in tables:
+        paths = [shard_dir / f"clif_{table}.parquet" for shard_dir in shard_dirs]
+        missing = [str(path) for path in paths if not path.exists()]
+        if missing:
+            raise FileNotFoundError(f"cannot merge {table} since some of its shards are missing: {missing}")
+        # union_by_name since a column that is null throughout a shard may have been saved with another type
+        relation = con.read_parquet([str(path) for path in paths], union_by_name=True)
+        sort_keys = RCLIF_ORDER_BY.get(table) or [col for col in MERGE_SORT_KEYS if col in relation.columns]
+        order_by = sort_keys + [col for col in relation.columns if col not in sort_keys]
+        save_to_rclif(relation, table, order_by=order_by)
+        rows[table] = con.execute(f"SELECT COUNT(*) FROM '{clif_table_pathfinder(table)}'").fetchone()[0]
+        logger.info(f"merged {shard_count} shards of {table} into {rows[table]} rows")
+    return rows
+
+def launch_shards(shard_count: int, max_parallel: int = None) -> dict:
+    '''
+    Build the shards as `python main.py` processes on this machine, at most `max_parallel` (default: all)
+    at a time. Returns the exit code of each shard.
+    '''
+    max_parallel = max_parallel or shard_count
+    if config["create_mimic_parquet_from_csv"] == 1:
+        # converted once here rather than concurrently by every shard
+        create_dir_if_not_exists(MIMIC_PARQUET_DIR)
+        overwrite = config["overwrite_existing_mimic_parquet"] == 1
+        resave_select_mimic_tables_from_csv_to_parquet(tables=MIMIC_TABLES_NEEDED_FOR_CLIF, overwrite=overwrite)
+    pending, running, exit_codes = list(range(shard_count)), {}, {}
+    while pending or running:
+        while pending and len(running) < max_parallel:
+            index = pending.pop(0)
+            env = {**os.environ, "CLIF_MIMIC_SHARD": f"{index}/{shard_count}"}
+            logger.info(f"starting {shard_name(index, shard_count)}")
+            running[index] = subprocess.Popen(
+                [sys.executable, str(REPO_ROOT / "main.py")], cwd=REPO_ROOT, env=env,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                )
+        for index, process in list(running.items()):
+            if process.poll() is not None:
+                exit_codes[index] = process.returncode
+                del running[index]
+                log_dir = SHARDS_DIR / shard_name(index, shard_count) / "logs"
+                logger.info(f"{shard_name(index, shard_count)} exited with code {process.returncode}; see {log_dir}")
+        time.sleep(1)
+    return exit_codes
+
+def _main():
+    parser = argparse.ArgumentParser(description="Build the CLIF tables in hash shards and merge them.")
+    parser.add_argument("command", choices=["launch", "merge"])
+    parser.add_argument("--shards", type=int, required=True, help="number of shards, K")
+    parser.add_argument("--tables", nargs="+", help="tables to merge (default: every table of the shards)")
+    parser.add_argument("--max-parallel", type=int, help="shards to run at a time with launch (default: all)")
+    parser.add_argument("--no-merge", action="store_true", help="launch the shards without merging them")
+    args = parser.parse_args()
+    if args.shards < 2:
+        parser.error("--shards must be at least 2")
+    if args.command == "launch":
+        exit_codes = launch_shards(args.shards, args.max_parallel)
+        failed = [shard_name(index, args.shards) for index, code in sorted(exit_codes.items()) if code != 0]
+        if failed:
+            logger.error(f"not merging since these shards failed: {failed}")
+            sys.exit(1)
+        if args.no_merge:
+            return
+    merge_shards(args.shards, args.tables)
+    logger.info(f"merged the shards into {Path(clif_table_pathfinder('patient')).parent}")
+
+if __name__ == "__main__":
+    setup_logging()
+    _main()
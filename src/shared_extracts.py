@@ -0,0 +1,103 @@
+# src/shared_extracts.py
+"""
+Run-level extraction of the MIMIC event tables that several CLIF tables read from.
+
+`vitals`, `respiratory_support`, `patient_assessments`, `crrt_therapy`, `ecmo_mcs`, `position`,
+`code_status` and `labs` all pull their items out of `chartevents`, the largest MIMIC table.
+Instead of each of them scanning it in full, this stage scans it once for the union of their
+items and writes a compact subset, sorted by itemid so that each table only reads the row groups
+it needs. `fetch_mimic_events` and the other readers pick the subset up through
+`mimic_events_source()` whenever it is up to date and covers their items, and fall back to the
+full table otherwise.
+
+Enabled with `"extract_chartevents_once": 1` in config.json.
+"""
+import os
+import json
+import time
+import importlib
+from pathlib import Path
+from src.logging_config import get_logger
+from src.utils import con, config, mimic_table_pathfinder, shared_extract_pathfinder, \
+    source_file_signature, mimic_events_source, mimic_table_source, cohort_settings, SHARED_EXTRACT_VERSION
+
+logger = get_logger('shared_extracts')
+
+EXTRACT_CHARTEVENTS_ONCE = config.get("extract_chartevents_once", 1) == 1
+
+# the CLIF tables that read from chartevents, each of which lists the chartevents items it reads in a
+# `_chartevents_item_ids()` function of its module, so that the extract covers them all
+CHARTEVENTS_CONSUMERS = [
+    "vitals",
+    "respiratory_support",
+    "patient_assessments",
+    "crrt_therapy",
+    "ecmo_mcs",
+    "position",
+    "code_status",
+    "labs",
+]
+
+def chartevents_item_ids(clif_tables: list[str]) -> list[int]:
+    '''
+    Collect the union of the chartevents items read by the given CLIF tables.
+    '''
+    item_ids = set()
+    for table in clif_tables:
+        if table not in CHARTEVENTS_CONSUMERS:
+            continue
+        module = importlib.import_module(f"src.tables.{table}")
+        item_ids.update(int(item_id) for item_id in module._chartevents_item_ids())
+    return sorted(item_ids)
+
+def extract_events(table: str, item_ids: list[int]) -> dict:
+    '''
+    Scan an event table once and save the events of the given items, sorted by itemid,
+    together with a manifest recording the items covered and the source it was made from.
+    '''
+    extract_path = shared_extract_pathfinder(table)
+    if mimic_events_source(table, item_ids) == extract_path:
+        logger.info(f"the existing shared {table} extract is up to date and covers all {len(item_ids)} items")
+        with open(shared_extract_pathfinder(table, suffix="json"), "r") as file:
+            return json.load(file)
+
+    table_path = mimic_table_pathfinder(table)
+    Path(extract_path).parent.mkdir(parents=True, exist_ok=True)
+    logger.info(f"extracting the events of {len(item_ids)} items from {table} in a single scan...")
+    start = time.perf_counter()
+    # write to a temporary file first so a failed run never leaves a partial extract behind
+    tmp_path = f"{extract_path}.tmp"
+    # the position of each event in the source table comes along as `source_order`, the last sort key, so that the
+    # extract is fully ordered and the tables that break ties by it do so as when they read the source table
+    con.execute(f"""
+    COPY (
+        FROM {mimic_table_source(table, table_path, shard_keys=['hadm_id', 'subject_id'], source_order=True)}
+        WHERE itemid IN ({','.join(map(str, item_ids))})
+        ORDER BY itemid, hadm_id, charttime, source_order
+    ) TO '{tmp_path}' (FORMAT PARQUET, COMPRESSION ZSTD)
+    """)
+    os.replace(tmp_path, extract_path)
+    manifest = {
+        "version": SHARED_EXTRACT_VERSION,
+        "item_ids": item_ids,
+        "source": source_file_signature(table_path),
+        "cohort": cohort_settings(),
+        "rows": con.execute(f"SELECT COUNT(*) FROM '{extract_path}'").fetchone()[0],
+        "seconds": round(time.perf_counter() - start, 1),
+    }
+    with open(shared_extract_pathfinder(table, suffix="json"), "w") as file:
+        json.dump(manifest, file, indent=2)
+    logger.info(f"saved {manifest['rows']} {table} events to {extract_path} in {manifest['seconds']}s")
+    return manifest
+
+def _main(clif_tables: list[str] = None):
+    if clif_tables is None:
+        clif_tables = [table for table, to_build in config["clif_tables"].items() if to_build == 1]
+    item_ids = chartevents_item_ids(clif_tables)
+    logger.info(f"collected {len(item_ids)} chartevents items read by {[t for t in clif_tables if t in CHARTEVENTS_CONSUMERS]}")
+    extract_events("chartevents", item_ids)
+
+if __name__ == "__main__":
+    from src.logging_config import setup_logging
+    setup_logging()
+    _main()
@@ -0,0 +1,930 @@
+# src/synthetic_mimic.py
+"""
+Synthetic MIMIC-IV at a configurable scale, to test and benchmark the pipeline without credentialed access.
+
+Writes every table in `MIMIC_TABLES_NEEDED_FOR_CLIF` as parquet under {output_dir}/hosp and {output_dir}/icu,
+the layout that `parquet_stored_in_submodules` expects, with the column names and types of `MIMIC_CSV_SCHEMAS`.
+The events use the itemids, labels, units, categorical values and decisions of the mapping csvs in
+data/mappings, so that each table module runs through its real code paths:
+
+- every chartevents item read by the CLIF tables (`chartevents_item_ids`) is charted at least once with each
+  of its categorical values, and otherwise sampled on hourly rounds of each ICU stay;
+- labs are drawn every 6 hours of each admission, a few with a comment instead of a value;
+- medications are ordered every 4 hours of each ICU stay in the order contexts (i.e. routes) of the
+  med_route_category mappings: intermittent ones as single administrations, continuous ones as runs of
+  rate changes.
+
+Base tables (patients, admissions, transfers, icustays, diagnoses and procedures) are drawn with numpy from
+`seed`; the events are generated in duckdb from a hash of the seed and their keys, so that a dataset
+of any size streams to parquet without being held in memory, and the same arguments always give the same data.
+
+Usage:
+    python -m src.synthetic_mimic --output-dir data/synthetic_mimic --patients 1000 --admissions 1500
+
+then set "mimic_parquet_dir" in config.json to the output directory.
+"""
+import re
+import math
+import argparse
+from pathlib import Path
+import duckdb
+import numpy as np
+import pandas as pd
+from src.logging_config import get_logger, setup_logging
+from src.utils import configure_duckdb, load_mapping_csv, MIMIC_TABLES_NEEDED_FOR_CLIF, HOSP_TABLES
+from src.mimic_schemas import MIMIC_CSV_SCHEMAS
+from src.shared_extracts import CHARTEVENTS_CONSUMERS, chartevents_item_ids
+from src.tables.hospitalization import ADMISSION_TYPE_MAPPER
+from src.tables.patient import LANGUAGE_MAPPER
+
+logger = get_logger('synthetic_mimic')
+
+SUBJECT_ID_START = 10_000_000
+HADM_ID_START = 20_000_000
+STAY_ID_START = 30_000_000
+
+ANCHOR_YEAR_GROUPS = ["2008 - 2010", "2011 - 2013", "2014 - 2016", "2017 - 2019", "2020 - 2022"]
+ADMISSION_LOCATIONS = [
+    "EMERGENCY ROOM", "PHYSICIAN REFERRAL", "TRANSFER FROM HOSPITAL", "WALK-IN/SELF REFERRAL",
+    "CLINIC REFERRAL", "PROCEDURE SITE",
+]
+INSURANCES = ["Medicare", "Medicaid", "Private", "Other", "No charge"]
+MARITAL_STATUSES = ["MARRIED", "SINGLE", "WIDOWED", "DIVORCED", None]
+
+DIAGNOSIS_CODES = [
+    ("A419", 10), ("J9601", 10), ("N179", 10), ("I4891", 10), ("E1122", 10), ("J189", 10), ("R6521", 10),
+    ("I10", 10), ("0389", 9), ("51881", 9), ("5849", 9), ("4280", 9), ("25000", 9), ("4019", 9),
+]
+PROCEDURE_CODES = [
+    ("5A1955Z", 10), ("0BH17EZ", 10), ("02HV33Z", 10), ("5A1945Z", 10), ("3E0436Z", 10),
+    ("9604", 9), ("9672", 9), ("3893", 9),
+]
+HCPCS_CODES = [
+    ("99223", "Hospital inpatient services"), ("36556", "Insert non-tunnel cv cath"),
+    ("31500", "Insert emergency airway"), ("3074F", "Syst bp lt 130 mm hg"), ("0042T", "Ct perfusion w/contrast cbf"),
+    ("G0378", "Hospital observation per hr"), ("J1100", "Dexamethasone sodium phos"),
+]
+LAB_COMMENTS = [
+    "VERIFIED BY REPLICATE ANALYSIS. 7.2",
+    "NOT DONE",
+    "UNABLE TO REPORT DUE TO HEMOLYSIS",
+    "PTT UNABLE TO DETERMINE, GREATER THAN 150 SECONDS",
+]
+
+# categorical items whose vocabulary is not (fully) listed in the mapping csvs: {itemid: (label, category, [(value, valuenum)])}
+FIXED_CHART_ITEMS = {
+    220739: ("GCS - Eye Opening", "Neurological", [
+        ("Spontaneously", 4), ("To Speech", 3), ("To Pain", 2), ("None", 1)]),
+    223900: ("GCS - Verbal Response", "Neurological", [
+        ("Oriented", 5), ("Confused", 4), ("Inappropriate Words", 3), ("Incomprehensible sounds", 2),
+        ("No Response", 1), ("No Response-ETT", 1)]),
+    223901: ("GCS - Motor Response", "Neurological", [
+        ("Obeys Commands", 6), ("Localizes Pain", 5), ("Flex-withdraws", 4), ("Abnormal Flexion", 3),
+        ("Abnormal extension", 2), ("No response", 1)]),
+    228096: ("Richmond-RAS Scale", "Pain/Sedation", [
+        ("+4 Combative", 4), ("+3 Very agitated", 3), ("+2 Agitated", 2), ("+1 Anxious, restless but not aggressive", 1),
+        (" 0  Alert and calm", 0), ("-1 Awakens to voice (eye opening/contact) > 10 sec", -1),
+        ("-2 Light sedation, briefly awakens to voice (eye opening/contact) < 10 sec", -2),
+        ("-3 Moderate sedation, moves and opens eyes to voice, no eye contact", -3),
+        ("-4 Deep sedation, no response to voice, but movement or eye opening to physical stimulation", -4),
+        ("-5 Unarousable, no response to voice or physical stimulation", -5)]),
+    224054: ("Braden Sensory Perception", "Skin - Assessment", [
+        ("Completely Limited", 1), ("Very Limited", 2), ("Slight Impairment", 3), ("No Impairment", 4)]),
+    224055: ("Braden Moisture", "Skin - Assessment", [
+        ("Consistently Moist", 1), ("Moist", 2), ("Occasionally Moist", 3), ("Rarely Moist", 4)]),
+    224056: ("Braden Activity", "Skin - Assessment", [
+        ("Bedfast", 1), ("Chairfast", 2), ("Walks Occasionally", 3), ("Walks Frequently", 4)]),
+    224057: ("Braden Mobility", "Skin - Assessment", [
+        ("Completely Immobile", 1), ("Very Limited", 2), ("Slight Limitations", 3), ("No Limitations", 4)]),
+    224058: ("Braden Nutrition", "Skin - Assessment", [
+        ("Very Poor", 1), ("Probably Inadequate", 2), ("Adequate", 3), ("Excellent", 4)]),
+    224059: ("Braden Friction/Shear", "Skin - Assessment", [
+        ("Problem", 1), ("Potential Problem", 2), ("No Apparent Problem", 3)]),
+    228300: ("CAM-ICU MS change", "Neurological", [("Yes", None), ("No", None)]),
+    228337: ("CAM-ICU MS Change", "Neurological", [("Yes", None), ("No", None)]),
+    229326: ("CAM-ICU MS Change", "Neurological", [("Yes", None), ("No", None)]),
+    228301: ("CAM-ICU Inattention", "Neurological", [("Yes", None), ("No", None)]),
+    228336: ("CAM-ICU Inattention", "Neurological", [("Yes", None), ("No", None)]),
+    229325: ("CAM-ICU Inattention", "Neurological", [("Yes", None), ("No", None)]),
+    228302: ("CAM-ICU RASS LOC", "Neurological", [("Yes", None), ("No", None)]),
+    228334: ("CAM-ICU Altered LOC", "Neurological", [("Yes", None), ("No", None)]),
+    228303: ("CAM-ICU Disorganized thinking", "Neurological", [("Yes", None), ("No", None)]),
+    228335: ("CAM-ICU Disorganized thinking", "Neurological", [("Yes", None), ("No", None)]),
+    229324: ("CAM-ICU Disorganized thinking", "Neurological", [("Yes", None), ("No", None)]),
+    224717: ("SBT Successfully Completed", "Respiratory", [("Yes", None), ("No", None)]),
+    224833: ("SBT Deferred", "Respiratory", [
+        ("Hemodynamically unstable", None), ("Agitation", None), ("FiO2 > 50%", None), ("PEEP > 8", None)]),
+    224716: ("SBT Stopped", "Respiratory", [
+        ("Agitation", None), ("Tachypnea", None), ("Desaturation", None), ("Tachycardia", None)]),
+    223758: ("Code Status", "Adm History/FHPA", [
+        ("Full code", None), ("DNR / DNI", None), ("DNI (do not intubate)", None),
+        ("DNR (do not resuscitate)", None), ("Comfort measures only", None)]),
+    224093: ("Position", "Treatments", [
+        ("Left Side", None), ("Right Side", None), ("Supine", None), ("Prone", None), ("Semi-Fowler", None),
+        ("Sitting", None)]),
+    228156: ("Impella Power Level", "Impella", [(f"P{level}", None) for level in range(10)]),
+    229675: ("Impella Power Level", "Impella", [(f"P{level}", None) for level in range(10)]),
+}
+
+# plausible ranges of the vitals, whose mapping does not list value instances
+VITAL_RANGES = {
+    "sbp": (90, 160), "dbp": (45, 95), "map": (60, 110), "heart_rate": (55, 120), "respiratory_rate": (10, 30),
+    "spo2": (88, 100), "height_cm": (150, 195), "weight_kg": (50, 120),
+}
+NUMERIC_RANGES = {
+    223761: (96.8, 101.5), 223762: (36.0, 38.6), 226531: (110, 265), 223835: (21, 100), 220339: (5, 15),
+}
+
+PROCEDURE_ITEM_RATE = 0.05
+OUTPUTS_PER_EVENTS = 0.015
+DATETIMES_PER_EVENTS = 0.002
+INGREDIENT_FRACTION = 0.3
+LONG_INTERMITTENT_ITEM_IDS = [222168, 225158, 220949, 221668, 225942]
+FREE_WATER_ITEM_ID = 220490
+
+_NUMBER = r"-?\d+(?:\.\d+)?(?:e[-+]?\d+)?"
+_STATS_PATTERN = re.compile(rf"(?i)\b(min|max|mean|median)\s*:\s*({_NUMBER}|nan)")
+
+# -----------------------------
+#   mapping vocabularies
+# -----------------------------
+
+def _stats_range(value_instances) -> tuple[float, float] | None:
+    '''
+    Range of plausible values from the summary statistics of a mapping, e.g. "Max: 9, Min: 0, Mean: 3".
+    '''
+    stats = {
+        name.lower(): float(number) for name, number in _STATS_PATTERN.findall(str(value_instances))
+        if number.lower() != "nan"
+    }
+    center = stats.get("median", stats.get("mean"))
+    if center is None:
+        return None
+    lo, hi = center * 0.7, center * 1.3
+    if "min" in stats:
+        lo = max(lo, stats["min"])
+    if "max" in stats:
+        hi = min(hi, stats["max"])
+    return (min(lo, hi), max(lo, hi))
+
+def _categorical_values(value_instances) -> list[str]:
+    '''
+    Categorical values listed in a mapping, e.g. "{'Oral': 12, 'Blood': 3}" or "['Doppler', 'Weak Palpable']".
+    '''
+    text = str(value_instances).strip().strip('"')
+    if text.startswith("{"):
+        return re.findall(r"'([^']*)'\s*:", text)
+    if text.startswith("["):
+        return re.findall(r"'([^']*)'", text)
+    return []
+
+def _first_unit(uom_instances) -> str | None:
+    '''
+    The most frequent unit listed in a mapping, e.g. "mg: 459800, mcg: 12" or "{'g/dL': 21}".
+    '''
+    if pd.isna(uom_instances):
+        return None
+    text = str(uom_instances).strip().strip("{}")
+    unit = re.split(r"\s*:\s*", re.split(r"[;,]", text)[0])[0].strip().strip("'\"")
+    return unit or None
+
+def _decimals(lo: float, hi: float) -> int:
+    center = (lo + hi) / 2
+    return 0 if abs(center) >= 20 else (1 if abs(center) >= 1 else 2)
+
+def _mapping_items() -> pd.DataFrame:
+    '''
+    One row per item of the mapping csvs read by the CLIF tables that chart from d_items, with its label,
+    linksto, category, unit, parameter type and listed values, in order of precedence.
+    '''
+    columns = ["itemid", "label", "linksto", "category", "unitname", "param_type", "value_instances", "vital_category"]
+    resp = load_mapping_csv("respiratory_support")
+    vitals = load_mapping_csv("vitals").rename(columns={"label = vital_name": "label"})
+    dialysis = load_mapping_csv("dialysis")
+    ecmo = load_mapping_csv("ecmo_mcs")
+    labs = load_mapping_csv("labs")
+    labs = labs.assign(linksto="chartevents", unitname=labs["uom_instances"].map(_first_unit), param_type="Numeric")
+    frames = [resp, vitals, dialysis, ecmo, labs]
+    items = pd.concat([frame.reindex(columns=columns) for frame in frames], ignore_index=True)
+    items["itemid"] = pd.to_numeric(items["itemid"], errors="coerce")
+    items = items.dropna(subset=["itemid"]).astype({"itemid": int}).drop_duplicates("itemid")
+    items["linksto"] = items["linksto"].fillna("chartevents")
+    return items
+
+def _device_values() -> dict[int, list[str]]:
+    '''
+    Values of the respiratory and mechanical circulatory support devices and modes.
+    '''
+    values = {}
+    for name, value_col in [("device_category", "device_name"), ("mode_category", "mode_name")]:
+        mapping = load_mapping_csv(name).dropna(subset=["itemid", value_col])
+        mapping["itemid"] = pd.to_numeric(mapping["itemid"], errors="coerce")
+        for item_id, group in mapping.dropna(subset=["itemid"]).groupby("itemid"):
+            values.setdefault(int(item_id), []).extend(group[value_col].astype(str).unique())
+    # the device of an extubated patient is charted as 'None'
+    values.setdefault(226732, []).append("None")
+    ecmo_devices = load_mapping_csv("ecmo_mcs_device").dropna(subset=["itemid", "value"])
+    for item_id, group in ecmo_devices.groupby("itemid"):
+        values[int(item_id)] = group["value"].astype(str).unique().tolist()
+    return values
+
+def item_catalog() -> tuple[pd.DataFrame, pd.DataFrame]:
+    '''
+    The items charted in chartevents, procedureevents and datetimeevents, and the categorical values of each.
+
+    Returns the items (itemid, label, linksto, category, unitname, param_type, lo, hi, decimals, n_values)
+    and their values (itemid, value_idx, value, valuenum).
+    '''
+    mapping_items = _mapping_items().set_index("itemid")
+    device_values = _device_values()
+    chart_ids = chartevents_item_ids(CHARTEVENTS_CONSUMERS)
+    # items read from other event tables, e.g. tracheostomy from procedureevents
+    other_ids = mapping_items.index[mapping_items["linksto"].isin(["procedureevents", "datetimeevents"])]
+    resp_ids = pd.to_numeric(load_mapping_csv("respiratory_support")["itemid"], errors="coerce").dropna().astype(int)
+    ecmo_ids = pd.to_numeric(load_mapping_csv("ecmo_mcs")["itemid"], errors="coerce").dropna().astype(int)
+    other_ids = [item_id for item_id in other_ids if item_id in set(resp_ids) | set(ecmo_ids)]
+
+    items, values = [], []
+    for item_id in sorted(set(chart_ids) | set(other_ids)):
+        row = mapping_items.loc[item_id] if item_id in mapping_items.index else pd.Series(dtype=object)
+        label, category = row.get("label"), row.get("category")
+        item_values = []
+        if item_id in FIXED_CHART_ITEMS:
+            label, category, item_values = FIXED_CHART_ITEMS[item_id]
+        elif item_id in device_values:
+            item_values = [(value, None) for value in device_values[item_id]]
+        elif row.get("linksto") == "chartevents" or pd.isna(row.get("linksto")):
+            item_values = [
+                (value, None) for value in _categorical_values(row.get("value_instances")) if value != "None"
+            ]
+        lo, hi = NUMERIC_RANGES.get(
+            item_id,
+            VITAL_RANGES.get(row.get("vital_category")) or _stats_range(row.get("value_instances")) or (0, 10),
+        )
+        linksto = row.get("linksto") if isinstance(row.get("linksto"), str) else "chartevents"
+        items.append({
+            "itemid": item_id,
+            "label": label if isinstance(label, str) else f"Item {item_id}",
+            "linksto": linksto,
+            "category": category if isinstance(category, str) else None,
+            "unitname": row.get("unitname") if isinstance(row.get("unitname"), str) else None,
+            "param_type": "Text" if item_values else (row.get("param_type") if isinstance(row.get("param_type"), str) else "Numeric"),
+            "lo": float(lo),
+            "hi": float(hi),
+            "decimals": _decimals(lo, hi),
+            "n_values": len(item_values),
+        })
+        values.extend(
+            {"itemid": item_id, "value_idx": idx, "value": value, "valuenum": num}
+            for idx, (value, num) in enumerate(item_values)
+        )
+    items = pd.DataFrame(items)
+    items.loc[items["linksto"] == "procedureevents", ["lo", "hi", "decimals", "n_values"]] = [1.0, 1.0, 0, 0]
+    values = pd.DataFrame(values, columns=["itemid", "value_idx", "value", "valuenum"]).astype({"valuenum": float})
+    return items, values
+
+def lab_catalog() -> pd.DataFrame:
+    '''
+    The labevents items of the labs mapping (5-digit itemids), with their d_labitems columns and range.
+    '''
+    labs = load_mapping_csv("labs")
+    labs["itemid"] = pd.to_numeric(labs["itemid"], errors="coerce")
+    labs = labs.dropna(subset=["itemid"]).astype({"itemid": int}).drop_duplicates("itemid")
+    labs = labs[labs["itemid"].astype(str).str.len() == 5]
+    ranges = labs["value_instances"].map(lambda instances: _stats_range(instances) or (0, 10))
+    return pd.DataFrame({
+        "itemid": labs["itemid"].values,
+        "label": labs["label"].values,
+        "fluid": labs["fluid"].fillna("Blood").values,
+        "category": labs["category"].fillna("Chemistry").values,
+        "unitname": labs["uom_instances"].map(_first_unit).values,
+        "lo": [lo for lo, _ in ranges],
+        "hi": [hi for _, hi in ranges],
+        "decimals": [_decimals(lo, hi) for lo, hi in ranges],
+    })
+
+def output_catalog() -> pd.DataFrame:
+    '''
+    The outputevents items of the output and input mappings.
+    '''
+    frames = []
+    for name in ["output", "input"]:
+        mapping = load_mapping_csv(name)
+        frames.append(mapping[["itemid", "label", "value_instances"]].assign(category=name.title() + "s"))
+    items = pd.concat(frames, ignore_index=True)
+    items["itemid"] = pd.to_numeric(items["itemid"], errors="coerce")
+    items = items.dropna(subset=["itemid"]).astype({"itemid": int}).drop_duplicates("itemid")
+    ranges = items["value_instances"].map(lambda instances: _stats_range(instances) or (50, 500))
+    return items.assign(
+        linksto="outputevents", unitname="mL", param_type="Numeric",
+        lo=[max(lo, 1.0) for lo, _ in ranges], hi=[max(hi, 2.0) for _, hi in ranges],
+    ).drop(columns="value_instances")
+
+def _amount_and_rate(value_instances) -> tuple[tuple[float, float] | None, tuple[float, float] | None]:
+    '''
+    Ranges of the amount and rate of a medication from e.g. "Rate: 0.01, 0.1, 1.5; Amount: 1, 4, 20" (min, mean, max).
+    '''
+    ranges = {}
+    for part in str(value_instances).split(";"):
+        name, _, numbers = part.partition(":")
+        numbers = [float(number) for number in re.findall(_NUMBER, numbers)]
+        if len(numbers) == 3 and numbers[1] > 0:
+            ranges[name.strip().lower()] = (max(numbers[0], numbers[1] * 0.5), min(numbers[2], numbers[1] * 1.5))
+    return ranges.get("amount"), ranges.get("rate")
+
+def med_catalog() -> tuple[pd.DataFrame, pd.DataFrame]:
+    '''
+    The inputevents items of the medication mapping and the order contexts each can be given in.
+
+    A context is a combination of the order columns (and d_items category) that medication_admin joins to the
+    route mappings: items mapped in med_route_category_special take their own contexts; the other items
+    take the general ones of their category, continuous drips for CONTINUOUS, boluses and pushes for
+    INTERMITTENT, and both for BOTH.
+    '''
+    meds = load_mapping_csv("med_category")
+    meds = meds[meds["decision"].isin(["CONTINUOUS", "INTERMITTENT", "BOTH"]) & (meds["linksto"] == "inputevents")]
+    meds = meds.drop_duplicates("itemid").astype({"itemid": int}).reset_index(drop=True)
+
+    context_cols = [
+        "ordercategoryname", "secondaryordercategoryname", "ordercomponenttypedescription",
+        "ordercategorydescription", "category",
+    ]
+    general = load_mapping_csv("med_route_category")
+    general = general[~general["clif_med_route_category"].isin(["SPECIAL", "UNINFORMATIVE"])]
+    general = general.rename(columns=lambda col: col.removeprefix("mimic_")).dropna(subset=["ordercategoryname"])
+    special = load_mapping_csv("med_route_category_special")
+    special = special.rename(columns=lambda col: col.removeprefix("mimic_")).dropna(subset=["med_id"])
+    special["med_id"] = pd.to_numeric(special["med_id"], errors="coerce")
+
+    def is_bolus(contexts: pd.DataFrame) -> pd.Series:
+        return (contexts["ordercategoryname"] == "05-Med Bolus") \
+            | contexts["ordercategorydescription"].isin(["Drug Push", "Bolus"])
+
+    def is_drip(contexts: pd.DataFrame) -> pd.Series:
+        return contexts["ordercategorydescription"].isin(["Continuous Med", "Continuous IV"]) \
+            & contexts["clif_med_route_category"].isin(["iv", "im"])
+
+    def is_intermittent(contexts: pd.DataFrame) -> pd.Series:
+        return is_bolus(contexts) | contexts["ordercategorydescription"].isin(["Non Iv Meds"])
+
+    items, contexts = [], []
+    for _, med in meds.iterrows():
+        amount_range, rate_range = _amount_and_rate(med["value_instances"])
+        item_contexts = special[special["med_id"] == med["itemid"]]
+        if item_contexts.empty:
+            candidates = general[general["category"] == med["category"]]
+            if candidates.empty:
+                candidates = general[general["category"] == "Medications"]
+            keep = {
+                "CONTINUOUS": is_drip(candidates),
+                "INTERMITTENT": is_intermittent(candidates),
+                "BOTH": is_drip(candidates) | is_intermittent(candidates),
+            }[med["decision"]]
+            item_contexts = candidates[keep]
+        elif med["decision"] == "CONTINUOUS":
+            item_contexts = item_contexts[~is_bolus(item_contexts)]
+        if item_contexts.empty:
+            continue
+        # d_items holds a single category per item, which the route join matches on
+        categories = item_contexts["category"].tolist()
+        category = med["category"] if med["category"] in categories else categories[0]
+        item_contexts = item_contexts[item_contexts["category"] == category]
+        item_contexts = item_contexts[context_cols].drop_duplicates().reset_index(drop=True)
+        contexts.append(item_contexts.assign(
+            itemid=med["itemid"], context_idx=item_contexts.index, is_bolus=is_bolus(item_contexts).values,
+        ))
+        amount_unit = _first_unit(med["amountuom_instances"]) or "dose"
+        rate_unit = _first_unit(med["rateuom_instances"]) or f"{amount_unit}/hour"
+        items.append({
+            "itemid": med["itemid"],
+            "label": med["label"],
+            "category": category,
+            "decision": med["decision"],
+            "amountuom": amount_unit,
+            "rateuom": rate_unit,
+            "amount_lo": (amount_range or (1, 10))[0],
+            "amount_hi": (amount_range or (1, 10))[1],
+            "rate_lo": (rate_range or (0.5, 5))[0],
+            "rate_hi": (rate_range or (0.5, 5))[1],
+            "n_contexts": len(item_contexts),
+            "long_intermittent": med["itemid"] in LONG_INTERMITTENT_ITEM_IDS,
+        })
+    items = pd.DataFrame(items)
+    items["item_idx"] = range(len(items))
+    return items, pd.concat(contexts, ignore_index=True)
+
+# -----------------------------
+#   base tables
+# -----------------------------
+
+def _minutes(values) -> pd.TimedeltaIndex:
+    return pd.to_timedelta(np.asarray(values, dtype="int64"), unit="min")
+
+def base_tables(n_patients: int, n_admissions: int, icu_fraction: float, seed: int) -> dict[str, pd.DataFrame]:
+    '''
+    Patients, admissions, transfers, ICU stays, diagnoses and procedures. Admission j belongs to patient
+    j % n_patients, so that every patient has at least one admission and the first admissions are spread
+    evenly across patients; the first admission is always an ICU one.
+    '''
+    rng = np.random.default_rng(seed)
+    n, m = n_patients, n_admissions
+
+    patients = pd.DataFrame({
+        "subject_id": SUBJECT_ID_START + np.arange(n),
+        "gender": rng.choice(["F", "M"], n),
+        "anchor_age": rng.integers(18, 92, n),
+        "anchor_year": rng.integers(2110, 2180, n),
+        "anchor_year_group": rng.choice(ANCHOR_YEAR_GROUPS, n),
+    })
+
+    patient_idx = np.arange(m) % n
+    admission_seq = np.arange(m) // n
+    year_start = pd.to_datetime(pd.DataFrame({"year": patients["anchor_year"].values[patient_idx], "month": 1, "day": 1}))
+    admittime = year_start + _minutes((admission_seq * 365 + rng.integers(0, 300, m)) * 1440 + rng.integers(0, 1440, m))
+    los_minutes = (np.minimum(1.5 + rng.gamma(2.0, 2.0, m), 30) * 1440).astype(int)
+    dischtime = admittime + _minutes(los_minutes)
+
+    admission_types = [admission_type for admission_type in ADMISSION_TYPE_MAPPER if admission_type is not None]
+    admission_type = rng.choice(admission_types, m)
+    from_ed = pd.Series(admission_type).map(ADMISSION_TYPE_MAPPER).eq("ed").values
+    ed_minutes = rng.integers(60, 480, m)
+
+    discharge = load_mapping_csv("discharge").dropna(subset=["discharge_location", "disposition_category"])
+    discharge_locations = [location for location in discharge["discharge_location"].unique() if location != "DIED"]
+    discharge_location = pd.Series(rng.choice(discharge_locations, m), dtype=object)
+    discharge_location[rng.random(m) < 0.05] = None
+    is_last = admission_seq == (m - 1 - patient_idx) // n
+    died = is_last & (rng.random(m) < 0.08)
+    discharge_location[died] = "DIED"
+
+    races = load_mapping_csv("race_ethnicity").dropna(subset=["mimic_race", "race"])["mimic_race"].unique()
+    patient_race = rng.choice(races, n)
+    race = np.where(rng.random(m) < 0.1, rng.choice(races, m), patient_race[patient_idx])
+    languages = [language for language in LANGUAGE_MAPPER if language is not None]
+    language = pd.Series(rng.choice(languages, m, p=_english_weighted(languages)), dtype=object)
+    language[rng.random(m) < 0.05] = None
+
+    admissions = pd.DataFrame({
+        "subject_id": patients["subject_id"].values[patient_idx],
+        "hadm_id": HADM_ID_START + np.arange(m),
+        "admittime": admittime,
+        "dischtime": dischtime,
+        "deathtime": dischtime.where(died),
+        "admission_type": admission_type,
+        "admit_provider_id": [f"P{idx:05X}" for idx in rng.integers(0, 0xFFFFF, m)],
+        "admission_location": rng.choice(ADMISSION_LOCATIONS, m),
+        "discharge_location": discharge_location,
+        "insurance": rng.choice(INSURANCES, m),
+        "language": language,
+        "marital_status": pd.Series(rng.choice(np.array(MARITAL_STATUSES, dtype=object), m)),
+        "race": race,
+        "edregtime": (admittime - _minutes(ed_minutes)).where(from_ed),
+        "edouttime": admittime.where(from_ed),
+        "hospital_expire_flag": died.astype(int),
+    })
+
+    # date of death: in-hospital deaths, and a few more after the last discharge
+    last = admissions[is_last].set_index("subject_id")
+    later = last["deathtime"].isna() & (rng.random(len(last)) < 0.03)
+    after_discharge = last["dischtime"] + _minutes(rng.integers(1, 720, len(last)) * 1440)
+    dod = last["deathtime"].where(~later, after_discharge).dt.normalize()
+    patients["dod"] = patients["subject_id"].map(dod)
+
+    is_icu = rng.random(m) < icu_fraction
+    is_icu[0] = True
+    adt = load_mapping_csv("adt").dropna(subset=["careunit", "location_category"])
+    units = {category: group["careunit"].unique() for category, group in adt.groupby("location_category")}
+    icu_admissions = admissions[is_icu]
+    icu_los = los_minutes[is_icu]
+    intime = icu_admissions["admittime"] + _minutes(icu_los * 0.15)
+    outtime = icu_admissions["admittime"] + _minutes(icu_los * 0.75)
+    icu_unit = rng.choice(units["icu"], len(icu_admissions))
+    icustays = pd.DataFrame({
+        "subject_id": icu_admissions["subject_id"].values,
+        "hadm_id": icu_admissions["hadm_id"].values,
+        "stay_id": STAY_ID_START + np.flatnonzero(is_icu),
+        "first_careunit": icu_unit,
+        "last_careunit": icu_unit,
+        "intime": intime.values,
+        "outtime": outtime.values,
+        "los": ((outtime - intime).dt.total_seconds() / 86400).values,
+    })
+
+    transfers = _transfers(admissions, icustays, is_icu, from_ed, units, rng)
+    codes = _coded_tables(admissions, los_minutes, rng)
+    return {"patients": patients, "admissions": admissions, "icustays": icustays, "transfers": transfers, **codes}
+
+def _english_weighted(languages: list[str]) -> np.ndarray:
+    weights = np.where(np.array(languages) == "English", 20.0, 1.0)
+    return weights / weights.sum()
+
+def _transfers(admissions, icustays, is_icu, from_ed, units, rng) -> pd.DataFrame:
+    '''
+    ED -> ward -> ICU -> ward segments of each admission, closed by a discharge event without a careunit.
+    '''
+    segments = []
+    ward = rng.choice(units["ward"], len(admissions))
+    stays = icustays.set_index("hadm_id")
+    for idx, adm in enumerate(admissions.itertuples(index=False)):
+        if from_ed[idx]:
+            segments.append((adm.subject_id, adm.hadm_id, "ED", rng.choice(units["ed"]), adm.edregtime, adm.admittime))
+        if is_icu[idx]:
+            stay = stays.loc[adm.hadm_id]
+            segments.append((adm.subject_id, adm.hadm_id, "admit", ward[idx], adm.admittime, stay.intime))
+            segments.append((adm.subject_id, adm.hadm_id, "transfer", stay.first_careunit, stay.intime, stay.outtime))
+            segments.append((adm.subject_id, adm.hadm_id, "transfer", ward[idx], stay.outtime, adm.dischtime))
+        else:
+            segments.append((adm.subject_id, adm.hadm_id, "admit", ward[idx], adm.admittime, adm.dischtime))
+        segments.append((adm.subject_id, adm.hadm_id, "discharge", None, adm.dischtime, pd.NaT))
+    transfers = pd.DataFrame(segments, columns=["subject_id", "hadm_id", "eventtype", "careunit", "intime", "outtime"])
+    transfers.insert(2, "transfer_id", 40_000_000 + np.arange(len(transfers)))
+    return transfers
+
+def _coded_tables(admissions, los_minutes, rng) -> dict[str, pd.DataFrame]:
+    '''
+    Diagnoses, ICD procedures and HCPCS events, numbered by seq_num within each admission.
+    '''
+    def expand(counts: np.ndarray) -> pd.DataFrame:
+        rows = admissions.loc[np.repeat(admissions.index, counts), ["subject_id", "hadm_id", "admittime"]]
+        rows = rows.reset_index(drop=True)
+        rows["seq_num"] = rows.groupby("hadm_id").cumcount() + 1
+        rows["los_days"] = np.repeat(los_minutes // 1440, counts)
+        return rows
+
+    def chartdate(rows: pd.DataFrame) -> pd.Series:
+        offsets = (rng.random(len(rows)) * (rows["los_days"] + 1)).astype(int)
+        return (rows["admittime"] + pd.to_timedelta(offsets, unit="D")).dt.normalize()
+
+    m = len(admissions)
+    diagnoses = expand(rng.integers(1, 9, m))
+    diagnosis_codes = np.array(DIAGNOSIS_CODES, dtype=object)[rng.integers(0, len(DIAGNOSIS_CODES), len(diagnoses))]
+    procedures = expand(rng.integers(0, 4, m))
+    procedure_codes = np.array(PROCEDURE_CODES, dtype=object)[rng.integers(0, len(PROCEDURE_CODES), len(procedures))]
+    hcpcs = expand(rng.integers(0, 3, m))
+    hcpcs_codes = np.array(HCPCS_CODES, dtype=object)[rng.integers(0, len(HCPCS_CODES), len(hcpcs))]
+    return {
+        "diagnoses_icd": diagnoses.assign(icd_code=diagnosis_codes[:, 0], icd_version=diagnosis_codes[:, 1].astype(int)),
+        "procedures_icd": procedures.assign(
+            chartdate=chartdate(procedures), icd_code=procedure_codes[:, 0], icd_version=procedure_codes[:, 1].astype(int)),
+        "hcpcsevents": hcpcs.assign(
+            chartdate=chartdate(hcpcs), hcpcs_cd=hcpcs_codes[:, 0], short_description=hcpcs_codes[:, 1]),
+    }
+
+# -----------------------------
+#   events
+# -----------------------------
+
+def _sampled_events_sql(schedule: str, round_minutes: int, per_day: float, n_items: int, stream: int) -> str:
+    '''
+    Events sampled on rounds every `round_minutes` of each (subject_id, hadm_id, stay_id, starttime, endtime)
+    of `schedule`, `per_day` events per day on average. Each round is split into slots of disjoint ranges of
+    items, so that an item is charted at most once per round, and each slot is kept with the probability that
+    gives the average. Returns the charttime, the index of the item and three uniform draws per event.
+    '''
+    per_round = per_day * round_minutes / 1440
+    slots = max(1, min(math.ceil(per_round), n_items))
+    keep = min(1.0, per_round / slots)
+    return f"""
+    WITH rounds AS (
+        FROM {schedule}
+        SELECT subject_id, hadm_id, stay_id, starttime
+            , r: unnest(range(CAST(ceil(epoch(endtime - starttime) / {round_minutes * 60}) AS BIGINT)))
+    ), slots AS (
+        FROM rounds
+        SELECT *, k: unnest(range({slots}))
+    )
+    FROM slots
+    SELECT subject_id, hadm_id, stay_id
+        , charttime: starttime + to_minutes(r * {round_minutes})
+        , item_idx: CAST((k * {n_items}) // {slots} + floor(_u(hadm_id, r, k, {stream})
+            * (((k + 1) * {n_items}) // {slots} - (k * {n_items}) // {slots})) AS INTEGER)
+        , u1: _u(hadm_id, r, k, {stream + 1})
+        , u2: _u(hadm_id, r, k, {stream + 2})
+        , u3: _u(hadm_id, r, k, {stream + 3})
+    WHERE _u(hadm_id, r, k, {stream + 4}) < {keep}
+    """
+
+def _number_sql(u: str) -> str:
+    return f"round(i.lo + {u} * (i.hi - i.lo), CAST(i.decimals AS INTEGER))"
+
+def _number_text_sql(u: str) -> str:
+    return f"""CASE WHEN i.decimals = 0 THEN CAST(CAST({_number_sql(u)} AS BIGINT) AS VARCHAR)
+        ELSE CAST({_number_sql(u)} AS VARCHAR) END"""
+
+def _coverage(items: pd.DataFrame, stays: pd.DataFrame) -> pd.DataFrame:
+    '''
+    One event per item and categorical value, spread over the stays at minutes past the hour, so that
+    every item and value appears at least once without colliding with the hourly rounds.
+    '''
+    events = items.loc[items.index.repeat(items["n_values"].clip(lower=1)), ["item_idx", "n_values"]]
+    events["v"] = events.groupby("item_idx").cumcount()
+    stay_idx = (events["item_idx"] + events["v"]) % len(stays)
+    lap = events["v"] // len(stays)
+    minute = 1 + lap % 59 + 60 * (lap // 59)
+    covered = stays.iloc[stay_idx.values][["subject_id", "hadm_id", "stay_id", "starttime"]].reset_index(drop=True)
+    return pd.DataFrame({
+        "subject_id": covered["subject_id"],
+        "hadm_id": covered["hadm_id"],
+        "stay_id": covered["stay_id"],
+        "charttime": covered["starttime"] + _minutes(minute.values),
+        "item_idx": events["item_idx"].values,
+        # the middle of the value's bucket of u1 * n_values
+        "u1": ((events["v"] + 0.5) / events["n_values"].clip(lower=1)).values,
+        "u2": 0.5,
+        "u3": 0.5,
+    })
+
+def _write_table(conn: duckdb.DuckDBPyConnection, table: str, select_sql: str, output_dir: Path):
+    '''
+    Write the result of a query to {output_dir}/{hosp|icu}/{table}.parquet with the columns of
+    `MIMIC_CSV_SCHEMAS`, in order, casting each and filling the columns the query leaves out with NULL.
+    '''
+    available = set(conn.sql(select_sql).columns)
+    columns = ", ".join(
+        f"CAST({col if col in available else 'NULL'} AS {dtype}) AS {col}"
+        for col, dtype in MIMIC_CSV_SCHEMAS[table].items()
+    )
+    module = "hosp" if table in HOSP_TABLES else "icu"
+    path = output_dir / module / f"{table}.parquet"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn.execute(f"COPY (SELECT {columns} FROM ({select_sql})) TO '{path}' (FORMAT PARQUET, COMPRESSION ZSTD)")
+    rows = conn.execute(f"SELECT COUNT(*) FROM '{path}'").fetchone()[0]
+    logger.info(f"wrote {rows} rows to {path}")
+    return path
+
+def generate_synthetic_mimic(
+    output_dir: str | Path,
+    n_patients: int = 1000,
+    n_admissions: int = 1500,
+    events_per_icu_day: int = 400,
+    labs_per_day: int = 40,
+    icu_fraction: float = 0.5,
+    seed: int = 0,
+) -> dict[str, Path]:
+    '''
+    Write a synthetic MIMIC-IV of the given scale to `output_dir`. `events_per_icu_day` is the average
+    number of chartevents per day of each ICU stay; the other ICU event tables are scaled from it.
+    Returns the path of each table written.
+    '''
+    if n_patients < 1 or n_admissions < n_patients:
+        raise ValueError(
+            f"need at least one patient and at least as many admissions as patients, got {n_patients} patients "
+            f"and {n_admissions} admissions"
+        )
+    output_dir = Path(output_dir)
+    logger.info(
+        f"generating a synthetic MIMIC-IV of {n_patients} patients and {n_admissions} admissions "
+        f"({events_per_icu_day} chartevents per ICU day) to {output_dir}..."
+    )
+    conn = duckdb.connect()
+    configure_duckdb(conn, "synthetic")
+    # uniform draw in [0, 1) keyed by up to four values; hashing twice, as draws that only differ by their
+    # last key are correlated with the single variadic hash
+    conn.execute(
+        f"CREATE OR REPLACE TEMP MACRO _u(a, b, c, d) AS hash(hash({int(seed)}, a, b, c, d)) / 18446744073709551616.0"
+    )
+
+    tables = base_tables(n_patients, n_admissions, icu_fraction, seed)
+    for name, df in tables.items():
+        conn.register(f"_{name}", df)
+    paths = {name: _write_table(conn, name, f"FROM _{name}", output_dir) for name in tables}
+
+    stays = tables["icustays"].rename(columns={"intime": "starttime", "outtime": "endtime"})
+    stays["stay_rank"] = range(len(stays))
+    conn.register("stays", stays)
+    conn.execute("CREATE TEMP VIEW hospital_stays AS SELECT subject_id, hadm_id, NULL::INTEGER AS stay_id"
+                 ", starttime: admittime, endtime: dischtime FROM _admissions")
+
+    # -- chartevents, procedureevents and datetimeevents --
+    items, values = item_catalog()
+    conn.register("item_values", values)
+    chart_items = items[items["linksto"] == "chartevents"].reset_index(drop=True)
+    chart_items["item_idx"] = range(len(chart_items))
+    conn.register("chart_items", chart_items)
+    conn.register("chart_coverage", _coverage(chart_items, stays))
+    paths["chartevents"] = _write_table(conn, "chartevents", f"""
+    WITH events AS (
+        FROM ({_sampled_events_sql("stays", 60, events_per_icu_day, len(chart_items), stream=0)})
+        UNION ALL BY NAME
+        FROM chart_coverage
+    )
+    FROM events e
+    JOIN chart_items i USING (item_idx)
+    LEFT JOIN item_values v ON v.itemid = i.itemid AND v.value_idx = CAST(floor(e.u1 * i.n_values) AS INTEGER)
+    SELECT e.subject_id, e.hadm_id, e.stay_id
+        , caregiver_id: 1000 + CAST(floor(e.u3 * 9000) AS INTEGER)
+        , e.charttime
+        , storetime: e.charttime + to_minutes(CAST(floor(e.u2 * 60) AS BIGINT))
+        , i.itemid
+        , value: CASE WHEN i.n_values > 0 THEN v.value ELSE {_number_text_sql("e.u1")} END
+        , valuenum: CASE WHEN i.n_values > 0 THEN v.valuenum ELSE {_number_sql("e.u1")} END
+        , valueuom: i.unitname
+        , warning: 0
+    """, output_dir)
+
+    procedure_items = items[items["linksto"] == "procedureevents"].reset_index(drop=True)
+    procedure_items["item_idx"] = range(len(procedure_items))
+    conn.register("procedure_items", procedure_items)
+    paths["procedureevents"] = _write_table(conn, "procedureevents", f"""
+    FROM stays s
+    CROSS JOIN procedure_items i
+    SELECT s.subject_id, s.hadm_id, s.stay_id
+        , caregiver_id: 1000 + CAST(floor(_u(s.stay_id, i.itemid, 0, 100) * 9000) AS INTEGER)
+        , procedure_start: s.starttime + to_minutes(CAST(floor(_u(s.stay_id, i.itemid, 0, 101)
+            * epoch(s.endtime - s.starttime) / 60 * 0.8) AS BIGINT))
+        , starttime: procedure_start
+        , endtime: procedure_start + to_minutes(30 + CAST(floor(_u(s.stay_id, i.itemid, 0, 102) * 90) AS BIGINT))
+        , storetime: endtime
+        , i.itemid
+        , value: 1
+        , valueuom: 'None'
+        , orderid: 60000000 + row_number() OVER (ORDER BY s.stay_id, i.itemid)
+        , linkorderid: orderid
+        , ordercategoryname: 'Procedures'
+        , ordercategorydescription: 'Task'
+        , patientweight: 50 + floor(_u(s.stay_id, 0, 0, 103) * 70)
+        , isopenbag: 0
+        , continueinnextdept: 0
+        , statusdescription: 'FinishedRunning'
+    WHERE _u(s.stay_id, i.itemid, 0, 104) < {PROCEDURE_ITEM_RATE}
+        OR s.stay_rank = i.item_idx % {len(stays)}
+    """, output_dir)
+
+    datetime_items = items[items["linksto"] == "datetimeevents"].reset_index(drop=True)
+    datetime_items["item_idx"] = range(len(datetime_items))
+    conn.register("datetime_items", datetime_items)
+    datetime_events = _sampled_events_sql(
+        "stays", 60, events_per_icu_day * DATETIMES_PER_EVENTS, len(datetime_items), stream=10
+    )
+    paths["datetimeevents"] = _write_table(conn, "datetimeevents", f"""
+    FROM ({datetime_events}) e
+    JOIN datetime_items i USING (item_idx)
+    SELECT e.subject_id, e.hadm_id, e.stay_id
+        , caregiver_id: 1000 + CAST(floor(e.u3 * 9000) AS INTEGER)
+        , e.charttime
+        , storetime: e.charttime + to_minutes(CAST(floor(e.u2 * 60) AS BIGINT))
+        , i.itemid
+        , value: e.charttime - to_minutes(CAST(floor(e.u1 * 4320) AS BIGINT))
+        , valueuom: 'Date and Time'
+        , warning: 0
+    """, output_dir)
+
+    # -- outputevents --
+    outputs = output_catalog().reset_index(drop=True)
+    outputs["item_idx"] = range(len(outputs))
+    conn.register("output_items", outputs)
+    paths["outputevents"] = _write_table(conn, "outputevents", f"""
+    FROM ({_sampled_events_sql("stays", 60, events_per_icu_day * OUTPUTS_PER_EVENTS, len(outputs), stream=20)}) e
+    JOIN output_items i USING (item_idx)
+    SELECT e.subject_id, e.hadm_id, e.stay_id
+        , caregiver_id: 1000 + CAST(floor(e.u3 * 9000) AS INTEGER)
+        , e.charttime
+        , storetime: e.charttime + to_minutes(CAST(floor(e.u2 * 60) AS BIGINT))
+        , i.itemid
+        , value: round(i.lo + e.u1 * (i.hi - i.lo))
+        , valueuom: i.unitname
+    """, output_dir)
+
+    # -- inputevents and ingredientevents --
+    meds, contexts = med_catalog()
+    conn.register("med_items", meds)
+    conn.register("med_contexts", contexts)
+    n_meds = len(meds)
+    orders_per_round = max(1, math.ceil(events_per_icu_day * 0.06 / 6))
+    med_slots = min(orders_per_round, n_meds)
+    paths["inputevents"] = _write_table(conn, "inputevents", f"""
+    WITH rounds AS (
+        FROM stays
+        SELECT *, r: unnest(range(CAST(ceil(epoch(endtime - starttime) / 14400) AS BIGINT)))
+    ), slots AS (
+        FROM rounds
+        SELECT *, k: unnest(range({med_slots}))
+    ), orders AS (
+        FROM slots s
+        JOIN med_items i ON i.item_idx = CAST((s.k * {n_meds}) // {med_slots} + floor(_u(s.stay_id, s.r, s.k, 200)
+            * (((s.k + 1) * {n_meds}) // {med_slots} - (s.k * {n_meds}) // {med_slots})) AS INTEGER)
+        JOIN med_contexts c ON c.itemid = i.itemid
+            AND c.context_idx = CAST(floor(_u(s.stay_id, s.r, s.k, 201) * i.n_contexts) AS INTEGER)
+        SELECT s.subject_id, s.hadm_id, s.stay_id, i.*, c.* EXCLUDE (itemid, category)
+            , order_start: s.starttime + to_minutes(s.r * 240 + CAST(floor(_u(s.stay_id, s.r, s.k, 202) * 120) AS BIGINT))
+            , intermittent: i.decision = 'INTERMITTENT' OR (i.decision = 'BOTH' AND c.is_bolus)
+            , n_segments: CASE WHEN intermittent THEN 1 ELSE 1 + CAST(floor(_u(s.stay_id, s.r, s.k, 203) * 4) AS INTEGER) END
+            , segment_minutes: CASE
+                WHEN intermittent AND i.long_intermittent AND _u(s.stay_id, s.r, s.k, 204) < 0.3
+                    THEN 5 + CAST(floor(_u(s.stay_id, s.r, s.k, 205) * 25) AS INTEGER)
+                WHEN intermittent THEN 1
+                ELSE 30 + CAST(floor(_u(s.stay_id, s.r, s.k, 205) * 30) AS INTEGER) END
+            , patientweight: round(50 + _u(s.stay_id, 0, 0, 206) * 70, 1)
+            , linkorderid: 70000000 + row_number() OVER (ORDER BY s.stay_id, s.r, s.k)
+            , u_status: _u(s.stay_id, s.r, s.k, 207)
+        WHERE _u(s.stay_id, s.r, s.k, 208) < {min(1.0, orders_per_round / med_slots)}
+    ), segments AS (
+        FROM orders
+        SELECT *, seg: unnest(range(n_segments))
+    )
+    FROM segments
+    SELECT subject_id, hadm_id, stay_id
+        , caregiver_id: 1000 + CAST(floor(_u(linkorderid, seg, 0, 210) * 9000) AS INTEGER)
+        , starttime: order_start + to_minutes(seg * segment_minutes)
+        , endtime: starttime + to_minutes(segment_minutes)
+        , storetime: endtime
+        , itemid
+        , rate: CASE WHEN intermittent THEN NULL
+            ELSE round(rate_lo + _u(linkorderid, seg, 0, 211) * (rate_hi - rate_lo), 3) END
+        , amount: CASE WHEN intermittent THEN round(amount_lo + _u(linkorderid, seg, 0, 212) * (amount_hi - amount_lo), 2)
+            ELSE round(rate * segment_minutes / 60, 3) END
+        , amountuom
+        , rateuom: CASE WHEN intermittent THEN NULL ELSE rateuom END
+        , orderid: 80000000 + row_number() OVER (ORDER BY linkorderid, seg)
+        , linkorderid
+        , ordercategoryname, secondaryordercategoryname, ordercomponenttypedescription, ordercategorydescription
+        , patientweight
+        , totalamount: amount
+        , totalamountuom: amountuom
+        , isopenbag: 0
+        , continueinnextdept: 0
+        , statusdescription: CASE
+            WHEN intermittent THEN 'FinishedRunning'
+            WHEN seg < n_segments - 1 THEN 'ChangeDose/Rate'
+            ELSE ['FinishedRunning', 'Stopped', 'Paused'][1 + CAST(floor(u_status * 3) AS INTEGER)] END
+    """, output_dir)
+
+    paths["ingredientevents"] = _write_table(conn, "ingredientevents", f"""
+    FROM '{paths["inputevents"]}'
+    SELECT subject_id, hadm_id, stay_id, caregiver_id, starttime, endtime, storetime
+        , itemid: {FREE_WATER_ITEM_ID}
+        , amount: round(50 + _u(orderid, 0, 0, 300) * 200)
+        , amountuom: 'mL'
+        , orderid, linkorderid, statusdescription
+    WHERE _u(orderid, 0, 0, 301) < {INGREDIENT_FRACTION}
+    """, output_dir)
+
+    # -- labevents --
+    labs = lab_catalog().reset_index(drop=True)
+    labs["item_idx"] = range(len(labs))
+    conn.register("lab_items", labs)
+    comments = ", ".join(f"'{comment}'" for comment in LAB_COMMENTS)
+    paths["labevents"] = _write_table(conn, "labevents", f"""
+    WITH draws AS (
+        FROM ({_sampled_events_sql("hospital_stays", 360, labs_per_day, len(labs), stream=400)}) e
+        JOIN lab_items i USING (item_idx)
+        SELECT e.*, i.itemid, i.unitname, i.lo, i.hi
+            , number: {_number_sql("e.u1")}
+            , commented: e.u2 < 0.03
+    )
+    FROM draws
+    SELECT labevent_id: row_number() OVER (ORDER BY hadm_id, charttime, itemid)
+        , subject_id
+        , hadm_id: CASE WHEN u3 < 0.02 THEN NULL ELSE hadm_id END
+        , specimen_id: 50000000 + dense_rank() OVER (ORDER BY hadm_id, charttime)
+        , itemid
+        , charttime
+        , storetime: charttime + to_minutes(60 + CAST(floor(u3 * 120) AS BIGINT))
+        , value: CASE WHEN commented THEN NULL ELSE CAST(number AS VARCHAR) END
+        , valuenum: CASE WHEN commented THEN NULL ELSE number END
+        , valueuom: unitname
+        , ref_range_lower: round(lo + (hi - lo) * 0.1, 2)
+        , ref_range_upper: round(hi - (hi - lo) * 0.1, 2)
+        , flag: CASE WHEN NOT commented AND (number < ref_range_lower OR number > ref_range_upper) THEN 'abnormal' END
+        , priority: CASE WHEN u2 > 0.8 THEN 'STAT' ELSE 'ROUTINE' END
+        , comments: CASE WHEN commented THEN [{comments}][1 + CAST(floor(u2 / 0.03 * {len(LAB_COMMENTS)}) AS INTEGER)] END
+    """, output_dir)
+    paths["d_labitems"] = _write_table(conn, "d_labitems", "FROM lab_items", output_dir)
+
+    # -- d_items --
+    d_items = pd.concat([
+        items.drop(columns=["lo", "hi", "decimals", "n_values"]),
+        outputs[["itemid", "label", "linksto", "category", "unitname", "param_type"]],
+        meds[["itemid", "label", "category", "amountuom"]].rename(columns={"amountuom": "unitname"})
+            .assign(linksto="inputevents", param_type="Solution"),
+        pd.DataFrame({"itemid": [FREE_WATER_ITEM_ID], "label": ["Free Water"], "linksto": ["ingredientevents"],
+                      "category": ["Ingredients"], "unitname": ["mL"], "param_type": ["Ingredient"]}),
+    ], ignore_index=True).drop_duplicates("itemid")
+    conn.register("_d_items", d_items)
+    paths["d_items"] = _write_table(conn, "d_items", "FROM _d_items SELECT *, abbreviation: label", output_dir)
+
+    missing = set(MIMIC_TABLES_NEEDED_FOR_CLIF) - set(paths)
+    assert not missing, f"tables not generated: {missing}"
+    conn.close()
+    logger.info(f"generated the {len(paths)} MIMIC-IV tables needed for CLIF in {output_dir}")
+    return paths
+
+def _main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic MIMIC-IV dataset for testing and benchmarking.")
+    parser.add_argument("--output-dir", required=True, help="directory to write the hosp/ and icu/ parquet files to")
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--admissions", type=int, default=1500)
+    parser.add_argument("--events-per-icu-day", type=int, default=400, help="average chartevents per day of ICU stay")
+    parser.add_argument("--labs-per-day", type=int, default=40, help="average labevents per day of admission")
+    parser.add_argument("--icu-fraction", type=float, default=0.5, help="share of admissions with an ICU stay")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate_synthetic_mimic(
+        args.output_dir, n_patients=args.patients, n_admissions=args.admissions,
+        events_per_icu_day=args.events_per_icu_day, labs_per_day=args.labs_per_day,
+        icu_fraction=args.icu_fraction, seed=args.seed,
+    )
+
+if __name__ == "__main__":
+    setup_logging()
+    _main()
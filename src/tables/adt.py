@@ -1,12 +1,13 @@
 # src/tables/adt.py
 import numpy as np
 import pandas as pd
+import duckdb
 import logging
 from importlib import reload
 import src.utils
 reload(src.utils)
 from src.utils import construct_mapper_dict, load_mapping_csv, \
-    rename_and_reorder_cols, save_to_rclif, mimic_table_pathfinder, convert_tz_to_utc
+    rename_and_reorder_cols, save_to_rclif, mimic_table_source, convert_tz_to_utc
 from src.logging_config import setup_logging, get_logger
 
 logger = get_logger('tables.adt')
@@ -32,7 +33,7 @@ def _main():
     location_type_mapper = construct_mapper_dict(adt_mapping, "careunit", "location_type")
 
     # Filter transfers with valid careunit and hadm_id
-    mimic_transfers = pd.read_parquet(mimic_table_pathfinder("transfers"))
+    mimic_transfers = duckdb.sql(f"FROM {mimic_table_source('transfers')}").df()
     
     logger.info("filtering out NA transfers...") 
     adt = mimic_transfers.dropna(subset=["hadm_id"]) \
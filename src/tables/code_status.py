@@ -23,9 +23,8 @@ from src.utils import (
     rename_and_reorder_cols,
     save_to_rclif,
     convert_and_sort_datetime,
-    convert_tz_to_utc,
     CLIF_DTTM_FORMAT,
-    mimic_table_pathfinder
+    mimic_table_source
 )
 
 from src.utils_qa import all_null_check
@@ -44,19 +43,26 @@ SCHEMA = pa.DataFrameSchema(
 
 COLUMN_NAMES: List[str] = list(SCHEMA.columns.keys())
 
+CODE_STATUS_ITEM_ID = 223758
+# code status is recorded per patient, so a sharded build splits the patients (see src/sharding.py)
+SHARD_KEY = "subject_id"
+
+def _chartevents_item_ids() -> list[int]:
+    return [CODE_STATUS_ITEM_ID]
+
 def extracted_events() -> pd.DataFrame:
     logger.info("extracting code status events...")
-    return fetch_mimic_events(item_ids=[223758])
+    return fetch_mimic_events(item_ids=[CODE_STATUS_ITEM_ID])
 
 @tag(property="final")
 def mapped_and_cast(extracted_events: pd.DataFrame) -> pd.DataFrame:
     logger.info("mapping and casting...")
     q = f"""
     FROM extracted_events e
-    LEFT JOIN '{mimic_table_pathfinder('admissions')}' h 
+    LEFT JOIN {mimic_table_source('admissions')} h 
         USING (hadm_id)
     SELECT patient_id: CAST(h.subject_id AS VARCHAR)
-        , start_dttm: CAST(e.time AS TIMESTAMP)
+        , start_dttm: mimic_to_utc(CAST(e.time AS TIMESTAMP))
         , code_status_name: CAST(e.value AS VARCHAR)
         , code_status_category: CASE
             WHEN code_status_name in ('Full code') THEN 'Full'
@@ -65,9 +71,7 @@ def mapped_and_cast(extracted_events: pd.DataFrame) -> pd.DataFrame:
             WHEN code_status_name in ('DNR (do not resuscitate)') THEN 'DNR'
             WHEN code_status_name in ('Comfort measures only') THEN 'AND' END
     """
-    df = duckdb.query(q).df()
-    df["start_dttm"] = convert_tz_to_utc(df["start_dttm"])
-    return df
+    return duckdb.query(q).df()
 
 @tag(property="test")
 def schema_tested(mapped_and_cast: pd.DataFrame) -> bool | pa.errors.SchemaErrors:
@@ -97,11 +101,13 @@ def save(mapped_and_cast: pd.DataFrame) -> dict:
 def _main():
     logger.info("starting to build clif code status table -- ")
     from hamilton import driver
+    from src.node_manifest import NodeManifestAdapter
+    from src.node_cache import node_cache_adapters
     import src.tables.code_status as code_status
     dr = (
         driver.Builder()
         .with_modules(code_status)
-        # .with_cache()
+        .with_adapters(NodeManifestAdapter("code_status"), *node_cache_adapters(code_status))
         .build()
     )
     dr.execute(["save"])
@@ -109,10 +115,13 @@ def _main():
 def _test():
     logger.info("testing all...")
     from hamilton import driver
+    from src.node_manifest import NodeManifestAdapter
+    from src.node_cache import node_cache_adapters
     import src.tables.code_status as code_status
     dr = (
         driver.Builder()
         .with_modules(code_status)
+        .with_adapters(NodeManifestAdapter("code_status_test"), *node_cache_adapters(code_status))
         .build()
     )
     all_nodes = dr.list_available_variables()
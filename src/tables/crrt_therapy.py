@@ -23,7 +23,6 @@ from src.utils import (
     rename_and_reorder_cols,
     save_to_rclif,
     convert_and_sort_datetime,
-    convert_tz_to_utc,
     CLIF_DTTM_FORMAT,
 )
 
@@ -67,6 +66,9 @@ def extracted_crrt_events(crrt_items: pd.DataFrame, crrt_id_to_variable_mapper:
     df["crrt_variable"] = df["itemid"].map(crrt_id_to_variable_mapper)
     return df
     
+def _chartevents_item_ids() -> list[int]:
+    return crrt_items(load_mapping_csv("dialysis"))["itemid"].tolist()
+
 def crrt_events_pivoted_wider(extracted_crrt_events: pd.DataFrame) -> pd.DataFrame:
     logger.info("pivoting crrt events to wider...")
     return extracted_crrt_events.pivot(
@@ -85,7 +87,7 @@ def crrt_events_cast_and_cleaned(crrt_events_pivoted_wider: pd.DataFrame) -> pd.
     SELECT
         CAST(hadm_id as VARCHAR) as hospitalization_id,
         CAST(NULL as VARCHAR) as device_id,
-        CAST(time as TIMESTAMP) as recorded_dttm,
+        mimic_to_utc(CAST(time as TIMESTAMP)) as recorded_dttm,
         CAST(crrt_mode_name as VARCHAR) as crrt_mode_name,
         CAST(lower(crrt_mode_name) as VARCHAR) as crrt_mode_category,
         CAST(NULL as VARCHAR) as dialysis_machine_name,
@@ -96,9 +98,7 @@ def crrt_events_cast_and_cleaned(crrt_events_pivoted_wider: pd.DataFrame) -> pd.
         CAST(ultrafiltration_out as FLOAT) as ultrafiltration_out
     FROM crrt_events_pivoted_wider
     """
-    df = duckdb.query(query).df()
-    df["recorded_dttm"] = convert_tz_to_utc(df["recorded_dttm"])
-    return df
+    return duckdb.query(query).df()
 
 @tag(property="test")
 def schema_tested(crrt_events_cast_and_cleaned: pd.DataFrame) -> bool | pa.errors.SchemaErrors:
@@ -128,11 +128,13 @@ def save(crrt_events_cast_and_cleaned: pd.DataFrame) -> dict:
 def _main():
     logger.info("starting to build clif crrt therapy table -- ")
     from hamilton import driver
+    from src.node_manifest import NodeManifestAdapter
+    from src.node_cache import node_cache_adapters
     import src.tables.crrt_therapy as crrt_therapy
     dr = (
         driver.Builder()
         .with_modules(crrt_therapy)
-        # .with_cache()
+        .with_adapters(NodeManifestAdapter("crrt_therapy"), *node_cache_adapters(crrt_therapy))
         .build()
     )
     dr.execute(["save"])
@@ -140,10 +142,13 @@ def _main():
 def _test():
     logger.info("testing all...")
     from hamilton import driver
+    from src.node_manifest import NodeManifestAdapter
+    from src.node_cache import node_cache_adapters
     import src.tables.crrt_therapy as crrt_therapy
     dr = (
         driver.Builder()
         .with_modules(crrt_therapy)
+        .with_adapters(NodeManifestAdapter("crrt_therapy_test"), *node_cache_adapters(crrt_therapy))
         .build()
     )
     all_nodes = dr.list_available_variables()
@@ -14,6 +14,9 @@ from src.utils import (
     save_to_rclif,
     convert_tz_to_utc,
     mimic_table_pathfinder,
+    mimic_table_source,
+    mimic_events_source,
+    mapping_path_finder,
 )
 
 CLIF_ECMO_MCS_SCHEMA = pa.DataFrameSchema(
@@ -56,20 +59,25 @@ def device_lookup() -> duckdb.DuckDBPyRelation:
     """Lookup table mapping (itemid, charted_value) -> standardized CLIF categories.
     Only device-identification items (e.g., Circuit Configuration, Type of Catheter)
     appear here. The CSV stores 'NA' for non-ECMO devices; convert to SQL NULL."""
-    return duckdb.sql("""
-        FROM 'data/mappings/mimic-to-clif-mappings - ecmo_mcs_device.csv'
+    return duckdb.sql(f"""
+        FROM '{mapping_path_finder("ecmo_mcs_device")}'
         SELECT itemid, label, value, device_category, mcs_group
             , ecmo_config: NULLIF(ecmo_configuration_category, 'NA')
     """)
 
 
+def _chartevents_item_ids() -> list[int]:
+    return [int(row[0]) for row in ecmo_mapping_filtered(ecmo_mapping()).select("itemid").fetchall()]
+
+
 def all_events(ecmo_mapping_filtered: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
     """Fetch every chartevent row whose itemid is in the mapping.
     INNER JOIN filters to only mapped items; device_context comes along
     so downstream nodes can group by physical device."""
-    _chartevents_path = mimic_table_pathfinder("chartevents")
+    _item_ids = [row[0] for row in ecmo_mapping_filtered.select("itemid").fetchall()]
+    _chartevents_path = mimic_events_source("chartevents", _item_ids)
     return duckdb.sql(f"""
-        FROM '{_chartevents_path}' ce
+        FROM {mimic_table_source('chartevents', _chartevents_path)} ce
         INNER JOIN ecmo_mapping_filtered m ON ce.itemid = m.itemid
         SELECT
             ce.hadm_id, ce.charttime, ce.itemid, ce.value, ce.valuenum
@@ -221,10 +229,13 @@ def save(clif_ecmo_mcs: pd.DataFrame) -> dict:
 def _main():
     logger.info("starting to build clif ecmo_mcs table -- ")
     from hamilton import driver
+    from src.node_manifest import NodeManifestAdapter
+    from src.node_cache import node_cache_adapters
     import src.tables.ecmo_mcs as ecmo_mcs
     dr = (
         driver.Builder()
         .with_modules(ecmo_mcs)
+        .with_adapters(NodeManifestAdapter("ecmo_mcs"), *node_cache_adapters(ecmo_mcs))
         .build()
     )
     dr.execute(["save"])
@@ -233,10 +244,13 @@ def _main():
 def _test():
     logger.info("testing all...")
     from hamilton import driver
+    from src.node_manifest import NodeManifestAdapter
+    from src.node_cache import node_cache_adapters
     import src.tables.ecmo_mcs as ecmo_mcs
     dr = (
         driver.Builder()
         .with_modules(ecmo_mcs)
+        .with_adapters(NodeManifestAdapter("ecmo_mcs_test"), *node_cache_adapters(ecmo_mcs))
         .build()
     )
     all_nodes = dr.list_available_variables()
@@ -25,7 +25,7 @@ from src.utils import (
     convert_and_sort_datetime,
     convert_tz_to_utc,
     CLIF_DTTM_FORMAT,
-    mimic_table_pathfinder
+    mimic_table_source
 )
 
 from src.utils_qa import all_null_check
@@ -58,7 +58,7 @@ def extracted_and_mapped() -> pd.DataFrame:
             WHEN dx.seq_num = 1 THEN 1 
             WHEN dx.seq_num > 1 THEN 0 END
         , poa_present: CAST(NULL AS INT)
-    FROM '{mimic_table_pathfinder('diagnoses_icd')}' dx
+    FROM {mimic_table_source('diagnoses_icd')} dx
     """
     return duckdb.query(q).df()
 
@@ -90,11 +90,13 @@ def save(extracted_and_mapped: pd.DataFrame) -> dict:
 def _main():
     logger.info("starting to build clif code status table -- ")
     from hamilton import driver
+    from src.node_manifest import NodeManifestAdapter
+    from src.node_cache import node_cache_adapters
     import src.tables.hospital_diagnosis as hospital_diagnosis
     dr = (
         driver.Builder()
         .with_modules(hospital_diagnosis)
-        # .with_cache()
+        .with_adapters(NodeManifestAdapter("hospital_diagnosis"), *node_cache_adapters(hospital_diagnosis))
         .build()
     )
     dr.execute(["save"])
@@ -102,10 +104,13 @@ def _main():
 def _test():
     logger.info("testing all...")
     from hamilton import driver
+    from src.node_manifest import NodeManifestAdapter
+    from src.node_cache import node_cache_adapters
     import src.tables.hospital_diagnosis as hospital_diagnosis
     dr = (
         driver.Builder()
         .with_modules(hospital_diagnosis)
+        .with_adapters(NodeManifestAdapter("hospital_diagnosis_test"), *node_cache_adapters(hospital_diagnosis))
         .build()
     )
     all_nodes = dr.list_available_variables()
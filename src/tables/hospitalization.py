@@ -12,7 +12,7 @@ from importlib import reload
 import src.utils
 # reload(src.utils)
 from src.utils import construct_mapper_dict, load_mapping_csv, \
-    rename_and_reorder_cols, save_to_rclif, mimic_table_pathfinder, convert_tz_to_utc
+    rename_and_reorder_cols, save_to_rclif, mimic_table_source, convert_tz_to_utc
 from src.utils_qa import all_null_check
 from src.logging_config import setup_logging, get_logger
 
@@ -117,8 +117,8 @@ def extracted_and_translated(discharge_mapper: Dict) -> pd.DataFrame:
         anchor_age,
         anchor_year,
         anchor_age + date_diff('year', make_date(anchor_year, 1, 1), admittime) AS age_at_admission
-    FROM '{mimic_table_pathfinder("admissions")}'
-    LEFT JOIN '{mimic_table_pathfinder("patients")}'
+    FROM {mimic_table_source("admissions")}
+    LEFT JOIN {mimic_table_source("patients")}
     USING (subject_id)
     """
     df = duckdb.query(query).df()
@@ -172,11 +172,13 @@ def save(recast: pd.DataFrame) -> dict:
 def _main():
     logger.info("starting to build clif hospitalization table -- ")
     from hamilton import driver
+    from src.node_manifest import NodeManifestAdapter
+    from src.node_cache import node_cache_adapters
     import src.tables.hospitalization as hospitalization
     dr = (
         driver.Builder()
         .with_modules(hospitalization)
-        # .with_cache()
+        .with_adapters(NodeManifestAdapter("hospitalization"), *node_cache_adapters(hospitalization))
         .build()
     )
     dr.execute(["save"])
@@ -184,10 +186,13 @@ def _main():
 def _test():
     logger.info("testing all...")
     from hamilton import driver
+    from src.node_manifest import NodeManifestAdapter
+    from src.node_cache import node_cache_adapters
     import src.tables.hospitalization as hospitalization
     dr = (
         driver.Builder()
         .with_modules(hospitalization)
+        .with_adapters(NodeManifestAdapter("hospitalization_test"), *node_cache_adapters(hospitalization))
         .build()
     )
     all_nodes = dr.list_available_variables()
@@ -0,0 +1,191 @@
+# src/tables/input_output.py
+'''
+Builds the CLIF input and output tables, which both come from MIMIC outputevents, from a single scan of it
+(see `extract_for_clif_tables` in src/utils.py). Item 227488 (GU Irrigant Volume In) lives in MIMIC
+outputevents but is conceptually an input (fluid into bladder for irrigation); the output table is
+currently scoped to urine output items.
+'''
+import pandas as pd
+import duckdb
+from hamilton.function_modifiers import tag, datasaver
+from src.logging_config import setup_logging, get_logger
+
+logger = get_logger('tables.input_output')
+import pandera.pandas as pa
+import json
+
+from src.utils import (
+    load_mapping_csv,
+    save_to_rclif,
+    validate_clif_table,
+    extract_for_clif_tables,
+)
+from src.tables.input import CLIF_INPUT_SCHEMA
+from src.tables.output import CLIF_OUTPUT_SCHEMA
+
+# the CLIF tables built from outputevents
+CLIF_TABLES = ["input", "output"]
+
+
+def input_mapping() -> pd.DataFrame:
+    logger.info("loading input mapping...")
+    return load_mapping_csv("input")
+
+
+def input_mapping_to_map(input_mapping: pd.DataFrame) -> pd.DataFrame:
+    return input_mapping[input_mapping["decision"] == "TO MAP"]
+
+
+def output_mapping() -> pd.DataFrame:
+    logger.info("loading output mapping...")
+    return load_mapping_csv("output")
+
+
+def output_mapping_to_map(output_mapping: pd.DataFrame) -> pd.DataFrame:
+    return output_mapping[output_mapping["decision"] == "TO MAP"]
+
+
+def outputevents_extracted(
+    input_mapping_to_map: pd.DataFrame, output_mapping_to_map: pd.DataFrame, clif_tables: list[str]
+) -> duckdb.DuckDBPyRelation:
+    '''
+    The outputevents of the items of the `clif_tables` being built (set in the driver config), in one scan.
+    '''
+    logger.info(f"extracting the MIMIC outputevents of the {clif_tables} tables...")
+    mappings = {
+        "input": input_mapping_to_map[["itemid", "label", "input_category", "input_group"]],
+        "output": output_mapping_to_map[["itemid", "label", "output_category", "output_group"]],
+    }
+    return extract_for_clif_tables(
+        "outputevents", {clif_table: mappings[clif_table] for clif_table in clif_tables}, "input_output_outputevents"
+    )
+
+
+@tag(property="final")
+def clif_input(outputevents_extracted: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
+    """
+    Transform MIMIC outputevents to CLIF input schema.
+    """
+    logger.info("transforming MIMIC outputevents to CLIF input schema...")
+    query = """
+    FROM outputevents_extracted oe
+    SELECT
+        CAST(oe.hadm_id AS VARCHAR) AS hospitalization_id,
+        mimic_to_utc(CAST(oe.charttime AS TIMESTAMP)) AS recorded_dttm,
+        oe.label AS input_name,
+        oe.input_category,
+        oe.input_group,
+        CAST(oe.value AS FLOAT) AS input_volume
+    WHERE oe.clif_table = 'input'
+        AND oe.hadm_id IS NOT NULL
+        AND oe.value IS NOT NULL
+    """
+    # left lazy so that `save_input` streams it to parquet
+    return duckdb.sql(query)
+
+
+@tag(property="final")
+def clif_output(outputevents_extracted: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
+    """
+    Transform MIMIC outputevents to CLIF output schema.
+    """
+    logger.info("transforming MIMIC outputevents to CLIF output schema...")
+    query = """
+    FROM outputevents_extracted oe
+    SELECT
+        CAST(oe.hadm_id AS VARCHAR) AS hospitalization_id,
+        mimic_to_utc(CAST(oe.charttime AS TIMESTAMP)) AS recorded_dttm,
+        oe.label AS output_name,
+        oe.output_category,
+        oe.output_group,
+        CAST(oe.value AS FLOAT) AS output_volume
+    WHERE oe.clif_table = 'output'
+        AND oe.hadm_id IS NOT NULL
+        AND oe.value IS NOT NULL
+    """
+    # left lazy so that `save_output` streams it to parquet
+    return duckdb.sql(query)
+
+
+def _schema_tested(schema: pa.DataFrameSchema, data: duckdb.DuckDBPyRelation) -> bool | pa.errors.SchemaErrors:
+    logger.info("testing schema...")
+    try:
+        validate_clif_table(schema, data)
+        return True
+    except pa.errors.SchemaErrors as exc:
+        logger.error(json.dumps(exc.message, indent=2))
+        logger.error("Schema errors and failure cases:")
+        logger.error(exc.failure_cases)
+        logger.error("\nDataFrame object that failed validation:")
+        logger.error(exc.data)
+        return exc
+
+
+@tag(property="test")
+def input_schema_tested(clif_input: duckdb.DuckDBPyRelation) -> bool | pa.errors.SchemaErrors:
+    return _schema_tested(CLIF_INPUT_SCHEMA, clif_input)
+
+
+@tag(property="test")
+def output_schema_tested(clif_output: duckdb.DuckDBPyRelation) -> bool | pa.errors.SchemaErrors:
+    return _schema_tested(CLIF_OUTPUT_SCHEMA, clif_output)
+
+
+@datasaver()
+def save_input(clif_input: duckdb.DuckDBPyRelation) -> dict:
+    logger.info("saving input to rclif...")
+    save_to_rclif(clif_input, "input")
+
+    metadata = {
+        "table_name": "input"
+    }
+
+    logger.info("output saved to a parquet file, everything completed for the input table!")
+    return metadata
+
+
+@datasaver()
+def save_output(clif_output: duckdb.DuckDBPyRelation) -> dict:
+    logger.info("saving output to rclif...")
+    save_to_rclif(clif_output, "output")
+
+    metadata = {
+        "table_name": "output"
+    }
+
+    logger.info("output saved to a parquet file, everything completed for the output table!")
+    return metadata
+
+
+def _driver(manifest_name: str, clif_tables: list[str]):
+    from hamilton import driver
+    from src.node_manifest import NodeManifestAdapter
+    from src.node_cache import node_cache_adapters
+    import src.tables.input_output as input_output
+    return (
+        driver.Builder()
+        .with_modules(input_output)
+        .with_config({"clif_tables": clif_tables})
+        .with_adapters(NodeManifestAdapter(manifest_name), *node_cache_adapters(input_output))
+        .build()
+    )
+
+
+def _main(clif_tables: list[str] = CLIF_TABLES):
+    logger.info(f"starting to build clif {' and '.join(clif_tables)} tables -- ")
+    dr = _driver("input_output" if clif_tables == CLIF_TABLES else clif_tables[0], clif_tables)
+    dr.execute([f"save_{clif_table}" for clif_table in clif_tables])
+
+
+def _test(clif_tables: list[str] = CLIF_TABLES):
+    logger.info("testing all...")
+    dr = _driver("input_output_test" if clif_tables == CLIF_TABLES else f"{clif_tables[0]}_test", clif_tables)
+    test_nodes = [f"{clif_table}_schema_tested" for clif_table in clif_tables]
+    output = dr.execute(test_nodes)
+    logger.debug(f"Test output: {output}")
+    return output
+
+
+if __name__ == "__main__":
+    setup_logging()
+    _main()
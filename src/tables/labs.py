@@ -16,13 +16,14 @@ from src.utils import (
     fetch_mimic_events,
     load_mapping_csv,
     save_to_rclif,
-    convert_tz_to_utc,
+    mcide_pathfinder,
+    validate_clif_table,
 )
 
 from src.utils_qa import all_null_check
 
 def _permitted_lab_categories() -> List[str]:
-    clif_labs_mcide = pd.read_csv("data/mcide/clif_lab_categories.csv")
+    clif_labs_mcide = pd.read_csv(mcide_pathfinder("clif_lab_categories"))
     return clif_labs_mcide["lab_category"].unique()
 
 CLIF_LABS_SCHEMA = pa.DataFrameSchema(
@@ -69,9 +70,14 @@ def labs_items(labs_mapping: pd.DataFrame) -> pd.DataFrame:
     ].copy()
 
 
+def _chartevents_item_ids() -> list[int]:
+    labs_items_all = labs_items(labs_mapping())
+    return labs_items_all.loc[labs_items_all['itemid'].astype("string").str.len() == 6, 'itemid'].tolist()
+
+
 def lab_order_category_mapping() -> pd.DataFrame:
     """Load lab order category mapping for SQL JOIN."""
-    return pd.read_csv("data/mcide/clif_labs_order_categories.csv")
+    return pd.read_csv(mcide_pathfinder("clif_labs_order_categories"))
 
 
 # =============================================================================
@@ -99,12 +105,13 @@ def ce_labs_extracted(labs_items: pd.DataFrame) -> pd.DataFrame:
 
 
 # =============================================================================
-# Comment Parsing (Python)
+# Comment Parsing
 # =============================================================================
 
 def _parse_labs_comment(comment: str) -> float:
     '''
     Use regular expression to parse the comment and extract the numeric value.
+    The reference for `_parse_labs_comment_sql`, which applies the same rules in DuckDB.
     '''
     match = re.search(r'\d+\.\d+|\d+', comment)
     parsed_number = float(match.group()) if match else np.nan
@@ -117,23 +124,36 @@ def _parse_labs_comment(comment: str) -> float:
     return parsed_number
 
 
-def le_labs_comments_parsed(le_labs_extracted: pd.DataFrame) -> pd.DataFrame:
+def _parse_labs_comment_sql(comment: str) -> str:
+    '''
+    SQL expression of `_parse_labs_comment` applied to the column `comment`: the first number in the comment,
+    unless the comment says "not done" or "unable" (but for "unable" in a ptt comment).
+    '''
+    return f"""CASE
+        WHEN contains(lower({comment}), 'ptt') AND contains(lower({comment}), 'unable')
+            OR NOT (contains(lower({comment}), 'not done') OR contains(lower({comment}), 'unable'))
+            THEN CAST(nullif(regexp_extract({comment}, '[0-9]+\\.[0-9]+|[0-9]+'), '') AS DOUBLE)
+        END"""
+
+
+def le_labs_comments_parsed(le_labs_extracted: pd.DataFrame) -> duckdb.DuckDBPyRelation:
     """Parse lab comments to recover missing numeric values."""
     logger.info("parsing lab comments to recover otherwise missing lab values...")
-    df = le_labs_extracted.copy()
-    mask = df["valuenum"].isna()
-    df.loc[mask, "valuenum"] = df.loc[mask, "comments"].map(
-        lambda x: _parse_labs_comment(x) if pd.notna(x) else np.nan
-    )
-    df.loc[mask, "value"] = df.loc[mask, "comments"]
-    return df
+    q = f"""
+    FROM le_labs_extracted
+    SELECT * REPLACE (
+        CASE WHEN valuenum IS NULL THEN {_parse_labs_comment_sql("comments")} ELSE valuenum END AS valuenum,
+        CASE WHEN valuenum IS NULL THEN comments ELSE value END AS value
+        )
+    """
+    return duckdb.sql(q)
 
 
 # =============================================================================
 # DuckDB Processing Functions
 # =============================================================================
 
-def le_labs_processed(le_labs_comments_parsed: pd.DataFrame, labs_mapping: pd.DataFrame) -> duckdb.DuckDBPyRelation:
+def le_labs_processed(le_labs_comments_parsed: duckdb.DuckDBPyRelation, labs_mapping: pd.DataFrame) -> duckdb.DuckDBPyRelation:
     """Map item IDs to names/categories and convert units via mapping."""
     logger.info("processing labevents: mapping names/categories and converting units...")
     q = """
@@ -215,16 +235,16 @@ def deduped(merged: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
 
 @tag(property="final")
 def cast(deduped: duckdb.DuckDBPyRelation,
-         lab_order_category_mapping: pd.DataFrame) -> pd.DataFrame:
+         lab_order_category_mapping: pd.DataFrame) -> duckdb.DuckDBPyRelation:
     """Cast dtypes and add lab_order_category via SQL JOIN."""
     logger.info("casting dtypes and mapping lab_order_category...")
     q = """
     FROM deduped d
     LEFT JOIN lab_order_category_mapping m ON d.lab_category = m.lab_category
     SELECT hospitalization_id: CAST(d.hospitalization_id AS VARCHAR)
-        , lab_order_dttm: d.lab_collect_dttm
-        , lab_collect_dttm: CAST(d.lab_collect_dttm AS TIMESTAMP)
-        , lab_result_dttm: CAST(d.lab_result_dttm AS TIMESTAMP)
+        , lab_order_dttm: mimic_to_utc(CAST(d.lab_collect_dttm AS TIMESTAMP))
+        , lab_collect_dttm: mimic_to_utc(CAST(d.lab_collect_dttm AS TIMESTAMP))
+        , lab_result_dttm: mimic_to_utc(CAST(d.lab_result_dttm AS TIMESTAMP))
         , lab_order_name: NULL::VARCHAR
         , lab_order_category: CAST(m.lab_order_category AS VARCHAR)
         , lab_name: CAST(d.lab_name AS VARCHAR)
@@ -235,13 +255,10 @@ def cast(deduped: duckdb.DuckDBPyRelation,
         , lab_specimen_name: NULL::VARCHAR
         , lab_specimen_category: NULL::VARCHAR
         , lab_loinc_code: NULL::VARCHAR
-    ORDER BY hospitalization_id, lab_collect_dttm, lab_result_dttm, lab_category
+    ORDER BY hospitalization_id, d.lab_collect_dttm, d.lab_result_dttm, lab_category
     """
-    df = duckdb.sql(q).df()
-    logger.info("converting timestamps to UTC...")
-    for col in ['lab_order_dttm', 'lab_collect_dttm', 'lab_result_dttm']:
-        df[col] = convert_tz_to_utc(df[col])
-    return df
+    # left lazy so that `save` streams it to parquet
+    return duckdb.sql(q)
 
 
 # =============================================================================
@@ -249,10 +266,10 @@ def cast(deduped: duckdb.DuckDBPyRelation,
 # =============================================================================
 
 @tag(property="test")
-def schema_tested(cast: pd.DataFrame) -> bool | pa.errors.SchemaErrors:
+def schema_tested(cast: duckdb.DuckDBPyRelation) -> bool | pa.errors.SchemaErrors:
     logger.info("testing schema...")
     try:
-        CLIF_LABS_SCHEMA.validate(cast, lazy=True)
+        validate_clif_table(CLIF_LABS_SCHEMA, cast)
         return True
     except pa.errors.SchemaErrors as exc:
         logger.error(json.dumps(exc.message, indent=2))
@@ -264,7 +281,7 @@ def schema_tested(cast: pd.DataFrame) -> bool | pa.errors.SchemaErrors:
 
 
 @datasaver()
-def save(cast: pd.DataFrame) -> dict:
+def save(cast: duckdb.DuckDBPyRelation) -> dict:
     logger.info("saving to rclif...")
     save_to_rclif(cast, "labs")
 
@@ -281,10 +298,13 @@ def save(cast: pd.DataFrame) -> dict:
 
 def _main():
     from hamilton import driver
+    from src.node_manifest import NodeManifestAdapter
+    from src.node_cache import node_cache_adapters
     import src.tables.labs as labs
     dr = (
         driver.Builder()
         .with_modules(labs)
+        .with_adapters(NodeManifestAdapter("labs"), *node_cache_adapters(labs))
         .build()
     )
     dr.execute(["save"])
@@ -293,10 +313,13 @@ def _main():
 def _test():
     logger.info("testing all...")
     from hamilton import driver
+    from src.node_manifest import NodeManifestAdapter
+    from src.node_cache import node_cache_adapters
     import src.tables.labs as labs
     dr = (
         driver.Builder()
         .with_modules(labs)
+        .with_adapters(NodeManifestAdapter("labs_test"), *node_cache_adapters(labs))
         .build()
     )
     all_nodes = dr.list_available_variables()
@@ -9,8 +9,9 @@ import src.utils
 # reload(src.utils)
 from src.utils import construct_mapper_dict, fetch_mimic_events, load_mapping_csv, \
     get_relevant_item_ids, find_duplicates, rename_and_reorder_cols, save_to_rclif, \
-    convert_and_sort_datetime, search_mimic_items, convert_tz_to_utc, \
-    mapping_path_finder
+    convert_and_sort_datetime, search_mimic_items, \
+    mapping_path_finder, mcide_pathfinder, validate_clif_table, materialize, \
+    mimic_table_source, mimic_events_source, mimic_table_pathfinder
 from hamilton.function_modifiers import tag, datasaver, config, cache, dataloader
 import pandera.pandas as pa
 from pandera.dtypes import Float32
@@ -24,6 +25,11 @@ CONT_MAR_ACTION_CATEGORIES = ['dose_change', 'start', 'stop', 'going', 'other']
 INTM_MAR_ACTION_CATEGORIES = ['given', 'other']
 CONT_MED_ROUTE_CATEGORIES = ['im', 'iv', 'inhaled']
 INTM_MED_ROUTE_CATEGORIES = ['im', 'iv', 'enteral', 'buccal_sublingual', 'intrapleural']
+# the columns of inputevents that the route of a medication is mapped from
+MED_ROUTE_COLS = [
+    'ordercategoryname', 'secondaryordercategoryname', 'ordercomponenttypedescription',
+    'ordercategorydescription', 'category',
+]
 
 CONT_SCHEMA = pa.DataFrameSchema(
     {
@@ -73,12 +79,22 @@ def med_item_ids(med_category_mapping: pd.DataFrame) -> pd.Series:
         excluded_labels = ["NO MAPPING", "UNSURE", "NOT AVAILABLE"]
         ) 
 
-def med_events_extracted(med_item_ids: pd.Series) -> pd.DataFrame:
+def med_events_extracted(med_item_ids: pd.Series) -> duckdb.DuckDBPyRelation:
+    '''
+    The inputevents of the medication items, left unsorted in DuckDB: `mapped_and_augmented` sorts them.
+    '''
     logger.info("fetching corresponding events...")
-    med_events = fetch_mimic_events(med_item_ids).pipe(convert_and_sort_datetime)
+    item_ids = list(med_item_ids)
     logger.info("removing extra whitespaces in the `ordercomponenttypedescription` column that disrupts later joins that need exact matching...")
-    med_events['ordercomponenttypedescription'] = med_events['ordercomponenttypedescription'].str.replace(r'\s+', ' ', regex=True).str.strip()
-    return med_events
+    query = f"""
+    FROM {mimic_table_source("inputevents", mimic_events_source("inputevents", item_ids))}
+    LEFT JOIN '{mimic_table_pathfinder("d_items")}' USING (itemid)
+    SELECT * REPLACE (
+        trim(regexp_replace(ordercomponenttypedescription, '\\s+', ' ', 'g')) AS ordercomponenttypedescription
+    )
+    WHERE itemid IN ({','.join(map(str, item_ids))})
+    """
+    return duckdb.sql(query)
 
 def med_route_mapping() -> pd.DataFrame:
     q = f"""
@@ -99,7 +115,7 @@ def med_route_mapping_by_id() -> pd.DataFrame:
     """
     return duckdb.sql(q).df()
 
-def med_route_mapped(med_events_extracted: pd.DataFrame, med_route_mapping: pd.DataFrame, med_route_mapping_by_id: pd.DataFrame) -> duckdb.DuckDBPyRelation:
+def med_route_mapped(med_events_extracted: duckdb.DuckDBPyRelation, med_route_mapping: pd.DataFrame, med_route_mapping_by_id: pd.DataFrame) -> duckdb.DuckDBPyRelation:
     logger.info("mapping med route...")
     q = """
     FROM med_events_extracted e
@@ -127,13 +143,23 @@ def med_route_mapped(med_events_extracted: pd.DataFrame, med_route_mapping: pd.D
             )
         , med_route_category: COALESCE(m.clif_med_route_category, m2.clif_med_route_category)
     """
-    med_route_mapped = duckdb.sql(q)
-    logger.debug(f"len before: {len(med_events_extracted)}")
-    logger.debug(f"len after: {len(med_route_mapped)}")
-    assert len(med_route_mapped) == len(med_events_extracted), 'df length altered after mapping med route'
-    return med_route_mapped
-
-def mapped_and_augmented(med_route_mapped: duckdb.DuckDBPyRelation, med_category_mapping: pd.DataFrame) -> duckdb.DuckDBPyRelation:
+    # each event matches at most one route, so that the joins keep the number of events
+    # (also counted at the `mapped_and_augmented` checkpoint)
+    mapped_routes = med_route_mapping.loc[
+        ~med_route_mapping["clif_med_route_category"].isin(['SPECIAL', 'UNINFORMATIVE'])
+        & med_route_mapping["clif_med_route_category"].notna()
+    ]
+    assert not mapped_routes.duplicated([f"mimic_{col}" for col in MED_ROUTE_COLS]).any(), \
+        'a med route is mapped more than once'
+    # the 'SPECIAL' cases only apply to events without a secondaryordercategoryname, whatever the mapping says
+    by_id_cols = [col for col in MED_ROUTE_COLS if col != "secondaryordercategoryname"]
+    assert not med_route_mapping_by_id.duplicated([f"mimic_{col}" for col in by_id_cols] + ["med_id"]).any(), \
+        'a med route is mapped more than once for the same med_id'
+    return duckdb.sql(q)
+
+def mapped_and_augmented(
+    med_route_mapped: duckdb.DuckDBPyRelation, med_category_mapping: pd.DataFrame, med_events_extracted: duckdb.DuckDBPyRelation
+    ) -> duckdb.DuckDBPyRelation:
     find_intm_where_clause = """
     ordercategoryname = '05-Med Bolus'
         OR ordercategorydescription = 'Drug Push'
@@ -180,7 +206,12 @@ def mapped_and_augmented(med_route_mapped: duckdb.DuckDBPyRelation, med_category
     WHERE _duration_in_mins > 0 -- remove the few cases where duration is zero or negative
     ORDER BY hadm_id, starttime, linkorderid, med_category, endtime
     """
-    mapped_and_augmented = duckdb.sql(query)
+    # checkpoint: both the continuous and the intermittent tables are built from it
+    mapped_and_augmented = materialize(duckdb.sql(query), "medication_admin_mapped_and_augmented")
+    # check the route mapping did not alter the number of events, against the events kept by the duration filter,
+    # which only reads their timestamps
+    n_events = duckdb.sql("SELECT COUNT(*) FROM med_events_extracted WHERE endtime > starttime").fetchone()[0]
+    assert len(mapped_and_augmented) == n_events, 'df length altered after mapping med route'
     if len(mapped_and_augmented) != 8511695:
         logger.warning(f'df length after augmentation and mapping is different from expected in last run')
     # if mapped_and_augmented['_to_table'].isna().sum() != 0:
@@ -255,12 +286,13 @@ def intm_flattened(intm_reassembled: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPy
         , med_route_category
     ORDER BY hospitalization_id, med_order_id, med_category, admin_dttm
     """
-    intm_flattened = duckdb.sql(q)
+    # checkpoint: streamed to parquet by `save_intm`, then counted against what was saved
+    intm_flattened = materialize(duckdb.sql(q), "medication_admin_intm_flattened")
     return intm_flattened
 
 def intm_med_group_mapping() -> pd.DataFrame:
-    q = """
-    FROM 'data/mcide/clif_medication_admin_intermittent_med_categories.csv'
+    q = f"""
+    FROM '{mcide_pathfinder("clif_medication_admin_intermittent_med_categories")}'
     SELECT med_category
         , med_group
         , n: COUNT(*) OVER (PARTITION BY med_category)
@@ -271,7 +303,7 @@ def intm_med_group_mapping() -> pd.DataFrame:
 
 @tag(property="final")
 def intm_cast_w_med_group(intm_flattened: duckdb.DuckDBPyRelation, intm_med_group_mapping: pd.DataFrame) -> duckdb.DuckDBPyRelation:
-    logger.info("casting the dtypes and mapping med_group for the intermittent table... (this is the final step that materializes the table so might take longer)")
+    logger.info("casting the dtypes and mapping med_group for the intermittent table...")
     q = """
     FROM intm_flattened
     LEFT JOIN intm_med_group_mapping USING (med_category)
@@ -279,7 +311,7 @@ def intm_cast_w_med_group(intm_flattened: duckdb.DuckDBPyRelation, intm_med_grou
         , med_order_id: CAST(med_order_id AS VARCHAR)
         , med_name: CAST(med_name AS VARCHAR)
         , med_category: CAST(med_category AS VARCHAR)
-        , admin_dttm: CAST(admin_dttm AS TIMESTAMP)
+        , admin_dttm: mimic_to_utc(CAST(admin_dttm AS TIMESTAMP))
         , mar_action_name: CAST(mar_action_name AS VARCHAR)
         , mar_action_category: CAST(mar_action_category AS VARCHAR)
         , med_dose: CAST(med_dose AS FLOAT)
@@ -288,16 +320,14 @@ def intm_cast_w_med_group(intm_flattened: duckdb.DuckDBPyRelation, intm_med_grou
         , med_route_category: CAST(med_route_category AS VARCHAR)
         , med_group: CAST(med_group AS VARCHAR)
     """
-    intm_cast_w_med_group = duckdb.sql(q).df()
-    intm_cast_w_med_group['admin_dttm'] = convert_tz_to_utc(intm_cast_w_med_group['admin_dttm'])
-    # check length is not altered
-    assert len(intm_flattened) == len(intm_cast_w_med_group), 'length altered after casting and mapping med_group'
-    return intm_cast_w_med_group
+    # left lazy so that `save_intm` streams it to parquet
+    return duckdb.sql(q)
 
 @datasaver()
-def save_intm(intm_cast_w_med_group: duckdb.DuckDBPyRelation) -> dict:
-    logger.info("saving to rclif...")
-    save_to_rclif(intm_cast_w_med_group, "medication_admin_intermittent")
+def save_intm(intm_cast_w_med_group: duckdb.DuckDBPyRelation, intm_flattened: duckdb.DuckDBPyRelation) -> dict:
+    logger.info("saving to rclif (this is the final step that materializes the table so might take longer)...")
+    # check length is not altered after casting and mapping med_group, before the previous table is replaced
+    save_to_rclif(intm_cast_w_med_group, "medication_admin_intermittent", expected_rows=len(intm_flattened))
     metadata = {
         "table_name": "medication_admin_intermittent"
     }
@@ -335,7 +365,8 @@ def cont_deduped_by_timestamps(cont_null_dose_rate_imputed: duckdb.DuckDBPyRelat
         PARTITION BY hadm_id, linkorderid, med_category, starttime, endtime
     ) = 1
     """
-    cont_deduped_by_timestamps = duckdb.sql(q)
+    # checkpoint: counted here, then flattened and deduped downstream
+    cont_deduped_by_timestamps = materialize(duckdb.sql(q), "medication_admin_cont_deduped_by_timestamps")
     logger.info(f"Removed {len(cont_null_dose_rate_imputed) - len(cont_deduped_by_timestamps)} rows")
     return cont_deduped_by_timestamps
 
@@ -374,7 +405,9 @@ def cont_flattened(cont_deduped_by_timestamps: duckdb.DuckDBPyRelation) -> duckd
         , med_route_category
     ORDER BY hospitalization_id, med_order_id, med_category, admin_dttm, _mar_action_name
     """
-    cont_flattened = duckdb.sql(q)
+    # checkpoint: the STRING_AGG window of `cont_deduped` is an order of magnitude slower
+    # when it is pipelined over this sorted chain than when it reads a table
+    cont_flattened = materialize(duckdb.sql(q), "medication_admin_cont_flattened")
     return cont_flattened
 
 def mar_action_dedup_mapping(cont_flattened: duckdb.DuckDBPyRelation) -> pd.DataFrame:
@@ -417,13 +450,14 @@ def cont_deduped(cont_flattened: duckdb.DuckDBPyRelation, mar_action_dedup_mappi
         OR mar_action_name_w_correct_dose IS NULL -- when there are no duplicates
     ORDER BY hospitalization_id, med_order_id, med_category, admin_dttm
     """
-    cont_deduped = duckdb.sql(q)#.df()
+    # checkpoint: counted here, then saved and validated
+    cont_deduped = materialize(duckdb.sql(q), "medication_admin_cont_deduped")
     logger.info(f"Removed {len(cont_flattened) - len(cont_deduped)} rows")
     return cont_deduped
 
 def cont_med_group_mapping() -> pd.DataFrame:
-    q = """
-    FROM 'data/mcide/clif_medication_admin_continuous_med_categories.csv'
+    q = f"""
+    FROM '{mcide_pathfinder("clif_medication_admin_continuous_med_categories")}'
     SELECT med_category
         , med_group
         , n: COUNT(*) OVER (PARTITION BY med_category)
@@ -440,7 +474,7 @@ def cont_med_group_mapping() -> pd.DataFrame:
 
 @tag(property="final")
 def cont_cast_w_med_group(cont_deduped: duckdb.DuckDBPyRelation, cont_med_group_mapping: pd.DataFrame) -> duckdb.DuckDBPyRelation:
-    logger.info("casting the dtypes and mapping med_group for the continuous table... (this is the final step that materializes the table so might take longer)")
+    logger.info("casting the dtypes and mapping med_group for the continuous table...")
     q = """
     FROM cont_deduped
     LEFT JOIN cont_med_group_mapping USING (med_category)
@@ -448,7 +482,7 @@ def cont_cast_w_med_group(cont_deduped: duckdb.DuckDBPyRelation, cont_med_group_
         , med_order_id: CAST(med_order_id AS VARCHAR)
         , med_name: CAST(med_name AS VARCHAR)
         , med_category: CAST(med_category AS VARCHAR)
-        , admin_dttm: CAST(admin_dttm AS TIMESTAMP)
+        , admin_dttm: mimic_to_utc(CAST(admin_dttm AS TIMESTAMP))
         , mar_action_name: CAST(mar_action_name AS VARCHAR)
         , mar_action_category: CAST(mar_action_category AS VARCHAR)
         , med_dose: CAST(med_dose AS FLOAT)
@@ -457,16 +491,14 @@ def cont_cast_w_med_group(cont_deduped: duckdb.DuckDBPyRelation, cont_med_group_
         , med_route_name: CAST(med_route_name AS VARCHAR)
         , med_route_category: CAST(med_route_category AS VARCHAR)
     """
-    cont_cast_w_med_group = duckdb.sql(q).df()
-    # check length is not altered
-    cont_cast_w_med_group['admin_dttm'] = convert_tz_to_utc(cont_cast_w_med_group['admin_dttm'])
-    assert len(cont_deduped) == len(cont_cast_w_med_group), 'length altered after casting and mapping med_group'
-    return cont_cast_w_med_group
+    # left lazy so that `save_cont` streams it to parquet
+    return duckdb.sql(q)
 
 @datasaver()
-def save_cont(cont_cast_w_med_group: duckdb.DuckDBPyRelation) -> dict:
-    logger.info("saving to rclif...")
-    save_to_rclif(cont_cast_w_med_group, "medication_admin_continuous")
+def save_cont(cont_cast_w_med_group: duckdb.DuckDBPyRelation, cont_deduped: duckdb.DuckDBPyRelation) -> dict:
+    logger.info("saving to rclif (this is the final step that materializes the table so might take longer)...")
+    # check length is not altered after casting and mapping med_group, before the previous table is replaced
+    save_to_rclif(cont_cast_w_med_group, "medication_admin_continuous", expected_rows=len(cont_deduped))
     
     metadata = {
         "table_name": "medication_admin_continuous"
@@ -478,7 +510,7 @@ def save_cont(cont_cast_w_med_group: duckdb.DuckDBPyRelation) -> dict:
 @tag(property="test")
 def cont_schema_tested(cont_cast_w_med_group: duckdb.DuckDBPyRelation) -> bool | pa.errors.SchemaErrors:
     try:
-        CONT_SCHEMA.validate(cont_cast_w_med_group, lazy=True)
+        validate_clif_table(CONT_SCHEMA, cont_cast_w_med_group)
         return True
     except pa.errors.SchemaErrors as exc:
         logger.error(json.dumps(exc.message, indent=2))
@@ -491,7 +523,7 @@ def cont_schema_tested(cont_cast_w_med_group: duckdb.DuckDBPyRelation) -> bool |
 @tag(property="test")
 def intm_schema_tested(intm_cast_w_med_group: duckdb.DuckDBPyRelation) -> bool | pa.errors.SchemaErrors:
     try:
-        INTM_SCHEMA.validate(intm_cast_w_med_group, lazy=True)
+        validate_clif_table(INTM_SCHEMA, intm_cast_w_med_group)
         return True
     except pa.errors.SchemaErrors as exc:
         logger.error(json.dumps(exc.message, indent=2))
@@ -504,10 +536,13 @@ def intm_schema_tested(intm_cast_w_med_group: duckdb.DuckDBPyRelation) -> bool |
 def _main():
     logger.info("starting to build clif medication_admin_continuous and medication_admin_intermittent tables -- ")
     from hamilton import driver
+    from src.node_manifest import NodeManifestAdapter
+    from src.node_cache import node_cache_adapters
     import src.tables.medication_admin as medication_admin
     dr = (
         driver.Builder()
         .with_modules(medication_admin)
+        .with_adapters(NodeManifestAdapter("medication_admin"), *node_cache_adapters(medication_admin))
         .build()
     )
     dr.execute(["save_cont", "save_intm"])
@@ -515,10 +550,13 @@ def _main():
 def _test():
     logger.info("testing all...")
     from hamilton import driver
+    from src.node_manifest import NodeManifestAdapter
+    from src.node_cache import node_cache_adapters
     import src.tables.medication_admin as medication_admin
     dr = (
         driver.Builder()
         .with_modules(medication_admin)
+        .with_adapters(NodeManifestAdapter("medication_admin_test"), *node_cache_adapters(medication_admin))
         .build()
     )
     all_nodes = dr.list_available_variables()
@@ -23,10 +23,13 @@ logger = get_logger('tables.medication_admin_intermittent')
 def _main():
     logger.info("starting to build clif medication_admin_intermittent tables -- ")
     from hamilton import driver
+    from src.node_manifest import NodeManifestAdapter
+    from src.node_cache import node_cache_adapters
     import src.tables.medication_admin as medication_admin
     dr = (
         driver.Builder()
         .with_modules(medication_admin)
+        .with_adapters(NodeManifestAdapter("medication_admin_intermittent"), *node_cache_adapters(medication_admin))
         .build()
     )
     dr.execute(["save_intm"])
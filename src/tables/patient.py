@@ -18,8 +18,10 @@ from src.utils import (
     rename_and_reorder_cols,
     save_to_rclif,
     convert_and_sort_datetime,
-    convert_tz_to_utc,
-    mimic_table_pathfinder,
+    mimic_table_source,
+    mcide_pathfinder,
+    materialize,
+    validate_clif_table,
 )
 from src.logging_config import setup_logging, get_logger
 
@@ -30,6 +32,9 @@ PATIENT_COL_NAMES = [
     "sex_name", "sex_category", "birth_date", "death_dttm", "language_name", "language_category"
 ]
 
+# one row per patient, so a sharded build splits the patients rather than their admissions (see src/sharding.py)
+SHARD_KEY = "subject_id"
+
 LANGUAGE_MAPPER = {
     'English': 'English', 
     'Spanish': 'Spanish', 
@@ -61,7 +66,7 @@ LANGUAGE_MAPPER = {
 
 def _permissible_language_categories():
     # language_df = pd.read_excel("data/data_models/language_category.1.xlsx")
-    language_mcide = pd.read_csv("data/mcide/clif_patient_language_categories.csv")
+    language_mcide = pd.read_csv(mcide_pathfinder("clif_patient_language_categories"))
     return language_mcide["language_category"].unique()
 
 PERMISSIBLE_RACE_CATEGORIES = [
@@ -142,40 +147,86 @@ def ethnicity_mapper(race_ethnicity_mapping: pd.DataFrame) -> dict:
     ethnicity_mapper[None] = "Unknown"
     return ethnicity_mapper
 
-def sex_translated() -> pd.DataFrame:
+def race_ethnicity_lookup(race_mapper: dict, ethnicity_mapper: dict) -> pd.DataFrame:
+    '''
+    The race and ethnicity mappers as a lookup table, joined to the admissions on the MIMIC race.
+    A missing race is mapped to "Unknown" by the mappers' None key.
+    '''
+    return pd.DataFrame({
+        "race_name": [race for race in race_mapper if race is not None],
+    }).assign(
+        race_category=lambda df: df["race_name"].map(race_mapper),
+        ethnicity_category=lambda df: df["race_name"].map(ethnicity_mapper),
+    )
+
+def language_lookup() -> pd.DataFrame:
+    '''
+    LANGUAGE_MAPPER as a lookup table, joined to the admissions on the MIMIC language.
+    '''
+    return pd.DataFrame(
+        [(name, category) for name, category in LANGUAGE_MAPPER.items() if name is not None],
+        columns=["language_name", "language_category"],
+    )
+
+def admissions_extracted() -> duckdb.DuckDBPyRelation:
+    '''
+    The columns of admissions that the race and ethnicity, death and language components read, in one scan.
+    '''
+    logger.info("fetching the admissions of every patient...")
+    query = f"""
+    SELECT subject_id, hadm_id, race, language, admittime, dischtime, deathtime
+    FROM {mimic_table_source("admissions")}
+    """
+    # checkpoint: read by three of the four components
+    return materialize(duckdb.sql(query), "patient_admissions")
+
+def patients_extracted() -> duckdb.DuckDBPyRelation:
+    '''
+    The columns of patients that the sex and death components read, in one scan.
+    '''
+    logger.info("fetching the patients...")
+    query = f"""
+    SELECT subject_id, gender, dod
+    FROM {mimic_table_source("patients")}
+    """
+    return materialize(duckdb.sql(query), "patient_patients")
+
+def sex_translated(patients_extracted: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
     logger.info("fetching and processing the first component of the patient table: sex/gender data...")
     # fetch sex (intended in CLIF) / gender (available in MIMIC) from mimic_patients
-    query = f"""
-    SELECT 
+    query = """
+    SELECT
         subject_id as patient_id,
         gender as sex_name,
         CASE WHEN gender = 'M' THEN 'Male'
              WHEN gender = 'F' THEN 'Female'
              ELSE NULL
         END AS sex_category
-    FROM '{mimic_table_pathfinder("patients")}'
+    FROM patients_extracted
     """
-    return duckdb.query(query).df()
+    return duckdb.sql(query)
 
-def race_ethn_translated(race_mapper: dict, ethnicity_mapper: dict) -> pd.DataFrame:
+def race_ethn_translated(
+    admissions_extracted: duckdb.DuckDBPyRelation, race_ethnicity_lookup: pd.DataFrame
+    ) -> duckdb.DuckDBPyRelation:
     logger.info("fetching and processing the second component of the patient table: race and ethnicity data...")
-    query = f"""
-    SELECT 
-        subject_id as patient_id, 
-        hadm_id as hospitalization_id,
-        race as race_name, 
-        race as ethnicity_name,
-        admittime as admittime
-    FROM '{mimic_table_pathfinder("admissions")}'
+    query = """
+    SELECT
+        a.subject_id as patient_id,
+        a.hadm_id as hospitalization_id,
+        a.race as race_name,
+        a.race as ethnicity_name,
+        a.admittime as admittime,
+        CASE WHEN a.race IS NULL THEN 'Unknown' ELSE l.race_category END AS race_category,
+        CASE WHEN a.race IS NULL THEN 'Unknown' ELSE l.ethnicity_category END AS ethnicity_category
+    FROM admissions_extracted a
+    LEFT JOIN race_ethnicity_lookup l ON a.race = l.race_name
     """
-    df = duckdb.query(query).df()
-    df["race_category"] = df["race_name"].map(race_mapper)
-    df["ethnicity_category"] = df["ethnicity_name"].map(ethnicity_mapper)
-    return df
+    return duckdb.sql(query)
 
-def race_ethn_uninformative(race_ethn_translated: pd.DataFrame) -> pd.DataFrame:
+def race_ethn_uninformative(race_ethn_translated: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
     query = """
-    SELECT 
+    SELECT
         patient_id,
         hospitalization_id,
         race_name,
@@ -187,15 +238,15 @@ def race_ethn_uninformative(race_ethn_translated: pd.DataFrame) -> pd.DataFrame:
         CASE
             WHEN (race_category IN ('Other', 'Unknown')) AND (ethnicity_category IN ('Other', 'Unknown')) THEN 1
             ELSE 0
-        END AS true_uninfo 
+        END AS true_uninfo
     FROM race_ethn_translated
     """
-    return duckdb.query(query).df()
+    return duckdb.sql(query)
 
-def race_ethn_ranked(race_ethn_uninformative: pd.DataFrame) -> pd.DataFrame:
+def race_ethn_ranked(race_ethn_uninformative: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
     query = """
-    SELECT 
-        patient_id, 
+    SELECT
+        patient_id,
         race_name,
         race_category,
         ethnicity_name,
@@ -204,21 +255,21 @@ def race_ethn_ranked(race_ethn_uninformative: pd.DataFrame) -> pd.DataFrame:
         MAX(admittime) AS most_recent,
         true_uninfo,
         ROW_NUMBER() OVER (
-            PARTITION BY patient_id 
-            ORDER BY 
-                count DESC, 
+            PARTITION BY patient_id
+            ORDER BY
+                count DESC,
                 true_uninfo,
                 most_recent DESC
-                ) 
+                )
             AS rn /* row number */
     FROM race_ethn_uninformative
     GROUP BY patient_id, race_name, race_category, ethnicity_name, ethnicity_category, true_uninfo
     """
-    return duckdb.query(query).df()
+    return duckdb.sql(query)
 
-def race_ethn_cleaned(race_ethn_ranked: pd.DataFrame) -> pd.DataFrame:
+def race_ethn_cleaned(race_ethn_ranked: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
     query = """
-    SELECT 
+    SELECT
         patient_id,
         race_name,
         race_category,
@@ -227,28 +278,31 @@ def race_ethn_cleaned(race_ethn_ranked: pd.DataFrame) -> pd.DataFrame:
     FROM race_ethn_ranked
     WHERE rn = 1
     """
-    return duckdb.query(query).df()
+    return duckdb.sql(query)
 
 @tag(property="test")
-def test_no_null_race_ethn_categories(race_ethn_cleaned: pd.DataFrame) -> bool:
-    return race_ethn_cleaned.race_category.isna().sum() == 0 and race_ethn_cleaned.ethnicity_category.isna().sum() == 0
-
-def death_extracted() -> pd.DataFrame:
-    logger.info("fetching and processing the third component: death data...")
-    q = f"""
-    SELECT DISTINCT subject_id
-        , deathtime
-        , dischtime
-        , count: COUNT(*) OVER (PARTITION BY subject_id)
-    FROM '{mimic_table_pathfinder("admissions")}' a 
-    WHERE deathtime IS NOT NULL
-    ORDER BY count DESC
+def test_no_null_race_ethn_categories(race_ethn_cleaned: duckdb.DuckDBPyRelation) -> bool:
+    query = """
+    SELECT COUNT(*) FILTER (race_category IS NULL OR ethnicity_category IS NULL) = 0
+    FROM race_ethn_cleaned
     """
-    death_from_admissions = duckdb.query(q).df()
+    return duckdb.sql(query).fetchone()[0]
 
-    q = f"""
+def death_extracted(
+    admissions_extracted: duckdb.DuckDBPyRelation, patients_extracted: duckdb.DuckDBPyRelation
+    ) -> duckdb.DuckDBPyRelation:
+    logger.info("fetching and processing the third component: death data...")
+    q = """
+    WITH death_from_admissions AS (
+        SELECT DISTINCT subject_id
+            , deathtime
+            , dischtime
+            , count: COUNT(*) OVER (PARTITION BY subject_id)
+        FROM admissions_extracted a
+        WHERE deathtime IS NOT NULL
+    )
     FROM death_from_admissions a
-    FULL JOIN '{mimic_table_pathfinder("patients")}' p USING (subject_id)
+    FULL JOIN patients_extracted p USING (subject_id)
     SELECT DISTINCT ON (patient_id) patient_id: subject_id
         , adm_deathtime: deathtime
         , pt_dod: dod
@@ -260,31 +314,38 @@ def death_extracted() -> pd.DataFrame:
     -- which in MIMIC-IV 3.1 is only an issue that applies to one patient (who died twice)
     ORDER BY count DESC, death_dttm
     """
-    death_joined = duckdb.query(q).df()
-    return death_joined
+    return duckdb.sql(q)
 
-def language_translated() -> pd.DataFrame:
+def language_translated(
+    admissions_extracted: duckdb.DuckDBPyRelation, language_lookup: pd.DataFrame
+    ) -> duckdb.DuckDBPyRelation:
     logger.info("fetching and processing the fourth component: language data...")
-    query = f"""
-    SELECT 
-        subject_id as patient_id,
-        FIRST(language) as language_name
-    FROM '{mimic_table_pathfinder("admissions")}'
-    GROUP BY subject_id
+    query = """
+    WITH language AS (
+        SELECT
+            subject_id as patient_id,
+            FIRST(language) as language_name
+        FROM admissions_extracted
+        GROUP BY subject_id
+    )
+    SELECT
+        patient_id,
+        language_name,
+        CASE WHEN language_name IS NULL THEN 'Unknown or NA' ELSE l.language_category END AS language_category
+    FROM language
+    LEFT JOIN language_lookup l USING (language_name)
     """
-    df = duckdb.query(query).df()
-    df["language_category"] = df["language_name"].map(LANGUAGE_MAPPER)
-    return df
+    return duckdb.sql(query)
 
 def merged(
-    race_ethn_cleaned: pd.DataFrame, 
-    sex_translated: pd.DataFrame, 
-    death_extracted: pd.DataFrame, 
-    language_translated: pd.DataFrame
-    ) -> pd.DataFrame:
+    race_ethn_cleaned: duckdb.DuckDBPyRelation,
+    sex_translated: duckdb.DuckDBPyRelation,
+    death_extracted: duckdb.DuckDBPyRelation,
+    language_translated: duckdb.DuckDBPyRelation
+    ) -> duckdb.DuckDBPyRelation:
     logger.info("merging the four components...")
     query = """
-    SELECT 
+    SELECT
         CAST(patient_id AS string) as patient_id,
         race_name,
         COALESCE(race_category, 'Unknown') as race_category,
@@ -292,8 +353,8 @@ def merged(
         COALESCE(ethnicity_category, 'Unknown') as ethnicity_category,
         sex_name,
         COALESCE(sex_category, 'Unknown') as sex_category,
-        CAST(NULL AS date) as birth_date,
-        CAST(death_dttm AS timestamp) as death_dttm,
+        CAST(NULL AS timestamp) as birth_date,
+        mimic_to_utc(CAST(death_dttm AS timestamp)) as death_dttm,
         language_name,
         COALESCE(language_category, 'Unknown or NA') as language_category
     FROM race_ethn_cleaned as race
@@ -301,20 +362,18 @@ def merged(
     FULL JOIN death_extracted as death USING (patient_id)
     FULL JOIN language_translated as language USING (patient_id)
     """
-    df = duckdb.query(query).df()
-    df["death_dttm"] = convert_tz_to_utc(df["death_dttm"])
-    return df
+    return duckdb.sql(query)
 
 @tag(property="final")
-def duplicates_removed(merged: pd.DataFrame) -> pd.DataFrame:
-    return merged.drop_duplicates()
+def duplicates_removed(merged: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
+    # left lazy so that `save` streams it to parquet
+    return merged.distinct()
 
 @tag(property="test")
-def schema_tested(duplicates_removed: pd.DataFrame) -> bool | pa.errors.SchemaErrors:
+def schema_tested(duplicates_removed: duckdb.DuckDBPyRelation) -> bool | pa.errors.SchemaErrors:
     logger.info("testing schema...")
-    df = duplicates_removed
     try:
-        CLIF_PATIENT_SCHEMA.validate(df, lazy=True)
+        validate_clif_table(CLIF_PATIENT_SCHEMA, duplicates_removed)
         return True
     except pa.errors.SchemaErrors as exc:
         logger.error(json.dumps(exc.message, indent=2))
@@ -325,24 +384,26 @@ def schema_tested(duplicates_removed: pd.DataFrame) -> bool | pa.errors.SchemaEr
         return exc
 
 @datasaver()
-def save(duplicates_removed: pd.DataFrame) -> dict:
+def save(duplicates_removed: duckdb.DuckDBPyRelation) -> dict:
     save_to_rclif(duplicates_removed, "patient")
     logger.info("output saved to a parquet file, everything completed for the patient table!")
-    
+
     metadata = {
         "table_name": "patient"
     }
-    
+
     return metadata
 
 def _main():
     logger.info("starting to build clif patient table -- ")
     from hamilton import driver
+    from src.node_manifest import NodeManifestAdapter
+    from src.node_cache import node_cache_adapters
     import src.tables.patient as patient
     dr = (
         driver.Builder()
         .with_modules(patient)
-        # .with_cache()
+        .with_adapters(NodeManifestAdapter("patient"), *node_cache_adapters(patient))
         .build()
     )
     dr.execute(["save"])
@@ -350,10 +411,13 @@ def _main():
 def _test():
     logger.info("testing all...")
     from hamilton import driver
+    from src.node_manifest import NodeManifestAdapter
+    from src.node_cache import node_cache_adapters
     import src.tables.patient as patient
     dr = (
         driver.Builder()
         .with_modules(patient)
+        .with_adapters(NodeManifestAdapter("patient_test"), *node_cache_adapters(patient))
         .build()
     )
     all_nodes = dr.list_available_variables()
@@ -9,10 +9,10 @@ from src.logging_config import setup_logging, get_logger
 logger = get_logger('tables.patient_assessments')
 import src.utils
 # reload(src.utils)
-from src.utils import construct_mapper_dict, fetch_mimic_events, load_mapping_csv, \
-    get_relevant_item_ids, find_duplicates, rename_and_reorder_cols, save_to_rclif, \
-    convert_and_sort_datetime, con, REPO_ROOT, mimic_table_pathfinder, \
-    convert_tz_to_utc
+from src.utils import construct_mapper_dict, load_mapping_csv, \
+    get_relevant_item_ids, find_duplicates, save_to_rclif, REPO_ROOT, mimic_table_source, \
+    mimic_events_source, mimic_table_pathfinder, mcide_pathfinder, materialize, validate_clif_table
+from src.fingerprint import track_input
 from hamilton.function_modifiers import tag, datasaver, config, cache, dataloader
 import pandera.pandas as pa
 from pandera.dtypes import Float32
@@ -36,72 +36,110 @@ PA_SCHEMA = pa.DataFrameSchema(
     }
 )
 
-def hadmid_to_stayid() -> pd.DataFrame:
-    query = f"""
-    SELECT DISTINCT
-        hadm_id, stay_id
-    FROM '{mimic_table_pathfinder("icustays")}'
+# 223900 = verbal, 223901 = motor, 220739 = eyes
+GCS_ITEM_IDS = [223900, 223901, 220739]
+RASS_ITEM_IDS = [228096]
+BRADEN_ITEM_IDS = [224054, 224055, 224056, 224057, 224058, 224059]
+CAM_ITEM_IDS = [228300, 228337, 229326, 228301, 228336, 229325, 228302, 228334, 228303, 228335, 229324]
+SBT_ITEM_IDS = [224717, 224833, 224716]
+
+def _chartevents_item_ids() -> list[int]:
+    return GCS_ITEM_IDS + RASS_ITEM_IDS + BRADEN_ITEM_IDS + CAM_ITEM_IDS + SBT_ITEM_IDS
+
+def _in(item_ids: list[int]) -> str:
+    return f"itemid IN ({','.join(map(str, item_ids))})"
+
+def assessment_events() -> duckdb.DuckDBPyRelation:
+    '''
+    The events of all the assessment items, from a single scan of chartevents, which the GCS, RASS, Braden,
+    CAM and SBT nodes then filter by their items.
+    '''
+    logger.info("extracting the events of all the assessment items from chartevents in a single pass...")
+    item_ids = _chartevents_item_ids()
+    source = mimic_table_source(
+        "chartevents", mimic_events_source("chartevents", item_ids), source_order=True
+    )
+    q = f"""
+    FROM {source} e
+    LEFT JOIN '{mimic_table_pathfinder("d_items")}' d USING (itemid)
+    SELECT e.itemid, d.label, e.subject_id, e.hadm_id, e.stay_id, e.charttime, time: e.charttime
+        , e.value, e.valuenum, e.valueuom, event_order: e.source_order
+    WHERE e.{_in(item_ids)}
     """
-    return con.execute(query).fetchdf()
+    # checkpoint: read by every assessment below
+    return materialize(duckdb.sql(q), "patient_assessments_events")
 
-def gcs_fetched(hadmid_to_stayid: pd.DataFrame) -> pd.DataFrame:
+def gcs_fetched(assessment_events: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
     logger.info("executing official MIMIC script to fetch GCS data...")
     gcs_sql_path = REPO_ROOT / 'src/tables/patient_assessments_gcs.sql'
-    with open(str(gcs_sql_path), 'r') as file:
+    with open(str(track_input(gcs_sql_path)), 'r') as file:
         gcs_sql_script = file.read()
-    query = gcs_sql_script.format(chartevents = mimic_table_pathfinder("chartevents"))
-    gcs = con.execute(query).fetchdf()
-    
     logger.info("pivoting and cleaning GCS data...")
-    gcs_c = pd.merge(
-        gcs, hadmid_to_stayid, on = "stay_id", how = "left"
-    )
-    gcs_cl = pd.melt(
-        gcs_c, id_vars = ["subject_id", "hadm_id", "charttime"], 
-        value_vars = ["gcs", "gcs_motor", "gcs_verbal", "gcs_eyes"],
-        var_name = "assessment_name", value_name = "numerical_value")
-    gcs_cl["assessment_category"] = np.where(
-        gcs_cl["assessment_name"].isin(["gcs", "gcs_eyes"]),
-        gcs_cl["assessment_name"].map({"gcs": "gcs_total", "gcs_eyes": "gcs_eye"}),
-        gcs_cl["assessment_name"]
+    q = f"""
+    WITH gcs AS (
+        {gcs_sql_script.format(chartevents = "assessment_events")}
+    ), stays AS (
+        -- the admission of each ICU stay, as recorded on its events
+        FROM assessment_events
+        SELECT stay_id, hadm_id: max(hadm_id)
+        WHERE {_in(GCS_ITEM_IDS)}
+        GROUP BY stay_id
+    ), gcs_w AS (
+        FROM gcs JOIN stays USING (stay_id)
+        SELECT hadm_id, charttime, gcs, gcs_motor, gcs_verbal, gcs_eyes
+        WHERE hadm_id IS NOT NULL
     )
-    gcs_cl.dropna(subset = ["hadm_id"], inplace = True)
-    gcs_cl["hadm_id"] = gcs_cl["hadm_id"].astype(int).astype("string")
-    gcs_clf = rename_and_reorder_cols(gcs_cl, {"charttime": "recorded_dttm"}, PA_COL_NAMES)
-    return gcs_clf
-
+    FROM gcs_w
+    UNPIVOT INCLUDE NULLS (numerical_value FOR assessment_name IN (gcs, gcs_motor, gcs_verbal, gcs_eyes))
+    SELECT hospitalization_id: hadm_id
+        , recorded_dttm: charttime
+        , assessment_name
+        , assessment_category: CASE assessment_name
+            WHEN 'gcs' THEN 'gcs_total'
+            WHEN 'gcs_eyes' THEN 'gcs_eye'
+            ELSE assessment_name END
+        , numerical_value: CAST(numerical_value AS DOUBLE)
+    """
+    return duckdb.sql(q)
 
-def rass_fetched() -> pd.DataFrame:
+def rass_fetched(assessment_events: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
+    '''
+    The score is the leading number of the value, e.g. "-2 Light sedation". The first of the same
+    score recorded at the same time is kept.
+    '''
     logger.info("fetching RASS data...")
-    rass_events = fetch_mimic_events([228096])
-    rass_events = convert_and_sort_datetime(rass_events)
-    rass_events['numerical_value'] = rass_events['value'].str.slice(0,3).astype(float)
-    rass_events["assessment_name"] = "Richmond-RAS Scale"
-    rass_events["assessment_category"] = "RASS"
-    rass_events_clean = rename_and_reorder_cols(
-        df = rass_events, 
-        rename_mapper_dict = {
-            "time": "recorded_dttm", "value": "text_value"
-        }, 
-        new_col_order = PA_COL_NAMES
-    )
-    rass_events_clean.drop_duplicates(
-        subset=["hospitalization_id", "recorded_dttm", "assessment_category", "numerical_value"], inplace = True)
-    return rass_events_clean
+    q = f"""
+    FROM assessment_events
+    SELECT DISTINCT ON (hadm_id, time, numerical_value)
+        hospitalization_id: hadm_id
+        , recorded_dttm: time
+        , assessment_name: 'Richmond-RAS Scale'
+        , assessment_category: 'RASS'
+        , numerical_value: CAST(trim(value[1:3]) AS DOUBLE)
+        , text_value: value
+    WHERE {_in(RASS_ITEM_IDS)}
+    ORDER BY hadm_id, time, numerical_value, event_order
+    """
+    return duckdb.sql(q)
 
-def braden_fetched() -> pd.DataFrame:
+def braden_fetched(assessment_events: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
     logger.info("fetching Braden data...")
-    braden = fetch_mimic_events([224054, 224055, 224056, 224057, 224058, 224059])
-    query = f"""
-    PIVOT braden
-    ON label
-    USING FIRST(value)
+    braden_w = duckdb.sql(f"""
+    PIVOT (
+        FROM assessment_events
+        SELECT hadm_id, time, label, value, event_order
+        WHERE {_in(BRADEN_ITEM_IDS)}
+    )
+    ON label IN (
+        'Braden Activity', 'Braden Friction/Shear', 'Braden Mobility',
+        'Braden Moisture', 'Braden Nutrition', 'Braden Sensory Perception'
+    )
+    USING arg_min(value, event_order)
     GROUP BY hadm_id, time
-    """
-    braden_w = con.execute(query).fetchdf()
+    """)
     query = f"""
     SELECT
-        hadm_id, time, 
+        hadm_id, time,
         CASE
             WHEN "Braden Activity" = 'Bedfast' THEN 1
             WHEN "Braden Activity" = 'Chairfast' THEN 2
@@ -146,16 +184,16 @@ def braden_fetched() -> pd.DataFrame:
         (braden_activity + braden_friction + braden_mobility + braden_moisture + braden_nutrition + braden_sensory) AS braden_total
     FROM braden_w
     """
-    braden_wc = con.execute(query).fetchdf()
+    braden_wc = duckdb.sql(query)
     # unpivot (from wide to long) for the numerical values
     query = f"""
     UNPIVOT braden_wc
     ON COLUMNS('braden_')
     INTO
         NAME assessment_category
-        VALUE numerical_value;
+        VALUE numerical_value
     """
-    braden_wcl = con.execute(query).fetchdf()
+    braden_wcl = duckdb.sql(query)
     # unpivot (from wide to long) for the *categorical* values
     query = f"""
     UNPIVOT (
@@ -172,11 +210,10 @@ def braden_fetched() -> pd.DataFrame:
     ON COLUMNS('braden_')
     INTO
         NAME assessment_category
-        VALUE categorical_value;
+        VALUE categorical_value
     """
-    braden_wl = con.execute(query).fetchdf()
+    braden_wl = duckdb.sql(query)
     # merging numerical_value and categorical_value
-    braden_m = pd.merge(braden_wcl, braden_wl, on=["hadm_id", "time", "assessment_category"], how="outer")
     query = f"""
     SELECT
         hadm_id as hospitalization_id,
@@ -194,39 +231,40 @@ def braden_fetched() -> pd.DataFrame:
         assessment_category,
         numerical_value,
         categorical_value
-    FROM braden_m
+    FROM braden_wcl
+    FULL JOIN braden_wl USING (hadm_id, time, assessment_category)
     """
-    braden_mf = con.execute(query).fetchdf()
-    return braden_mf
+    return duckdb.sql(query)
 
-def cam_extracted() -> pd.DataFrame:
+def cam_extracted(assessment_events: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
     logger.info("fetching CAM data...")
-    return fetch_mimic_events(
-        [228300, 228337, 229326, 228301, 228336, 229325, 228302, 228334, 228303, 228335, 229324]
-    )
+    return duckdb.sql(f"FROM assessment_events WHERE {_in(CAM_ITEM_IDS)}")
 
-def cam_wide(cam_extracted: pd.DataFrame) -> pd.DataFrame:
+def cam_wide(cam_extracted: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
     query = f"""
     PIVOT (
         SELECT
             hadm_id, time,
-            itemid,
             CASE
                 WHEN itemid = 228300 THEN 'CAM-ICU MS Change'
                 ELSE label
             END AS label,
-            value
+            value,
+            event_order
         FROM cam_extracted
     )
-    ON label
-    USING FIRST(value)
+    ON label IN (
+        'CAM-ICU MS Change', 'CAM-ICU Inattention', 'CAM-ICU Disorganized thinking',
+        'CAM-ICU Altered LOC', 'CAM-ICU RASS LOC'
+    )
+    USING arg_min(value, event_order)
     GROUP BY hadm_id, time
     """
-    return con.execute(query).fetchdf()
+    return duckdb.sql(query)
 
-def cam_total_computed(cam_wide: pd.DataFrame) -> pd.DataFrame:
+def cam_total_computed(cam_wide: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
     '''
-    delirious = Yes if 
+    delirious = Yes if
     (mental = True) AND (inattention = True) AND (LOC OR thinking = True)
     which implies that delirious = No
     if mental = False OR inattention = False OR (LOC = False AND thinking = False)
@@ -236,22 +274,22 @@ def cam_total_computed(cam_wide: pd.DataFrame) -> pd.DataFrame:
         hadm_id, time, COLUMNS('CAM-ICU'),
         coalesce("CAM-ICU Altered LOC", "CAM-ICU RASS LOC") AS loc,
         CASE
-            WHEN ("CAM-ICU MS Change" LIKE '%Yes%') 
-                AND ("CAM-ICU Inattention" LIKE '%Yes%') 
+            WHEN ("CAM-ICU MS Change" LIKE '%Yes%')
+                AND ("CAM-ICU Inattention" LIKE '%Yes%')
                 AND (("CAM-ICU Disorganized thinking" LIKE '%Yes%') OR (loc LIKE '%Yes%'))
                 THEN 'Positive'
-            WHEN ("CAM-ICU MS Change" LIKE '%No%') 
-                OR ("CAM-ICU Inattention" LIKE '%No%') 
+            WHEN ("CAM-ICU MS Change" LIKE '%No%')
+                OR ("CAM-ICU Inattention" LIKE '%No%')
                 OR (("CAM-ICU Disorganized thinking" LIKE '%No%') AND (loc LIKE '%No%'))
                 THEN 'Negative'
-            ELSE NULL   
+            ELSE NULL
             END AS cam_total
     FROM cam_wide
     """
-    return con.execute(query).fetchdf()
- 
-def cam_long(cam_total_computed: pd.DataFrame) -> pd.DataFrame:
-    # unpivot (from wide to long) 
+    return duckdb.sql(query)
+
+def cam_long(cam_total_computed: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
+    # unpivot (from wide to long)
     query = f"""
     UNPIVOT (
         SELECT
@@ -261,11 +299,11 @@ def cam_long(cam_total_computed: pd.DataFrame) -> pd.DataFrame:
     ON COLUMNS('CAM-ICU|cam')
     INTO
         NAME assessment_name
-        VALUE categorical_value;
+        VALUE categorical_value
     """
-    return con.execute(query).fetchdf()
+    return duckdb.sql(query)
 
-def cam_fetched(cam_long: pd.DataFrame) -> pd.DataFrame:
+def cam_fetched(cam_long: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
     query = f"""
     SELECT
         hadm_id as hospitalization_id,
@@ -285,40 +323,35 @@ def cam_fetched(cam_long: pd.DataFrame) -> pd.DataFrame:
         categorical_value
     FROM cam_long
     """
-    return con.execute(query).fetchdf()
-    
-def gcs_raw_fetched() -> pd.DataFrame:
+    return duckdb.sql(query)
+
+def gcs_raw_fetched(assessment_events: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
     """Fetches raw GCS events without imputation."""
     logger.info("fetching raw GCS data (no imputation)...")
-    raw_gcs_mapper = {
-        '223900': 'gcs_verbal',
-        '223901': 'gcs_motor',
-        '220739': 'gcs_eyes'
-    }
-    raw_gcs_mapper_df = pd.DataFrame(
-        list(raw_gcs_mapper.items()), columns=['itemid', 'assessment_category']
-    )
-    raw_gcs_events = fetch_mimic_events(list(raw_gcs_mapper.keys()))
-    query = """
-    FROM raw_gcs_events e
-    LEFT JOIN raw_gcs_mapper_df m USING (itemid)
+    query = f"""
+    FROM assessment_events e
     SELECT
         -- DuckDB column alias syntax
         hospitalization_id: e.hadm_id::VARCHAR
         , recorded_dttm: e.time::TIMESTAMP
         , assessment_name: e.label
-        , assessment_category: m.assessment_category
+        , assessment_category: CASE e.itemid
+            WHEN 223900 THEN 'gcs_verbal'
+            WHEN 223901 THEN 'gcs_motor'
+            WHEN 220739 THEN 'gcs_eyes'
+            END
         , assessment_group: 'Neurological'
         , numerical_value: CASE
             WHEN e.value = 'No Response-ETT' THEN NULL -- UPDATED from 0 to NULL
             ELSE e.valuenum::FLOAT
             END
         , categorical_value: e.value
-        , text_value: NULL
+        , text_value: NULL::VARCHAR
+    WHERE e.{_in(GCS_ITEM_IDS)}
     """
-    return con.execute(query).fetchdf()
+    return duckdb.sql(query)
 
-def gcs_raw_total_computed(gcs_raw_fetched: pd.DataFrame) -> pd.DataFrame:
+def gcs_raw_total_computed(gcs_raw_fetched: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
     """
     Pivots raw GCS sub-scores to wide, computes total, unions back with sub-scores.
     NOTE: this node is not used in the latest version as we want to present the GCS scores in its rawest form which does not have the total computed.
@@ -330,7 +363,7 @@ def gcs_raw_total_computed(gcs_raw_fetched: pd.DataFrame) -> pd.DataFrame:
             FROM gcs_raw_fetched
             SELECT hospitalization_id, recorded_dttm, assessment_category, numerical_value
         )
-        ON assessment_category
+        ON assessment_category IN ('gcs_eyes', 'gcs_verbal', 'gcs_motor')
         USING MAX(numerical_value)
     )
     -- gcs_total rows
@@ -350,20 +383,20 @@ def gcs_raw_total_computed(gcs_raw_fetched: pd.DataFrame) -> pd.DataFrame:
     FROM gcs_raw_fetched
     SELECT *
     """
-    return con.execute(query).fetchdf()
+    return duckdb.sql(query)
 
-def gcs_raw_cleaned(gcs_raw_fetched: pd.DataFrame) -> pd.DataFrame:
+def gcs_raw_cleaned(gcs_raw_fetched: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
     """Cleans and formats raw GCS data for output."""
     logger.info("cleaning raw GCS data...")
-    df = gcs_raw_fetched.copy()
-    df["hospitalization_id"] = df["hospitalization_id"].astype("string")
-    df["categorical_value"] = df["categorical_value"].astype("string")
-    df["recorded_dttm"] = pd.to_datetime(df["recorded_dttm"])
-    df["recorded_dttm"] = convert_tz_to_utc(df["recorded_dttm"])
-    return df
+    query = """
+    FROM gcs_raw_fetched
+    SELECT * REPLACE (mimic_to_utc(recorded_dttm) AS recorded_dttm)
+    """
+    # left lazy so that `save_raw_gcs` streams it to parquet
+    return duckdb.sql(query)
 
 @datasaver()
-def save_raw_gcs(gcs_raw_cleaned: pd.DataFrame) -> dict:
+def save_raw_gcs(gcs_raw_cleaned: duckdb.DuckDBPyRelation) -> dict:
     logger.info("saving raw GCS to rclif...")
     save_to_rclif(gcs_raw_cleaned, "patient_assessments_raw_gcs")
     metadata = {
@@ -379,16 +412,17 @@ def sbt_id_to_category_mapper() -> dict:
         224716: "sbt_fail_reason"
     }
 
-def sbt_extracted() -> pd.DataFrame:
+def sbt_extracted(assessment_events: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
     logger.info("fetching SBT data...")
-    return fetch_mimic_events([224717, 224833, 224716]) 
+    return duckdb.sql(f"FROM assessment_events WHERE {_in(SBT_ITEM_IDS)}")
 
-def sbt_translated(sbt_id_to_category_mapper: dict, sbt_extracted: pd.DataFrame) -> pd.DataFrame:
-    return sbt_extracted.assign(
-        assessment_category = lambda x: x["itemid"].map(sbt_id_to_category_mapper)
+def sbt_translated(sbt_id_to_category_mapper: dict, sbt_extracted: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
+    categories = " ".join(
+        f"WHEN {item_id} THEN '{category}'" for item_id, category in sbt_id_to_category_mapper.items()
     )
-   
-def sbt_fetched(sbt_translated: pd.DataFrame) -> pd.DataFrame:
+    return duckdb.sql(f"FROM sbt_extracted SELECT *, assessment_category: CASE itemid {categories} END")
+
+def sbt_fetched(sbt_translated: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
     query = f"""
     SELECT
         CAST(hadm_id as VARCHAR) as hospitalization_id,
@@ -396,37 +430,38 @@ def sbt_fetched(sbt_translated: pd.DataFrame) -> pd.DataFrame:
         label as assessment_name,
         assessment_category,
         CAST(NULL as FLOAT) as numerical_value,
-        CASE WHEN assessment_category = 'sbt_delivery_pass_fail' 
-            THEN (CASE WHEN value = 'Yes' THEN 'Pass' 
-                WHEN value = 'No' THEN 'Fail' 
-                ELSE NULL END) 
+        CASE WHEN assessment_category = 'sbt_delivery_pass_fail'
+            THEN (CASE WHEN value = 'Yes' THEN 'Pass'
+                WHEN value = 'No' THEN 'Fail'
+                ELSE NULL END)
             ELSE NULL
             END AS categorical_value,
-        CASE WHEN assessment_category = 'sbt_fail_reason' 
+        CASE WHEN assessment_category = 'sbt_fail_reason'
             THEN value ELSE NULL
             END AS text_value
     FROM sbt_translated
     """
-    return con.execute(query).fetchdf()
+    return duckdb.sql(query)
 
 @tag(property="test")
-def sbt_tested(sbt_fetched: pd.DataFrame) -> bool | pa.errors.SchemaErrors:
+def sbt_tested(sbt_fetched: duckdb.DuckDBPyRelation) -> bool | pa.errors.SchemaErrors:
     assessment_category_schema = pa.SeriesSchema(
-        str, 
-        checks=[pa.Check.unique_values_eq(['sbt_delivery_pass_fail', 'sbt_fail_reason'])], 
+        str,
+        checks=[pa.Check.unique_values_eq(['sbt_delivery_pass_fail', 'sbt_fail_reason'])],
         nullable=False
     )
-    
+
     categorical_value_schema = pa.SeriesSchema(
-        str, 
-        checks=[pa.Check.unique_values_eq(['Pass', 'Fail'])], 
+        str,
+        checks=[pa.Check.unique_values_eq(['Pass', 'Fail'])],
         nullable=True
     )
-    
+
     logger.info("testing schema...")
+    sbt = sbt_fetched.select("assessment_category, categorical_value").df()
     try:
-        assessment_category_schema.validate(sbt_fetched["assessment_category"], lazy=True)
-        categorical_value_schema.validate(sbt_fetched["categorical_value"], lazy=True)
+        assessment_category_schema.validate(sbt["assessment_category"], lazy=True)
+        categorical_value_schema.validate(sbt["categorical_value"], lazy=True)
         return True
     except pa.errors.SchemaErrors as exc:
         logger.error(json.dumps(exc.message, indent=2))
@@ -435,36 +470,48 @@ def sbt_tested(sbt_fetched: pd.DataFrame) -> bool | pa.errors.SchemaErrors:
         logger.error("\nDataFrame object that failed validation:")
         logger.error(exc.data)
         return exc
- 
-def pa_category_to_group_mapper() -> dict:
-    pa_mcide_mapping = pd.read_csv("data/mcide/clif_patient_assessment_categories.csv")
-    pa_category_to_group_mapper = dict(
-        zip(pa_mcide_mapping["assessment_category"], pa_mcide_mapping["assessment_group"]))
-    return pa_category_to_group_mapper
+
+def pa_category_to_group_mapping() -> pd.DataFrame:
+    pa_mcide_mapping = pd.read_csv(mcide_pathfinder("clif_patient_assessment_categories"))
+    return pa_mcide_mapping[["assessment_category", "assessment_group"]] \
+        .drop_duplicates("assessment_category", keep="last")
 
 @tag(property="final")
 def merged_and_cleaned(
-    pa_category_to_group_mapper: dict,
-    gcs_fetched: pd.DataFrame, 
-    rass_fetched: pd.DataFrame, 
-    braden_fetched: pd.DataFrame, 
-    cam_fetched: pd.DataFrame, 
-    sbt_fetched: pd.DataFrame) -> pd.DataFrame:
-    logger.info("merging all of the above...")
-    df = pd.concat([gcs_fetched, rass_fetched, braden_fetched, cam_fetched, sbt_fetched])
-    logger.info("converting column dtypes...")
-    df["hospitalization_id"] = df["hospitalization_id"].astype("string")
-    df["categorical_value"] = df["categorical_value"].astype("string")
-    df["recorded_dttm"] = pd.to_datetime(df["recorded_dttm"])
-    df["recorded_dttm"] = convert_tz_to_utc(df["recorded_dttm"])
-    df["assessment_group"] = df["assessment_category"].map(pa_category_to_group_mapper)
-    return df
+    pa_category_to_group_mapping: pd.DataFrame,
+    gcs_fetched: duckdb.DuckDBPyRelation,
+    rass_fetched: duckdb.DuckDBPyRelation,
+    braden_fetched: duckdb.DuckDBPyRelation,
+    cam_fetched: duckdb.DuckDBPyRelation,
+    sbt_fetched: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
+    logger.info("merging all of the above and converting column dtypes...")
+    query = """
+    WITH merged AS (
+        FROM gcs_fetched
+        UNION ALL BY NAME FROM rass_fetched
+        UNION ALL BY NAME FROM braden_fetched
+        UNION ALL BY NAME FROM cam_fetched
+        UNION ALL BY NAME FROM sbt_fetched
+    )
+    FROM merged
+    LEFT JOIN pa_category_to_group_mapping m USING (assessment_category)
+    SELECT hospitalization_id: CAST(hospitalization_id AS VARCHAR)
+        , recorded_dttm: mimic_to_utc(CAST(recorded_dttm AS TIMESTAMP))
+        , assessment_name: CAST(assessment_name AS VARCHAR)
+        , assessment_category: CAST(assessment_category AS VARCHAR)
+        , assessment_group: CAST(m.assessment_group AS VARCHAR)
+        , numerical_value: CAST(numerical_value AS DOUBLE)
+        , categorical_value: CAST(categorical_value AS VARCHAR)
+        , text_value: CAST(text_value AS VARCHAR)
+    """
+    # left lazy so that `save` streams it to parquet
+    return duckdb.sql(query)
 
 @tag(property="test")
-def schema_tested(merged_and_cleaned: pd.DataFrame) -> bool | pa.errors.SchemaErrors:
+def schema_tested(merged_and_cleaned: duckdb.DuckDBPyRelation) -> bool | pa.errors.SchemaErrors:
     logger.info("testing schema...")
     try:
-        PA_SCHEMA.validate(merged_and_cleaned, lazy=True)
+        validate_clif_table(PA_SCHEMA, merged_and_cleaned)
         return True
     except pa.errors.SchemaErrors as exc:
         logger.error(json.dumps(exc.message, indent=2))
@@ -473,27 +520,29 @@ def schema_tested(merged_and_cleaned: pd.DataFrame) -> bool | pa.errors.SchemaEr
         logger.error("\nDataFrame object that failed validation:")
         logger.error(exc.data)
         return exc
-    
+
 @datasaver()
-def save(merged_and_cleaned: pd.DataFrame) -> dict:
+def save(merged_and_cleaned: duckdb.DuckDBPyRelation) -> dict:
     logger.info("saving to rclif...")
     save_to_rclif(merged_and_cleaned, "patient_assessments")
-    
+
     metadata = {
         "table_name": "patient_assessments"
     }
-    
+
     logger.info("output saved to a parquet file, everything completed for the patient assessments table!")
     return metadata
 
 def _main():
     logger.info("starting to build clif patient assessments table -- ")
     from hamilton import driver
+    from src.node_manifest import NodeManifestAdapter
+    from src.node_cache import node_cache_adapters
     import src.tables.patient_assessments as patient_assessments
     dr = (
         driver.Builder()
         .with_modules(patient_assessments)
-        # .with_cache()
+        .with_adapters(NodeManifestAdapter("patient_assessments"), *node_cache_adapters(patient_assessments))
         .build()
     )
     dr.execute(["save", "save_raw_gcs"])
@@ -501,10 +550,13 @@ def _main():
 def _test():
     logger.info("testing all...")
     from hamilton import driver
+    from src.node_manifest import NodeManifestAdapter
+    from src.node_cache import node_cache_adapters
     import src.tables.patient_assessments as patient_assessments
     dr = (
         driver.Builder()
         .with_modules(patient_assessments)
+        .with_adapters(NodeManifestAdapter("patient_assessments_test"), *node_cache_adapters(patient_assessments))
         .build()
     )
     all_nodes = dr.list_available_variables()
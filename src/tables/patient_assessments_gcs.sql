@@ -18,7 +18,7 @@ WITH base AS (
     MAX(CASE WHEN ce.itemid = 220739 THEN ce.valuenum ELSE NULL END) AS gcseyes,
     MAX(CASE WHEN ce.itemid = 223900 AND ce.value = 'No Response-ETT' THEN 1 ELSE 0 END) AS endotrachflag,
     ROW_NUMBER() OVER (PARTITION BY ce.stay_id ORDER BY ce.charttime ASC NULLS FIRST) AS rn
-  FROM '{chartevents}' AS ce
+  FROM {chartevents} AS ce
   WHERE
     ce.itemid IN (223900, 223901, 220739)
   GROUP BY
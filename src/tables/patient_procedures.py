@@ -23,9 +23,8 @@ from src.utils import (
     rename_and_reorder_cols,
     save_to_rclif,
     convert_and_sort_datetime,
-    convert_tz_to_utc,
     CLIF_DTTM_FORMAT,
-    mimic_table_pathfinder
+    mimic_table_source
 )
 
 from src.utils_qa import all_null_check
@@ -49,7 +48,7 @@ COLUMN_NAMES: List[str] = list(SCHEMA.columns.keys())
 def extracted_and_mapped_icd_codes() -> pd.DataFrame:
     logger.info("extracting and mapping the ICD codes from MIMIC's `procedures_icd` table...")
     q = f"""
-    FROM '{mimic_table_pathfinder("procedures_icd")}' i
+    FROM {mimic_table_source("procedures_icd")} i
     SELECT hospitalization_id: CAST(i.hadm_id AS VARCHAR)
         , billing_provider_id: CAST(NULL AS VARCHAR)
         , performing_provider_id: CAST(NULL AS VARCHAR)
@@ -58,14 +57,14 @@ def extracted_and_mapped_icd_codes() -> pd.DataFrame:
             WHEN icd_version in (10, '10') THEN 'ICD10PCS'
             WHEN icd_version in (9, '9') THEN 'ICD9'
             END
-        , procedure_billed_dttm: CAST(i.chartdate AS TIMESTAMP)
+        , procedure_billed_dttm: mimic_to_utc(CAST(i.chartdate AS TIMESTAMP))
     """
     return duckdb.query(q).df()
 
 def extracted_and_mapped_cpt_hcpcs_codes() -> pd.DataFrame:
     logger.info("extracting and mapping the CPT/HCPCS codes from MIMIC's `hcpcsevents` table...")
     q = f"""
-    FROM '{mimic_table_pathfinder("hcpcsevents")}' h
+    FROM {mimic_table_source("hcpcsevents")} h
     SELECT hospitalization_id: CAST(h.hadm_id AS VARCHAR)
         , billing_provider_id: CAST(NULL AS VARCHAR)
         , performing_provider_id: CAST(NULL AS VARCHAR)
@@ -79,7 +78,7 @@ def extracted_and_mapped_cpt_hcpcs_codes() -> pd.DataFrame:
             WHEN _procedure_code_format in ('cpt_level_1', 'cpt_category_2_3') THEN 'CPT'
             WHEN _procedure_code_format = 'hcpcs_level_2' THEN 'HCPCS'
             END
-        , procedure_billed_dttm: CAST(h.chartdate AS TIMESTAMP)
+        , procedure_billed_dttm: mimic_to_utc(CAST(h.chartdate AS TIMESTAMP))
     """
     return duckdb.query(q).df()
 
@@ -99,9 +98,7 @@ def concated(
     -- exclude columns that start with underscore
     SELECT COLUMNS('^[^_].*')
     """
-    df = duckdb.query(q).df()
-    df["procedure_billed_dttm"] = convert_tz_to_utc(df["procedure_billed_dttm"])
-    return df
+    return duckdb.query(q).df()
 
 @tag(property="test")
 def schema_tested(concated: pd.DataFrame) -> bool | pa.errors.SchemaErrors:
@@ -131,11 +128,13 @@ def save(concated: pd.DataFrame) -> dict:
 def _main():
     logger.info("starting to build clif patient procedures table -- ")
     from hamilton import driver
+    from src.node_manifest import NodeManifestAdapter
+    from src.node_cache import node_cache_adapters
     import src.tables.patient_procedures as patient_procedures
     dr = (
         driver.Builder()
         .with_modules(patient_procedures)
-        # .with_cache()
+        .with_adapters(NodeManifestAdapter("patient_procedures"), *node_cache_adapters(patient_procedures))
         .build()
     )
     dr.execute(["save"])
@@ -143,10 +142,13 @@ def _main():
 def _test():
     logger.info("testing all...")
     from hamilton import driver
+    from src.node_manifest import NodeManifestAdapter
+    from src.node_cache import node_cache_adapters
     import src.tables.patient_procedures as patient_procedures
     dr = (
         driver.Builder()
         .with_modules(patient_procedures)
+        .with_adapters(NodeManifestAdapter("patient_procedures_test"), *node_cache_adapters(patient_procedures))
         .build()
     )
     all_nodes = dr.list_available_variables()
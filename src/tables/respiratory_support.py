@@ -13,14 +13,14 @@ import json
 
 from src.utils import (
     construct_mapper_dict,
-    fetch_mimic_events,
     load_mapping_csv,
     get_relevant_item_ids,
-    find_duplicates,
     rename_and_reorder_cols,
+    cumulative_or,
     save_to_rclif,
-    convert_and_sort_datetime,
-    convert_tz_to_utc,
+    mimic_table_pathfinder,
+    mimic_table_source,
+    mimic_events_source,
 )
 
 RESP_DEVICE_RANK = [
@@ -129,223 +129,203 @@ def mimic_item_ids(resp_mapping: pd.DataFrame) -> pd.Series:
         decision_col="variable"
     )
 
-def extracted_mimic_events(mimic_item_ids: pd.Series) -> pd.DataFrame:
+def _chartevents_item_ids() -> list[int]:
+    return list(mimic_item_ids(load_mapping_csv("respiratory_support")))
+
+DEVICE_ITEM_ID = 226732
+# the duplicated vent reads of this stay conflict with each other, so they are all dropped
+CONFLICTING_STAY_ID = 36123037
+# the characters stripped by python's str.strip(), for trim() in SQL
+_WHITESPACE = "' ' || chr(9) || chr(10) || chr(11) || chr(12) || chr(13)"
+# the time each event is recorded at, by the table it is read from
+EVENT_TIME_COLS = {"chartevents": "charttime", "procedureevents": "endtime"}
+
+def resp_device_ranks(resp_device_mapper: dict) -> pd.DataFrame:
+    '''
+    Device category of each device name, and its rank in `RESP_DEVICE_RANK` (0 = highest) to resolve
+    duplicated devices by.
+    '''
+    device_names = [
+        name for name, category in resp_device_mapper.items() if isinstance(name, str) and isinstance(category, str)
+    ]
+    return pd.DataFrame({
+        "device_name": device_names,
+        "device_category": [resp_device_mapper[name] for name in device_names],
+        "device_rank": [RESP_DEVICE_RANK.index(resp_device_mapper[name].strip()) for name in device_names],
+    })
+
+def resp_mode_categories(resp_mode_mapper: dict) -> pd.DataFrame:
+    mode_names = [name for name, category in resp_mode_mapper.items() if isinstance(name, str)]
+    return pd.DataFrame({
+        "mode_name": mode_names, "mode_category": [resp_mode_mapper[name] for name in mode_names]
+    })
+
+def extracted_mimic_events(mimic_item_ids: pd.Series) -> duckdb.DuckDBPyRelation:
+    '''
+    Events of the mapped items from each event table they link to, with the position of each event
+    in its MIMIC table (`event_order`, see `mimic_table_source`) to break ties by as the events are deduplicated.
+    '''
     logger.info(
         "parsing the mapping files to identify relevant items and fetch corresponding events..."
     )
-    return fetch_mimic_events(mimic_item_ids)
-
-def extracted_mimic_events_translated(extracted_mimic_events: pd.DataFrame, resp_mapper: dict) -> pd.DataFrame:
-    extracted_mimic_events["variable"] = extracted_mimic_events["itemid"].map(resp_mapper)
-    return extracted_mimic_events
-
-def none_value_rows_removed(extracted_mimic_events_translated: pd.DataFrame = None) -> pd.DataFrame:
+    item_ids = ",".join(str(int(item_id)) for item_id in mimic_item_ids)
+    linksto = duckdb.sql(f"""
+        SELECT linksto, itemids: list(itemid ORDER BY itemid)
+        FROM '{mimic_table_pathfinder("d_items")}'
+        WHERE itemid IN ({item_ids})
+        GROUP BY linksto
+        ORDER BY linksto
+        """).fetchall()
+    scans = []
+    for table, table_item_ids in linksto:
+        if table not in EVENT_TIME_COLS:
+            raise ValueError(f"reading respiratory support events from {table} is not supported")
+        source = mimic_table_source(table, mimic_events_source(table, table_item_ids), source_order=True)
+        scans.append(f"""
+        SELECT itemid, hadm_id, stay_id
+            , time: {EVENT_TIME_COLS[table]}
+            , value: CAST(value AS VARCHAR)
+            , event_order: source_order
+        FROM {source}
+        WHERE itemid IN ({','.join(map(str, table_item_ids))})
+        """)
+    return duckdb.sql(" UNION ALL ".join(scans))
+
+def none_value_rows_removed(extracted_mimic_events: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
     """Remove rows where value is the string 'None'."""
     logger.info("removing rows where O2 Delivery Device(s) is the string 'None'...")
-    mask = extracted_mimic_events_translated["value"] == "None"
-    none_value_rows = extracted_mimic_events_translated[mask] # df to drop
+    none_item_ids = {
+        row[0] for row in duckdb.sql("SELECT DISTINCT itemid FROM extracted_mimic_events WHERE value = 'None'").fetchall()
+    }
     # TODO: turn this into a validation check
-    if (
-        none_value_rows["itemid"].nunique() == 1
-        and none_value_rows["itemid"].iloc[0] == 226732
-    ):
-        # drop all rows where value is the string 'None'
-        return extracted_mimic_events_translated[~mask]
-    else:
+    if none_item_ids - {DEVICE_ITEM_ID}:
         raise ValueError(
             "The rows with 'None' value have itemid other than 226732 (O2 Delivery Device(s))."
         )
+    return duckdb.sql("FROM extracted_mimic_events WHERE value IS DISTINCT FROM 'None'")
 
-def _clean_fio2_set_helper(value: float) -> float:
-    """
-    ref: https://github.com/MIT-LCP/mimic-code/blob/e39825259beaa9d6bc9b99160049a5d251852aae/mimic-iv/concepts/measurement/bg.sql#L130
-    """
-    value = float(value)
-    if value >= 20 and value <= 100:
-        return value / 100
-    elif value > 1 and value < 20:
-        return np.nan
-    elif value > 0.2 and value <= 1:
-        return value
-    else:
-        return np.nan
-
-def fio2_set_cleaned(none_value_rows_removed: pd.DataFrame) -> pd.DataFrame:
+def fio2_set_cleaned(none_value_rows_removed: duckdb.DuckDBPyRelation, resp_mapper: dict) -> duckdb.DuckDBPyRelation:
     '''
-    Apply outlier handling and drop the nulls thus generated.
+    Apply outlier handling and drop the nulls thus generated (along with any other null values).
+    ref: https://github.com/MIT-LCP/mimic-code/blob/e39825259beaa9d6bc9b99160049a5d251852aae/mimic-iv/concepts/measurement/bg.sql#L130
     '''     
     logger.info("cleaning fio2_set...")
-    mask = none_value_rows_removed['variable'] == 'fio2_set'
-    none_value_rows_removed.loc[mask, 'value'] = none_value_rows_removed.loc[mask, 'value'].apply(_clean_fio2_set_helper)        
-    return none_value_rows_removed.dropna(subset=['value'])
+    fio2_item_ids = [item_id for item_id, variable in resp_mapper.items() if variable == "fio2_set"]
+    q = f"""
+    FROM (
+        FROM none_value_rows_removed
+        SELECT * REPLACE (
+            CASE WHEN itemid NOT IN ({','.join(map(str, fio2_item_ids))}) THEN value
+                -- percentages
+                WHEN CAST(value AS DOUBLE) BETWEEN 20 AND 100 THEN CAST(CAST(value AS DOUBLE) / 100 AS VARCHAR)
+                -- fractions; anything else is an outlier
+                WHEN CAST(value AS DOUBLE) > 0.2 AND CAST(value AS DOUBLE) <= 1 THEN CAST(CAST(value AS DOUBLE) AS VARCHAR)
+                END AS value
+            )
+    )
+    WHERE value IS NOT NULL
+    """
+    return duckdb.sql(q)
 
 def duplicates_removed(
-    fio2_set_cleaned: pd.DataFrame,
-    resp_mapper: dict,
-    resp_device_mapper: dict,
-) -> pd.DataFrame:
+    fio2_set_cleaned: duckdb.DuckDBPyRelation,
+    resp_device_ranks: pd.DataFrame,
+) -> duckdb.DuckDBPyRelation:
     """Remove duplicates to support long-to-wide pivoting.
     two kinds of duplicates to handle: by devices and other
     """
-    resp_duplicates: pd.DataFrame = find_duplicates(fio2_set_cleaned)
-
-    logger.info(
-        f"identified {len(resp_duplicates)} 'duplicated' events to be cleaned."
-    )
-    logger.info(
-        "removing the first type of duplicates: lower-ranked 'duplicated' devices..."
-    )
-    # 1/ deal with dups over devices
-    resp_duplicates_devices: pd.DataFrame = resp_duplicates.query(
-        "itemid == 226732"
-    ).copy()
-    resp_duplicates_devices["device_category"] = resp_duplicates_devices[
-        "value"
-    ].apply(lambda x: resp_device_mapper[x.strip()] if pd.notna(x) else None)
-    resp_duplicates_devices.dropna(subset="device_category", inplace=True)
-    resp_duplicates_devices["rank"] = resp_duplicates_devices[
-        "device_category"
-    ].apply(lambda x: RESP_DEVICE_RANK.index(x.strip()))
-
-    # deal with the device case - find indices to drop
-    top_ranked_device_indices = resp_duplicates_devices.groupby(
-        ["hadm_id", "time", "itemid"]
-    )["rank"].idxmin()
-    # non top-ranked categories to be dropped
-    lower_ranked_device_indices = resp_duplicates_devices.index.difference(
-        top_ranked_device_indices
-    )
-    # drop the designated indices
-    resp_events_clean = fio2_set_cleaned.drop(lower_ranked_device_indices)
-    # drop None
-    resp_events_clean.dropna(subset="value", inplace=True)
-
-    logger.info(
-        "removing the second type of duplicates: duplicated device reads..."
+    logger.info("removing duplicated devices and device reads...")
+    q = f"""
+    WITH counted AS (
+        FROM fio2_set_cleaned
+        SELECT *, n_duplicates: COUNT(*) OVER (PARTITION BY hadm_id, time, itemid)
+    ), duplicates AS (
+        FROM counted e
+        LEFT JOIN resp_device_ranks r
+            ON e.itemid = {DEVICE_ITEM_ID} AND trim(e.value, {_WHITESPACE}) = r.device_name
+        SELECT e.* EXCLUDE (n_duplicates), r.device_rank
+        WHERE e.n_duplicates > 1
+    -- 1/ of the duplicated devices with a category, keep the first of the highest-ranked ones
+    ), devices_resolved AS (
+        FROM duplicates
+        SELECT * EXCLUDE (device_rank)
+        QUALIFY device_rank IS NULL OR ROW_NUMBER() OVER (
+            PARTITION BY hadm_id, time, itemid, device_rank IS NULL ORDER BY device_rank, event_order
+            ) = 1
+    -- 2/ drop the device reads of the conflicting stay that are still duplicated
+    ), conflicts_dropped AS (
+        FROM devices_resolved
+        SELECT *
+        QUALIFY NOT coalesce(
+            stay_id = {CONFLICTING_STAY_ID} AND COUNT(*) OVER (PARTITION BY hadm_id, time, itemid) > 1, false
+            )
     )
-    # 2/ deal with duplicate vent reads:
-    setting_duplicate_indices_to_drop = (
-        find_duplicates(resp_events_clean).query("stay_id == 36123037").index
+    FROM counted
+    SELECT * EXCLUDE (n_duplicates)
+    WHERE n_duplicates = 1
+    UNION ALL
+    -- and keep the first of the other duplicated reads
+    -- NOTE: this approach drop one observation that has conflicting value
+    (
+        FROM conflicts_dropped
+        SELECT *
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY hadm_id, time, itemid ORDER BY event_order) = 1
     )
-    resp_events_clean.drop(setting_duplicate_indices_to_drop, inplace=True)
-    resp_events_clean.drop_duplicates(
-        subset=["hadm_id", "time", "itemid"], inplace=True
-    )
-    # NOTE: this approach drop one observation that has conflicting value
-
-    resp_events_clean["variable"] = resp_events_clean["itemid"].map(
-        resp_mapper
-    )
-    return resp_events_clean
+    """
+    return duckdb.sql(q)
 
 def pivoted_wider_and_coalesced(
-    duplicates_removed: pd.DataFrame,
+    duplicates_removed: duckdb.DuckDBPyRelation,
     resp_mapper: dict,
-    resp_device_mapper: dict,
-    resp_mode_mapper: dict,
-) -> pd.DataFrame:
-    
+    resp_device_ranks: pd.DataFrame,
+    resp_mode_categories: pd.DataFrame,
+) -> duckdb.DuckDBPyRelation:
     logger.info("pivoting to a wide format and coalescing duplicate columns...")
-    # this is for EDA
-    # resp_wider_in_lables = resp_events_clean.pivot(
-    #     index = ["hadm_id", "time"],
-    #     columns = ["variable", "label"],
-    #     values = "value"
-    # )
-
-    # this is for actually cleaning based on item ids
-    resp_wider_in_ids = (
-        duplicates_removed.pivot(
-            index=["hadm_id", "time"], columns=["itemid"], values="value"
-        )
-        .reset_index()
-        .rename_axis(None, axis=1)
-    )
-    resp_wider_in_ids = convert_and_sort_datetime(resp_wider_in_ids)
-    # implement the coalease logic
-    resp_wider_in_ids["tracheostomy"] = resp_wider_in_ids[225448].fillna(
-        resp_wider_in_ids[226237]
-    )
-    resp_wider_in_ids["lpm_set"] = resp_wider_in_ids[223834].fillna(
-        resp_wider_in_ids[227287]
-    )
-    resp_wider_in_ids["tidal_volume_obs"] = (
-        resp_wider_in_ids[224685]
-        .fillna(resp_wider_in_ids[224686])
-        .fillna(resp_wider_in_ids[224421])
+    # the items of each variable, coalesced in the order of the mapping
+    variable_item_ids: dict[str, list[int]] = {}
+    for item_id, variable in resp_mapper.items():
+        if isinstance(variable, str) and item_id not in (None, "None"):
+            variable_item_ids.setdefault(variable, []).append(int(item_id))
+    all_item_ids = [item_id for item_ids in variable_item_ids.values() for item_id in item_ids]
+    coalesced = "\n            , ".join(
+        f"{variable}: COALESCE({', '.join(f'{chr(34)}{item_id}{chr(34)}' for item_id in item_ids)})"
+        for variable, item_ids in variable_item_ids.items()
     )
-    resp_wider_in_ids["resp_rate_set"] = resp_wider_in_ids[224688].fillna(
-        resp_wider_in_ids[227581]
+    q = f"""
+    WITH wider AS (
+        PIVOT duplicates_removed
+        ON itemid IN ({', '.join(map(str, all_item_ids))})
+        USING first(value)
+        GROUP BY hadm_id, time
+    ), coalesced AS (
+        FROM wider
+        SELECT hadm_id, time
+            , {coalesced}
     )
-    resp_wider_in_ids["resp_rate_obs"] = resp_wider_in_ids[224690].fillna(
-        resp_wider_in_ids[224422]
-    )
-    resp_wider_in_ids["flow_rate_set"] = resp_wider_in_ids[224691].fillna(
-        resp_wider_in_ids[227582]
-    )
-    resp_wider_in_ids["peep_set"] = resp_wider_in_ids[220339].fillna(
-        resp_wider_in_ids[227579]
-    )
-    resp_wider_in_ids["mode_name"] = resp_wider_in_ids[223849].fillna(
-        resp_wider_in_ids[229314].fillna(resp_wider_in_ids[227577])
-    )  # FIXME
-    # remove duplicate variable columns that were coaleased into one
-    resp_wider_cleaned = resp_wider_in_ids.drop(
-        columns=[
-            225448,
-            226237,
-            223834,
-            227287,
-            224685,
-            224686,
-            224421,
-            224688,
-            227581,
-            224690,
-            224422,
-            224691,
-            227582,
-            220339,
-            227579,
-            223849,
-            229314,
-            227577,
-        ]
-    )
-    resp_wider_cleaned.rename(columns=resp_mapper, inplace=True)
-
-    logger.info("mapping device and mode names to categories...")
-    # map _name to _category
-    resp_wider_cleaned["device_category"] = resp_wider_cleaned["device_name"].map(
-        lambda x: resp_device_mapper[x.strip()] if pd.notna(x) else None
-    )
-    resp_wider_cleaned["mode_category"] = resp_wider_cleaned["mode_name"].map(
-        resp_mode_mapper
-    )
-    return resp_wider_cleaned
+    FROM coalesced c
+    LEFT JOIN resp_device_ranks d ON trim(c.device_name, {_WHITESPACE}) = d.device_name
+    LEFT JOIN resp_mode_categories m ON c.mode_name = m.mode_name
+    SELECT c.*
+        , d.device_category
+        , m.mode_category
+    """
+    return duckdb.sql(q)
 
 def renamed_reordered_recasted(
-    pivoted_wider_and_coalesced: pd.DataFrame,
+    pivoted_wider_and_coalesced: duckdb.DuckDBPyRelation,
 ) -> pd.DataFrame:
     logger.info("renaming, reordering, and re-casting columns...")
-    resp_final = rename_and_reorder_cols(
-        pivoted_wider_and_coalesced,
-        rename_mapper_dict={
-            "hadm_id": "hospitalization_id",
-            "time": "recorded_dttm",
-        },
-        new_col_order= RESP_COLUMNS,
-    )
-    # convert dtypes:
-    resp_float_cols = [
-        col for col in resp_final.columns if "_set" in col or "_obs" in col
-    ]
-    resp_final["hospitalization_id"] = resp_final["hospitalization_id"].astype(
-        "string"
-    )
-    resp_final["recorded_dttm"] = convert_tz_to_utc(resp_final["recorded_dttm"])
-    for col_name in resp_float_cols:
-        resp_final[col_name] = resp_final[col_name].astype(float)
+    casts = {"hospitalization_id": "CAST(hadm_id AS VARCHAR)", "recorded_dttm": "mimic_to_utc(time)"}
+    for col in RESP_COLUMNS:
+        if "_set" in col or "_obs" in col or col == "tracheostomy":
+            casts[col] = f"CAST({col} AS DOUBLE)"
+    q = f"""
+    FROM pivoted_wider_and_coalesced
+    SELECT {', '.join(f'{col}: {casts.get(col, col)}' for col in RESP_COLUMNS)}
+    ORDER BY hadm_id, time
+    """
+    resp_final = duckdb.sql(q).df()
+    resp_final["hospitalization_id"] = resp_final["hospitalization_id"].astype("string")
     return resp_final
 
 @tag(property="final")
@@ -357,9 +337,9 @@ def tracheostomy_imputed(renamed_reordered_recasted: pd.DataFrame) -> pd.DataFra
     renamed_reordered_recasted["trach_implied"] = (
         renamed_reordered_recasted["device_name"].str.strip().isin(["Tracheostomy tube", "Trach mask"])
     ) | (renamed_reordered_recasted["trach_performed"] == 1)
-    renamed_reordered_recasted["trach_bool"] = renamed_reordered_recasted.groupby("hospitalization_id")[
-        "trach_implied"
-    ].transform(lambda x: x.cumsum().astype(bool))
+    renamed_reordered_recasted["trach_bool"] = cumulative_or(
+        renamed_reordered_recasted, "trach_implied", "hospitalization_id"
+    )
     return rename_and_reorder_cols(
         renamed_reordered_recasted, {"trach_bool": "tracheostomy"}, RESP_COLUMNS
     )
@@ -410,10 +390,13 @@ def save(tracheostomy_imputed: pd.DataFrame) -> dict:
 def _test():
     logger.info("testing all...")
     from hamilton import driver
+    from src.node_manifest import NodeManifestAdapter
+    from src.node_cache import node_cache_adapters
     import src.tables.respiratory_support as respiratory_support
     dr = (
         driver.Builder()
         .with_modules(respiratory_support)
+        .with_adapters(NodeManifestAdapter("respiratory_support_test"), *node_cache_adapters(respiratory_support))
         .build()
     )
     all_nodes = dr.list_available_variables()
@@ -424,11 +407,13 @@ def _test():
 
 def _main():
     from hamilton import driver
+    from src.node_manifest import NodeManifestAdapter
+    from src.node_cache import node_cache_adapters
     import src.tables.respiratory_support as respiratory_support
     dr = (
         driver.Builder()
         .with_modules(respiratory_support)
-        # .with_cache()
+        .with_adapters(NodeManifestAdapter("respiratory_support"), *node_cache_adapters(respiratory_support))
         .build()
     )
     dr.execute(["save"])
@@ -1,104 +1,238 @@
-# src/tables/respiratory_support.py
+# src/tables/vitals.py
 import numpy as np
 import pandas as pd
 import logging
-from functools import cache
-from src.utils import construct_mapper_dict, fetch_mimic_events, load_mapping_csv, \
-    get_relevant_item_ids, find_duplicates, rename_and_reorder_cols, save_to_rclif, \
-    convert_and_sort_datetime, EXCLUDED_LABELS_DEFAULT, convert_tz_to_utc
+import duckdb
+from hamilton.function_modifiers import tag, datasaver
 from src.logging_config import setup_logging, get_logger
 
 logger = get_logger('tables.vitals')
+import pandera.pandas as pa
+from typing import List
+import json
 
+from src.utils import (
+    construct_mapper_dict,
+    load_mapping_csv,
+    get_relevant_item_ids,
+    save_to_rclif,
+    validate_clif_table,
+    mimic_table_source,
+    mimic_events_source,
+    EXCLUDED_LABELS_DEFAULT,
+)
 
-VITAL_COL_NAMES = ["hospitalization_id", "recorded_dttm", "vital_name", "vital_category", "vital_value", "meas_site_name"]
+VITAL_CATEGORIES = [
+    "temp_c", "heart_rate", "sbp", "dbp", "spo2", "respiratory_rate", "map", "height_cm", "weight_kg",
+]
 
-VITAL_COL_RENAME_MAPPER = {
-    "hadm_id": "hospitalization_id", 
-    "time": "recorded_dttm",
-    "value": "vital_value"
-    }
+CLIF_VITALS_SCHEMA = pa.DataFrameSchema(
+    {
+        "hospitalization_id": pa.Column(str, nullable=False),
+        "recorded_dttm": pa.Column(pd.DatetimeTZDtype(unit="us", tz="UTC"), nullable=False),
+        "vital_name": pa.Column(str, nullable=False),
+        "vital_category": pa.Column(str, checks=[pa.Check.isin(VITAL_CATEGORIES)], nullable=False),
+        "vital_value": pa.Column(float, nullable=True),
+        "meas_site_name": pa.Column(str, nullable=True),
+    },
+    strict=True,
+)
 
-@cache
-def convert_f_to_c(temp_f) -> float:
-    if isinstance(temp_f, str) or isinstance(temp_f, int):
-        temp_f = float(temp_f) 
-    
-    if isinstance(temp_f, float):
-        temp_c = (temp_f - 32) * 5 / 9
-        return round(temp_c, 1) # so 39.3333 -> 39.3
-    else:
-        raise("wrong type")
+VITAL_COL_NAMES: List[str] = list(CLIF_VITALS_SCHEMA.columns.keys())
 
-def _main():
-    logger.info("starting to build clif vitals table -- ")
-    vitals_mapping = load_mapping_csv("vitals")
-    vital_name_mapper = construct_mapper_dict(vitals_mapping, "itemid", "label = vital_name")
-    vital_category_mapper = construct_mapper_dict(vitals_mapping, "itemid", "vital_category")
+# 223761 = temp in f, 223762 = temp in c, 224642 = temp site
+TEMP_F_ITEM_ID, TEMP_C_ITEM_ID, TEMP_SITE_ITEM_ID = 223761, 223762, 224642
+TEMP_ITEM_IDS = [TEMP_F_ITEM_ID, TEMP_C_ITEM_ID, TEMP_SITE_ITEM_ID]
 
-    logger.info("processing the standard cases (that do not need pivoting)")
-    # find vital_items_ids
-    vitals_items_ids = get_relevant_item_ids(
-        mapping_df = vitals_mapping, decision_col = "vital_category", 
+# the only weight item in an undesired unit -- Admission Weight (lbs.)
+WEIGHT_LB_ITEM_ID = 226531
+LB_PER_KG = 2.205
+
+def _vitals_item_ids(vitals_mapping: pd.DataFrame):
+    return get_relevant_item_ids(
+        mapping_df = vitals_mapping, decision_col = "vital_category",
         excluded_labels = EXCLUDED_LABELS_DEFAULT + ["temp_c"]
         )
-    vitals_events = fetch_mimic_events(vitals_items_ids)
-
-    # use np.where to convert the unit for one item from lb to kg 
-    # for the only weight item in undesired unit -- Admission Weight (lbs.)
-    vitals_events["value"] = np.where(
-        vitals_events["itemid"] == 226531,
-        vitals_events["value"].astype(float).apply(lambda x: round(x/2.205, 1)),
-        vitals_events["value"]
+
+def _chartevents_item_ids() -> list[int]:
+    return list(_vitals_item_ids(load_mapping_csv("vitals"))) + TEMP_ITEM_IDS
+
+def _chartevents_scan(item_ids: list[int]) -> str:
+    source = mimic_table_source(
+        "chartevents", mimic_events_source("chartevents", item_ids), source_order=True
     )
-    
-    vitals_events["vital_name"] = vitals_events["itemid"].map(vital_name_mapper)
-    vitals_events["vital_category"] = vitals_events["itemid"].map(vital_category_mapper)
-
-    vitals_final = rename_and_reorder_cols(vitals_events, VITAL_COL_RENAME_MAPPER, VITAL_COL_NAMES)
-    vitals_fd = vitals_final.drop_duplicates(
-        subset = ["hospitalization_id", "recorded_dttm", "vital_category", "vital_value"])
-    
+    return f"""
+    SELECT itemid, hadm_id, time: charttime, value, event_order: source_order
+    FROM {source}
+    WHERE itemid IN ({','.join(map(str, item_ids))})
+    """
+
+def vitals_mapping() -> pd.DataFrame:
+    logger.info("loading vitals mapping...")
+    return load_mapping_csv("vitals")
+
+def vital_item_ids(vitals_mapping: pd.DataFrame) -> List[int]:
+    return [int(item_id) for item_id in _vitals_item_ids(vitals_mapping)]
+
+def vital_names(vitals_mapping: pd.DataFrame, vital_item_ids: List[int]) -> pd.DataFrame:
+    '''
+    vital_name and vital_category of each item.
+    '''
+    vital_name_mapper = construct_mapper_dict(vitals_mapping, "itemid", "label = vital_name")
+    vital_category_mapper = construct_mapper_dict(vitals_mapping, "itemid", "vital_category")
+    return pd.DataFrame({
+        "itemid": vital_item_ids,
+        "vital_name": [vital_name_mapper.get(item_id) for item_id in vital_item_ids],
+        "vital_category": [vital_category_mapper.get(item_id) for item_id in vital_item_ids],
+    })
+
+def extracted_vital_events(vital_item_ids: List[int]) -> duckdb.DuckDBPyRelation:
+    logger.info("processing the standard cases (that do not need pivoting)")
+    return duckdb.sql(_chartevents_scan(vital_item_ids))
+
+def standard_vitals(
+    extracted_vital_events: duckdb.DuckDBPyRelation, vital_names: pd.DataFrame
+) -> duckdb.DuckDBPyRelation:
+    '''
+    Map the items to vital names and categories, converting the admission weights in lbs to kg.
+    '''
+    q = f"""
+    FROM extracted_vital_events e
+    LEFT JOIN vital_names n USING (itemid)
+    SELECT e.hadm_id, e.time
+        , n.vital_name
+        , n.vital_category
+        , vital_value: CASE WHEN e.itemid = {WEIGHT_LB_ITEM_ID}
+            THEN round(CAST(e.value AS DOUBLE) / {LB_PER_KG}, 1)
+            ELSE CAST(e.value AS DOUBLE) END
+        , meas_site_name: NULL::VARCHAR
+        , e.event_order
+    """
+    return duckdb.sql(q)
+
+def extracted_temp_events() -> duckdb.DuckDBPyRelation:
     logger.info("processing the special cases for temp_c")
-    temp_events = fetch_mimic_events([223761, 223762, 224642])
-    
-    # pivot directly
-    temp_wider = temp_events.pivot(
-        index = ["hadm_id", "time"], 
-        columns = "itemid",
-        values = "value"
-        ).reset_index()
-    # map temp_site to the clif categories of meas_site_name
-    temp_wider["meas_site_name"] = temp_wider[224642]
-
-    # convert temp from f to c with a coalesce logic
-    # 223761 = temp in f, 223762 = temp in c
-    temp_wider["vital_value"] = temp_wider[223762].fillna(
-        temp_wider[223761].apply(convert_f_to_c)
-        )
-    temp_wider['vital_name'] = temp_wider.apply(
-        lambda row: "Temperature Celsius" if pd.notna(row[223762]) else "Temperature Fahrenheit", 
-        axis = "columns"
-        )
-    temp_wider["vital_category"] = "temp_c"
-    temp_final = rename_and_reorder_cols(temp_wider, VITAL_COL_RENAME_MAPPER, VITAL_COL_NAMES)
-    temp_final.dropna(subset=["vital_value"], inplace = True)
+    return duckdb.sql(_chartevents_scan(TEMP_ITEM_IDS))
+
+def temp_pivoted_wider(extracted_temp_events: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
+    '''
+    One row per temperature measurement, with the first of each of its items recorded at the time.
+    '''
+    q = f"""
+    FROM extracted_temp_events
+    SELECT hadm_id, time
+        , temp_f: arg_min(value, event_order) FILTER (WHERE itemid = {TEMP_F_ITEM_ID})
+        , temp_c: arg_min(value, event_order) FILTER (WHERE itemid = {TEMP_C_ITEM_ID})
+        , temp_site: arg_min(value, event_order) FILTER (WHERE itemid = {TEMP_SITE_ITEM_ID})
+        , event_order: min(event_order)
+    GROUP BY hadm_id, time
+    """
+    return duckdb.sql(q)
+
+def temp_vitals(temp_pivoted_wider: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
+    '''
+    Coalesce the temperature in celsius with the one in fahrenheit converted to celsius,
+    and drop the measurements with neither (i.e. only a site).
+    '''
+    q = """
+    FROM temp_pivoted_wider
+    SELECT hadm_id, time
+        , vital_name: CASE WHEN temp_c IS NOT NULL THEN 'Temperature Celsius' ELSE 'Temperature Fahrenheit' END
+        , vital_category: 'temp_c'
+        -- so 39.3333 -> 39.3
+        , vital_value: COALESCE(CAST(temp_c AS DOUBLE), round((CAST(temp_f AS DOUBLE) - 32) * 5 / 9, 1))
+        , meas_site_name: temp_site
+        , event_order
+    WHERE vital_value IS NOT NULL
+    """
+    return duckdb.sql(q)
 
+def merged(standard_vitals: duckdb.DuckDBPyRelation, temp_vitals: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
     logger.info("merging the standard and special cases")
-    vitals_m = pd.concat([vitals_final, temp_final])
-    
-    vitals_m.drop_duplicates(
-        subset = ["hospitalization_id",	"recorded_dttm", "vital_category", "vital_value"], inplace = True)
+    return duckdb.sql("FROM standard_vitals UNION ALL BY NAME FROM temp_vitals")
 
+def deduped(merged: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
+    """Keep the first of the measurements of the same value recorded at the same time."""
+    q = """
+    FROM merged
+    SELECT DISTINCT ON (hadm_id, time, vital_category, vital_value) *
+    ORDER BY hadm_id, time, vital_category, vital_value, event_order
+    """
+    return duckdb.sql(q)
+
+@tag(property="final")
+def cast(deduped: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
     logger.info("converting dtypes...")
-    vitals_m["hospitalization_id"] = vitals_m["hospitalization_id"].astype("string")
-    vitals_m["vital_value"] = vitals_m["vital_value"].astype(float)
-    vitals_m["recorded_dttm"] = pd.to_datetime(vitals_m["recorded_dttm"])
-    vitals_m["recorded_dttm"] = convert_tz_to_utc(vitals_m["recorded_dttm"])
-    
-    save_to_rclif(vitals_m, "vitals")
+    q = """
+    FROM deduped
+    SELECT hospitalization_id: CAST(hadm_id AS VARCHAR)
+        , recorded_dttm: mimic_to_utc(CAST(time AS TIMESTAMP))
+        , vital_name: CAST(vital_name AS VARCHAR)
+        , vital_category: CAST(vital_category AS VARCHAR)
+        , vital_value: CAST(vital_value AS DOUBLE)
+        , meas_site_name: CAST(meas_site_name AS VARCHAR)
+    ORDER BY hadm_id, time, vital_category, vital_value
+    """
+    # left lazy so that `save` streams it to parquet
+    return duckdb.sql(q)
+
+@tag(property="test")
+def schema_tested(cast: duckdb.DuckDBPyRelation) -> bool | pa.errors.SchemaErrors:
+    logger.info("testing schema...")
+    try:
+        validate_clif_table(CLIF_VITALS_SCHEMA, cast)
+        return True
+    except pa.errors.SchemaErrors as exc:
+        logger.error(json.dumps(exc.message, indent=2))
+        logger.error("Schema errors and failure cases:")
+        logger.error(exc.failure_cases)
+        logger.error("\nDataFrame object that failed validation:")
+        logger.error(exc.data)
+        return exc
+
+@datasaver()
+def save(cast: duckdb.DuckDBPyRelation) -> dict:
+    save_to_rclif(cast, "vitals")
     logger.info("output saved to a parquet file, everything completed for the vitals table!")
 
+    metadata = {
+        "table_name": "vitals"
+    }
+
+    return metadata
+
+def _main():
+    logger.info("starting to build clif vitals table -- ")
+    from hamilton import driver
+    from src.node_manifest import NodeManifestAdapter
+    from src.node_cache import node_cache_adapters
+    import src.tables.vitals as vitals
+    dr = (
+        driver.Builder()
+        .with_modules(vitals)
+        .with_adapters(NodeManifestAdapter("vitals"), *node_cache_adapters(vitals))
+        .build()
+    )
+    dr.execute(["save"])
+
+def _test():
+    logger.info("testing all...")
+    from hamilton import driver
+    from src.node_manifest import NodeManifestAdapter
+    from src.node_cache import node_cache_adapters
+    import src.tables.vitals as vitals
+    dr = (
+        driver.Builder()
+        .with_modules(vitals)
+        .with_adapters(NodeManifestAdapter("vitals_test"), *node_cache_adapters(vitals))
+        .build()
+    )
+    all_nodes = dr.list_available_variables()
+    test_nodes = [node.name for node in all_nodes if 'test' == node.tags.get('property')]
+    output = dr.execute(test_nodes)
+    logger.debug(f"Test output: {output}")
+    return output
+
 if __name__ == "__main__":
     setup_logging()
-    _main()
\ No newline at end of file
+    _main()
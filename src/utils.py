@@ -1,12 +1,18 @@
 # src/utils.py
 import logging
 import os, sys
+import time
+import threading
 import pandas as pd
 import json
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from functools import cache
 import duckdb  # type: ignore
 from src.logging_config import setup_logging, get_logger
+from src.mimic_schemas import MIMIC_CSV_SCHEMAS
+from src.fingerprint import track_input, track_output
 
 logger = get_logger('utils')
 con = duckdb.connect()
@@ -14,7 +20,8 @@ SCRIPT_DIR = Path(__file__).resolve().parent
 REPO_ROOT = SCRIPT_DIR.parent
 
 def load_config():
-    json_path = SCRIPT_DIR / "../config/config.json"
+    # CLIF_MIMIC_CONFIG points to another config file, e.g. the one the benchmark writes for each scale
+    json_path = os.environ.get("CLIF_MIMIC_CONFIG") or SCRIPT_DIR / "../config/config.json"
     with open(json_path, "r") as file:
         config = json.load(file)
     logger.info(f"loaded configuration from {json_path}")
@@ -28,6 +35,28 @@ MIMIC_CSV_DIR = config[CURRENT_WORKSPACE]["mimic_csv_dir"]
 MIMIC_PARQUET_DIR = config[CURRENT_WORKSPACE]["mimic_parquet_dir"]
 MIMIC_PARQUET_DIR = f"{MIMIC_CSV_DIR}/parquet" if MIMIC_PARQUET_DIR == "" else MIMIC_PARQUET_DIR
 CLIF_OUTPUT_DIR_NAME = config["clif_output_dir_name"]
+
+def parse_shard(shard: str) -> tuple[int, int]:
+    '''
+    Parse a shard given as "k/K" (the k-th of K shards, counting from 0) into (k, K).
+    '''
+    try:
+        index, count = (int(part) for part in shard.split("/"))
+    except ValueError:
+        raise ValueError(f"a shard must be given as 'k/K', e.g. '0/4', got {shard!r}") from None
+    if not 0 <= index < count:
+        raise ValueError(f"the shard index must be between 0 and {count - 1}, got {shard!r}")
+    return index, count
+
+# hash-sharded build (see src/sharding.py): CLIF_MIMIC_SHARD="k/K" builds every table only for the admissions
+# with hash(hadm_id) % K == k (or hash(subject_id) for the tables of a job whose SHARD_KEY is "subject_id"),
+# writing all of its outputs, logs and intermediate files under output/shards/shard-k-of-K/
+SHARD_INDEX, SHARD_COUNT = parse_shard(os.environ["CLIF_MIMIC_SHARD"]) if os.environ.get("CLIF_MIMIC_SHARD") else (0, 1)
+SHARD_NAME = f"shard-{SHARD_INDEX}-of-{SHARD_COUNT}" if SHARD_COUNT > 1 else ""
+OUTPUT_DIR = f"{REPO_ROOT}/output/shards/{SHARD_NAME}" if SHARD_NAME else f"{REPO_ROOT}/output"
+LOG_DIR = f"{OUTPUT_DIR}/logs"
+# the column that the MIMIC scans of the current job are sharded by, set by the scheduler for each job
+SHARD_KEY = "hadm_id"
 CLIF_VERSION = config["clif_version"]
 EXCLUDED_LABELS_DEFAULT = [
     "NO MAPPING",
@@ -93,6 +122,48 @@ MIMIC_TABLES_NEEDED_FOR_CLIF = [
 
 CLIF_DTTM_FORMAT = "YYYY-MM-DD HH:MM:SS+00:00"
 
+CSV_TO_PARQUET_CONFIG = config.get("csv_to_parquet", {})
+CLUSTER_EVENT_TABLES = CSV_TO_PARQUET_CONFIG.get("cluster_event_tables", 0) == 1
+# smaller than duckdb's default (122,880) so that the row groups of rare items are skipped more precisely
+PARQUET_ROW_GROUP_SIZE = int(CSV_TO_PARQUET_CONFIG.get("row_group_size", 100_000))
+
+# applied to every duckdb connection by `configure_duckdb`: memory_limit ("" = duckdb's default of 80% of RAM),
+# threads (0 = all cores), temp_directory where queries spill to disk when they exceed the memory_limit
+# ("" = output/tmp/duckdb), max_temp_directory_size ("" = no limit) and preserve_insertion_order
+DUCKDB_CONFIG = config.get("duckdb", {})
+DUCKDB_TEMP_DIR = DUCKDB_CONFIG.get("temp_directory") or f"{OUTPUT_DIR}/tmp/duckdb"
+if DUCKDB_CONFIG.get("temp_directory") and SHARD_NAME:
+    # the shards may run on different nodes sharing the same file system
+    DUCKDB_TEMP_DIR = f"{DUCKDB_TEMP_DIR}/{SHARD_NAME}"
+
+# how `save_to_rclif` writes the CLIF tables; "order_by" optionally maps a table name to the columns to sort it by
+RCLIF_PARQUET_CONFIG = config.get("rclif_parquet", {})
+RCLIF_COMPRESSION = RCLIF_PARQUET_CONFIG.get("compression", "snappy")
+RCLIF_ROW_GROUP_SIZE = int(RCLIF_PARQUET_CONFIG.get("row_group_size", 122_880))
+RCLIF_ORDER_BY = RCLIF_PARQUET_CONFIG.get("order_by", {})
+
+# restrict every MIMIC scan to a cohort: explicit subject_ids and/or hadm_ids, and/or a deterministic sample
+# of the admissions whose hash of hadm_id falls below sample_fraction (1 = all admissions)
+COHORT_CONFIG = config.get("cohort", {})
+COHORT_SUBJECT_IDS = sorted(int(subject_id) for subject_id in COHORT_CONFIG.get("subject_ids") or [])
+COHORT_HADM_IDS = sorted(int(hadm_id) for hadm_id in COHORT_CONFIG.get("hadm_ids") or [])
+COHORT_SAMPLE_FRACTION = float(COHORT_CONFIG.get("sample_fraction", 1))
+if not 0 < COHORT_SAMPLE_FRACTION <= 1:
+    raise ValueError(f"cohort sample_fraction must be in (0, 1], got {COHORT_SAMPLE_FRACTION}")
+# resolution of the hash sample
+HASH_BUCKETS = 1_000_000
+
+# sort order of the event tables in the clustered parquet layout: since the events of an item are stored
+# together, filters on itemid can skip every row group whose min/max statistics exclude the item
+EVENT_TABLE_SORT_KEYS = {
+    "chartevents": ["itemid", "hadm_id", "charttime"],
+    "labevents": ["itemid", "hadm_id", "charttime"],
+    "inputevents": ["itemid", "hadm_id", "starttime"],
+    "outputevents": ["itemid", "hadm_id", "charttime"],
+    "procedureevents": ["itemid", "hadm_id", "starttime"],
+    "datetimeevents": ["itemid", "hadm_id", "charttime"],
+}
+
 # -----------
 #     I/O
 # -----------
@@ -124,9 +195,9 @@ def mimic_table_pathfinder(table: str, data_format: str = "parquet") -> str:
     if data_format == "parquet":
         # check if the parquet path contains two subdirectories called "hosp" and "icu"
         if parquet_stored_in_submodules():
-            return f"{MIMIC_PARQUET_DIR}/{module}/{table}.parquet"
+            return track_input(f"{MIMIC_PARQUET_DIR}/{module}/{table}.parquet")
         else:
-            return f"{MIMIC_PARQUET_DIR}/{table}.parquet"
+            return track_input(f"{MIMIC_PARQUET_DIR}/{table}.parquet")
     elif data_format == "csv":
         # otherwise, assume the csv files are stored under the two subdirectories
         return f"{MIMIC_CSV_DIR}/{module}/{table}.csv.gz"
@@ -135,47 +206,153 @@ def mimic_table_pathfinder(table: str, data_format: str = "parquet") -> str:
             f"Unsupported file format: {data_format}; only 'parquet' and 'csv' are supported."
         )
 
-def resave_mimic_table_from_csv_to_parquet(table: str, overwrite: bool = False):
+_LAYOUT_MANIFEST_LOCK = threading.Lock()
+
+def mimic_parquet_layout_pathfinder() -> str:
+    '''
+    Return the path to the manifest recording how each MIMIC parquet file is laid out.
+    '''
+    return f"{MIMIC_PARQUET_DIR}/layout_manifest.json"
+
+def load_mimic_parquet_layout() -> dict:
+    '''
+    Return the layout manifest of the MIMIC parquet files: table name -> sort keys and row group size.
+    '''
+    if not Path(mimic_parquet_layout_pathfinder()).exists():
+        return {}
+    with open(mimic_parquet_layout_pathfinder(), "r") as file:
+        return json.load(file)
+
+def _record_mimic_parquet_layout(table: str, layout: dict):
+    # tables may be converted concurrently, so the read-modify-write of the manifest is serialized
+    with _LAYOUT_MANIFEST_LOCK:
+        manifest = load_mimic_parquet_layout()
+        manifest[table] = layout
+        with open(mimic_parquet_layout_pathfinder(), "w") as file:
+            json.dump(manifest, file, indent=2)
+
+def mimic_csv_reader(table: str, conn: duckdb.DuckDBPyConnection = None) -> str:
+    '''
+    Return the duckdb expression reading a MIMIC csv file with the explicit column types of MIMIC_CSV_SCHEMAS,
+    falling back to type sniffing for tables without a schema or whose columns differ from it.
+    '''
+    conn = conn or con
+    csv_path = mimic_table_pathfinder(table, data_format='csv')
+    schema = MIMIC_CSV_SCHEMAS.get(table)
+    if schema is None:
+        return f"read_csv_auto('{csv_path}')"
+    csv_columns = [row[0] for row in conn.execute(f"DESCRIBE SELECT * FROM read_csv('{csv_path}', all_varchar = true)").fetchall()]
+    if csv_columns != list(schema.keys()):
+        logger.warning(f"the columns of {table}.csv.gz differ from the expected MIMIC-IV schema, so their types are sniffed instead: {csv_columns}")
+        return f"read_csv_auto('{csv_path}')"
+    columns = ", ".join(f"'{col}': '{dtype}'" for col, dtype in schema.items())
+    return f"read_csv('{csv_path}', header = true, columns = {{{columns}}})"
+
+def resave_mimic_table_from_csv_to_parquet(
+    table: str, overwrite: bool = False, clustered: bool = None, threads: int = None
+) -> dict:
     '''
     Resave one MIMIC table from csv to parquet.
+
+    - clustered: whether to sort an event table by EVENT_TABLE_SORT_KEYS (defaults to "cluster_event_tables"
+    under "csv_to_parquet" in config.json); ignored for the other tables.
+    - threads: number of duckdb threads for this conversion (default: all cores).
+
+    The parquet file is first written under a temporary name and renamed once complete, so an interrupted
+    conversion never leaves a truncated file behind and is simply redone on the next run.
+    Returns the sizes, duration and throughput of the conversion.
     '''
+    if clustered is None:
+        clustered = CLUSTER_EVENT_TABLES
+    sort_keys = EVENT_TABLE_SORT_KEYS.get(table, []) if clustered else []
+    csv_path = mimic_table_pathfinder(table, data_format='csv')
+    parquet_path = mimic_table_pathfinder(table, data_format='parquet')
     # first check if the table is already converted to parquet
-    if Path(mimic_table_pathfinder(table, data_format="parquet")).exists():
+    if Path(parquet_path).exists():
         if not overwrite:
-            raise FileExistsError(f"{table}.parquet already exists at {mimic_table_pathfinder(table, data_format='parquet')}. Set overwrite = True to overwrite it.")
+            raise FileExistsError(f"{table}.parquet already exists at {parquet_path}. Set overwrite = True to overwrite it.")
         else:
-            logger.info(f"overwriting {table}.parquet that already exists at {mimic_table_pathfinder(table, data_format='parquet')}.")
+            logger.info(f"overwriting {table}.parquet that already exists at {parquet_path}.")
     
-    # resave the table from csv to parquet using duckdb
-    logger.info(f"resaving {table} from .csv.gz to .parquet using duckdb...")
+    # resave the table from csv to parquet using duckdb, with a connection of its own 
+    # so that concurrent conversions each get their share of threads
+    logger.info(f"resaving {table} from .csv.gz to .parquet using duckdb{' sorted by ' + str(sort_keys) if sort_keys else ''}...")
+    conn = duckdb.connect()
+    configure_duckdb(conn, f"csv_{table}", **({"threads": threads} if threads else {}))
+    order_by = f"ORDER BY {', '.join(sort_keys)}" if sort_keys else ""
+    tmp_path = f"{parquet_path}.tmp"
+    start = time.perf_counter()
     query = f"""
     COPY (
         SELECT * 
-        FROM read_csv_auto('{str(mimic_table_pathfinder(table, data_format='csv'))}')
+        FROM {mimic_csv_reader(table, conn)}
+        {order_by}
         )
-    TO '{str(mimic_table_pathfinder(table, data_format='parquet'))}' (FORMAT 'PARQUET');
+    TO '{tmp_path}' (FORMAT 'PARQUET', ROW_GROUP_SIZE {PARQUET_ROW_GROUP_SIZE});
     """
-    con.execute(query)
-    logger.info(f"finished resaving {table} from .csv.gz to .parquet!")
+    try:
+        conn.execute(query)
+    except Exception:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+    finally:
+        conn.close()
+    os.replace(tmp_path, parquet_path)
+    seconds = time.perf_counter() - start
+    _record_mimic_parquet_layout(table, {"sorted_by": sort_keys, "row_group_size": PARQUET_ROW_GROUP_SIZE})
+
+    stats = {
+        "table": table,
+        "csv_mb": round(os.path.getsize(csv_path) / 1e6, 1),
+        "parquet_mb": round(os.path.getsize(parquet_path) / 1e6, 1),
+        "seconds": round(seconds, 1),
+    }
+    stats["mb_per_s"] = round(stats["csv_mb"] / max(seconds, 1e-3), 1)
+    logger.info(
+        f"finished resaving {table} from .csv.gz ({stats['csv_mb']} MB) to .parquet ({stats['parquet_mb']} MB) "
+        f"in {stats['seconds']}s at {stats['mb_per_s']} MB/s!"
+    )
+    return stats
     
-def resave_select_mimic_tables_from_csv_to_parquet(tables: list[str], overwrite: bool = False):
+def resave_select_mimic_tables_from_csv_to_parquet(tables: list[str], overwrite: bool = False, max_workers: int = None):
     '''
     Resave a list of MIMIC tables from csv to parquet.
     
     - overwrite: if True, will overwrite existing parquet files under the same name; otherwise, 
     a FileExistsError will be raised, and we will skip to the next table.
+    - max_workers: number of tables to convert at the same time (defaults to "max_workers" under "csv_to_parquet"
+    in config.json); the "threads" budget there (default: all cores) is split evenly between them.
     '''
+    max_workers = max_workers or int(CSV_TO_PARQUET_CONFIG.get("max_workers", 1))
+    thread_budget = int(CSV_TO_PARQUET_CONFIG.get("threads", 0)) or os.cpu_count() or 1
+    threads = max(1, thread_budget // max_workers)
     logger.info(f"converting the following {len(tables)} mimic tables from csv to parquet: {tables}")
-    # first check which tables are already converted to parquet by checking the parquet dir
-    counter = 0
-    for table in tables:
-        counter += 1
-        logger.info(f"resaving table {counter} out of {len(tables)}:")
-        try: 
-            resave_mimic_table_from_csv_to_parquet(table, overwrite = overwrite)
-        except FileExistsError as e:
-            logger.info(e)
-            continue
+    # start with the largest files so that the small ones fill in the gaps at the end
+    tables = sorted(
+        tables, reverse=True,
+        key=lambda table: os.path.getsize(csv_path) if os.path.exists(csv_path := mimic_table_pathfinder(table, data_format="csv")) else 0,
+    )
+    logger.info(f"converting up to {max_workers} tables at a time with {threads} duckdb threads each")
+    all_stats, failed = [], []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(resave_mimic_table_from_csv_to_parquet, table, overwrite = overwrite, threads = threads): table
+            for table in tables
+        }
+        for counter, future in enumerate(as_completed(futures), start=1):
+            table = futures[future]
+            try: 
+                all_stats.append(future.result())
+                logger.info(f"resaved table {counter} out of {len(tables)}: {table}")
+            except FileExistsError as e:
+                logger.info(e)
+            except Exception as e:
+                logger.error(f"error resaving {table} from .csv.gz to .parquet: {e}")
+                failed.append(table)
+    if all_stats:
+        logger.info("conversion throughput:\n" + pd.DataFrame(all_stats).to_string(index=False))
+    if failed:
+        raise RuntimeError(f"failed to resave {failed} from .csv.gz to .parquet; rerun to resume with the remaining tables.")
     logger.info(f"finished resaving all {len(tables)} tables from .csv.gz to .parquet!")
 
 def resave_all_mimic_tables_from_csv_to_parquet(overwrite: bool = False):
@@ -191,33 +368,257 @@ def clif_table_pathfinder(table_name: str) -> str:
         # if it is an empty str (not specified by user), use the default syntax
         CLIF_OUTPUT_DIR_NAME = f"rclif-{CLIF_VERSION}"
     clif_path = (
-        SCRIPT_DIR / f"{REPO_ROOT}/output/{CLIF_OUTPUT_DIR_NAME}/clif_{table_name}.parquet"
+        SCRIPT_DIR / f"{OUTPUT_DIR}/{CLIF_OUTPUT_DIR_NAME}/clif_{table_name}.parquet"
     ) # e.g. 'CLIF-MIMIC/output/rclif-2.0/clif_adt.parquet'
     return str(clif_path)
 
+def clif_manifest_pathfinder(job: str) -> str:
+    '''
+    Return the path to the manifest of the inputs and outputs of the last successful build of a job.
+    '''
+    return str(Path(clif_table_pathfinder(job)).parent / ".manifests" / f"{job}.json")
+
 def clif_test_data_pathfinder(table_name: str) -> str:
     clif_path = (
         SCRIPT_DIR / f"{REPO_ROOT}/tests/fixtures/test_{table_name}.csv"
     ) # e.g. 'CLIF-MIMIC/tests/fixtures/test_patient.csv'
     return str(clif_path)
 
-def save_to_rclif(df: pd.DataFrame, table_name: str):
+def save_to_rclif(data, table_name: str, order_by: list[str] = None, expected_rows: int = None):
+    '''
+    Save a CLIF table as a parquet file. Besides a pandas DataFrame, `data` can be a duckdb relation
+    or an Arrow RecordBatchReader (or Table), which is streamed to the file with COPY ... TO without ever
+    being materialized in memory. The compression, row group size and sort order are set under
+    "rclif_parquet" in config.json; `order_by` overrides the sort order configured for the table.
+    With `expected_rows`, the table written must have that many rows, or the previous table is left in place.
+    '''
     output_path = clif_table_pathfinder(table_name)
     # check if the directory exists, if not, create it
     if not Path(output_path).parent.exists():
         Path(output_path).parent.mkdir(parents=True)
+    order_by = order_by or RCLIF_ORDER_BY.get(table_name)
     logger.info(f"saving {table_name} rclif table as a parquet file at {output_path}.")
-    return df.to_parquet(output_path, index=False)
+    track_output(output_path)
+    # write to a temporary file first so a failed run never leaves a partial table behind
+    tmp_path = f"{output_path}.tmp"
+    try:
+        if isinstance(data, pd.DataFrame):
+            if order_by:
+                data = data.sort_values(order_by, kind="stable", ignore_index=True)
+            data.to_parquet(tmp_path, index=False, compression=RCLIF_COMPRESSION, row_group_size=RCLIF_ROW_GROUP_SIZE)
+        else:
+            if not isinstance(data, duckdb.DuckDBPyRelation):
+                data = con.from_arrow(data)
+            if order_by:
+                data = data.order(", ".join(f'"{col}"' for col in order_by))
+            data.to_parquet(tmp_path, compression=RCLIF_COMPRESSION, row_group_size=RCLIF_ROW_GROUP_SIZE)
+        if expected_rows is not None:
+            # counted from the parquet metadata, without reading the table back
+            saved_rows = con.execute(f"SELECT COUNT(*) FROM read_parquet('{tmp_path}')").fetchone()[0]
+            if saved_rows != expected_rows:
+                raise ValueError(f"{table_name} has {saved_rows} rows, expected {expected_rows}; it was not saved.")
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+    os.replace(tmp_path, output_path)
+
+# the temp tables created by `materialize`, until `drop_materialized` drops them
+_materialized: set[str] = set()
+
+def materialize(relation: duckdb.DuckDBPyRelation, name: str) -> duckdb.DuckDBPyRelation:
+    '''
+    Execute a lazy relation once into a temp table named `name` and return a relation over the table, so that
+    the relations built on it and the row counts taken from it do not re-execute its plan. The table spills
+    to the temp directory past the duckdb memory limit. Tables are named after their module (e.g.
+    "medication_admin_cont_deduped") so that they do not shadow the frames and relations that queries
+    reference by their python variable name.
+    '''
+    duckdb.sql(f"CREATE OR REPLACE TEMP TABLE {name} AS FROM relation")
+    _materialized.add(name)
+    return duckdb.table(name)
+
+def drop_materialized():
+    '''
+    Drop the temp tables created by `materialize`, e.g. once the job that built them is done, so that they do not
+    hold on to memory (or spill files) for the rest of the build.
+    '''
+    while _materialized:
+        duckdb.sql(f"DROP TABLE IF EXISTS {_materialized.pop()}")
+
+def extract_for_clif_tables(table: str, mappings: dict[str, pd.DataFrame], name: str) -> duckdb.DuckDBPyRelation:
+    '''
+    Scan a MIMIC event table once for the items of several CLIF tables built from it (e.g. `input` and `output`
+    from outputevents). `mappings` holds the mapping of each CLIF table, by table name, with one row per itemid.
+    Each event is joined to the mapping of its table and tagged with the table in `clif_table`; the mapping
+    columns of the other tables are NULL. With more than one table, the events are materialized into the temp
+    table `name` so that each table filters them instead of scanning the source again.
+    '''
+    mapping = pd.concat(
+        [table_mapping.assign(clif_table=clif_table) for clif_table, table_mapping in mappings.items()],
+        ignore_index=True,
+    )
+    item_ids = ','.join(map(str, mapping["itemid"].unique()))
+    events = duckdb.sql(f"""
+    FROM {mimic_table_source(table)} e
+    INNER JOIN mapping m ON e.itemid = m.itemid
+    SELECT e.*, m.* EXCLUDE (itemid)
+    WHERE e.itemid IN ({item_ids})
+    """)
+    return materialize(events, name) if len(mappings) > 1 else events
+
+def validate_clif_table(schema, data, batch_size: int = 1_000_000):
+    '''
+    Validate a CLIF table against its pandera schema, raising `SchemaErrors` like `schema.validate(data, lazy=True)`.
+    A duckdb relation is validated batch by batch so that it is never materialized in full.
+    '''
+    if isinstance(data, pd.DataFrame):
+        return schema.validate(data, lazy=True)
+    for batch in data.arrow(batch_size=batch_size):
+        schema.validate(batch.to_pandas(), lazy=True)
+    return data
 
 def read_from_rclif(table_name):
     return pd.read_parquet(clif_table_pathfinder(table_name))
 
+# bumped whenever the layout of the shared extracts changes, so that older extracts are rebuilt
+SHARED_EXTRACT_VERSION = 2
+
+def shared_extract_pathfinder(table: str, suffix: str = "parquet") -> str:
+    '''
+    Return the path to the shared extract of a MIMIC event table (see src/shared_extracts.py),
+    or to its manifest with suffix = "json".
+    '''
+    return f"{OUTPUT_DIR}/intermediate/{table}_extract.{suffix}"
+
+def source_file_signature(path: str) -> dict:
+    '''
+    Cheap signature of a source file, used to tell whether an extract made from it is stale.
+    '''
+    stat = os.stat(path)
+    return {"path": str(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def mimic_events_source(table: str, item_ids) -> str:
+    '''
+    Return the path to read the events of the given items from: the shared extract of the table
+    if it is up to date and covers all of the items, otherwise the full MIMIC table.
+    '''
+    table_path = mimic_table_pathfinder(table)
+    manifest_path = shared_extract_pathfinder(table, suffix="json")
+    if not Path(manifest_path).exists():
+        return table_path
+    with open(manifest_path, "r") as file:
+        manifest = json.load(file)
+    if manifest["source"] != source_file_signature(table_path):
+        logger.info(f"ignoring the shared {table} extract since the source table has changed")
+        return table_path
+    if manifest.get("version") != SHARED_EXTRACT_VERSION:
+        logger.info(f"ignoring the shared {table} extract since it was made by an older version of the pipeline")
+        return table_path
+    if manifest.get("cohort", {}) != cohort_settings():
+        logger.info(f"ignoring the shared {table} extract since it was made for a different cohort")
+        return table_path
+    missing = {int(item_id) for item_id in item_ids} - set(manifest["item_ids"])
+    if missing:
+        logger.info(f"ignoring the shared {table} extract since it does not cover {len(missing)} of the items")
+        return table_path
+    logger.info(f"reading from the shared {table} extract at {shared_extract_pathfinder(table)}")
+    return shared_extract_pathfinder(table)
+
+def cohort_settings() -> dict:
+    '''
+    The cohort restrictions in effect, including the shard (empty if every admission is included),
+    as recorded in the manifests.
+    '''
+    settings = {"subject_ids": COHORT_SUBJECT_IDS, "hadm_ids": COHORT_HADM_IDS}
+    if COHORT_SAMPLE_FRACTION < 1:
+        settings["sample_fraction"] = COHORT_SAMPLE_FRACTION
+    if SHARD_COUNT > 1:
+        settings["shard"] = [SHARD_INDEX, SHARD_COUNT]
+    return {key: value for key, value in settings.items() if value}
+
+def set_shard_key(key: str):
+    '''
+    Shard the MIMIC scans of the job about to run by "hadm_id" (the default) or "subject_id".
+    '''
+    global SHARD_KEY
+    if key not in ("hadm_id", "subject_id"):
+        raise ValueError(f"the shard key must be 'hadm_id' or 'subject_id', got {key!r}")
+    SHARD_KEY = key
+
+def hash_bucket_sql(column: str, buckets: int) -> str:
+    '''
+    SQL expression assigning each value of an id column to one of `buckets` buckets, the same on every run.
+    '''
+    return f"hash(CAST({column} AS BIGINT)) % {buckets}"
+
+def _condition_on_table(key: str, condition: str, columns) -> str | None:
+    # a condition on hadm_id applies to the tables without it (e.g. patients) through the subjects of the admissions
+    if key in columns:
+        return condition
+    if key == "hadm_id" and "subject_id" in columns:
+        return f"subject_id IN (SELECT subject_id FROM '{mimic_table_pathfinder('admissions')}' WHERE {condition})"
+    return None
+
+def cohort_predicate(table: str, shard_keys: list[str] = None) -> str | None:
+    '''
+    SQL condition restricting the rows of a MIMIC table to the cohort and the shard (None if there is no restriction).
+    Tables without hadm_id (e.g. patients) are restricted to the subjects of the admissions in the cohort.
+    A row is in the shard if any of `shard_keys` (default: the current `SHARD_KEY`) hashes to it.
+    '''
+    columns = MIMIC_CSV_SCHEMAS.get(table, {})
+    restrictions = []
+    if COHORT_HADM_IDS:
+        restrictions.append(("hadm_id", f"hadm_id IN ({','.join(map(str, COHORT_HADM_IDS))})"))
+    if COHORT_SAMPLE_FRACTION < 1:
+        restrictions.append((
+            "hadm_id", f"{hash_bucket_sql('hadm_id', HASH_BUCKETS)} < {round(COHORT_SAMPLE_FRACTION * HASH_BUCKETS)}"
+            ))
+    if COHORT_SUBJECT_IDS:
+        restrictions.append(("subject_id", f"subject_id IN ({','.join(map(str, COHORT_SUBJECT_IDS))})"))
+    conditions = [_condition_on_table(key, condition, columns) for key, condition in restrictions]
+    if SHARD_COUNT > 1:
+        shard_conditions = [
+            _condition_on_table(key, f"{hash_bucket_sql(key, SHARD_COUNT)} = {SHARD_INDEX}", columns)
+            for key in shard_keys or [SHARD_KEY]
+        ]
+        if None not in shard_conditions:
+            conditions.append(f"({' OR '.join(shard_conditions)})")
+    conditions = [condition for condition in conditions if condition is not None]
+    return " AND ".join(conditions) or None
+
+def mimic_table_source(
+    table: str, path: str = None, shard_keys: list[str] = None, source_order: bool = False
+) -> str:
+    '''
+    Return what to put after FROM to scan a MIMIC table (or an extract of it at `path`),
+    restricted to the cohort configured under "cohort" in config.json and to the shard being built.
+    With `source_order`, the scan has a `source_order` column with the position of each row in the MIMIC
+    table, which the shared extract carries over from its source (see src/shared_extracts.py).
+    '''
+    path = path or mimic_table_pathfinder(table)
+    if path == shared_extract_pathfinder(table):
+        scan = f"'{path}'" if source_order else f"(FROM '{path}' SELECT * EXCLUDE (source_order))"
+    elif source_order:
+        scan = f"(FROM read_parquet('{path}', file_row_number = true) SELECT * RENAME (file_row_number AS source_order))"
+    else:
+        scan = f"'{path}'"
+    predicate = cohort_predicate(table, shard_keys)
+    if predicate is None:
+        return scan
+    return f"(FROM {scan} WHERE {predicate})"
+
 # ----------------------
 #   ETL - mapping
 # ----------------------
 
 def mapping_path_finder(csv_name: str):
-    return f"{REPO_ROOT}/data/mappings/mimic-to-clif-mappings - {csv_name}.csv"
+    return track_input(f"{REPO_ROOT}/data/mappings/mimic-to-clif-mappings - {csv_name}.csv")
+
+def mcide_pathfinder(csv_name: str):
+    '''
+    Return the path to a CLIF vocabulary (mCIDE) csv, e.g. "clif_lab_categories".
+    '''
+    return track_input(f"{REPO_ROOT}/data/mcide/{csv_name}.csv")
 
 def load_mapping_csv(csv_name: str, dtype=None):
     return pd.read_csv(
@@ -286,14 +687,119 @@ def get_relevant_item_ids(
 #   ETL - data manipulation
 # -----------------------------
 
+MIMIC_TZ = "US/Eastern"
+
 def convert_tz_to_utc(series: pd.Series) -> pd.Series:
     """
     Convert a series of timestamps to UTC.
     """
-    MIMIC_TZ = "US/Eastern"
     series = series.dt.tz_localize(MIMIC_TZ, ambiguous="NaT", nonexistent="shift_forward")
     return series.dt.tz_convert("UTC")
 
+@cache
+def mimic_tz_periods() -> pd.DataFrame:
+    """
+    Split local MIMIC time into consecutive periods within which `convert_tz_to_utc` converts to UTC the same way:
+    - "normal": utc = local - utc_offset (in seconds)
+    - "nonexistent" (skipped when DST starts): shifted forward to the start of DST, i.e. utc = switch_utc
+    - "ambiguous" (repeated when DST ends): NaT
+    The periods are derived from the time zone that pandas localizes with (pytz in pandas 2, zoneinfo in pandas 3,
+    which disagree after 2037), so that the two agree exactly: the UTC offset is scanned day by day over 1800-2300
+    with its public `astimezone` and each change is bisected down to the second.
+    """
+    tz = pd.DatetimeTZDtype(tz=MIMIC_TZ).tz
+    def offset_at(utc: datetime) -> int:
+        return int(utc.replace(tzinfo=timezone.utc).astimezone(tz).utcoffset().total_seconds())
+    first_day = datetime(1800, 1, 1)
+    switches, offsets = [], [offset_at(first_day)]
+    for day in (first_day + timedelta(days=n) for n in range((datetime(2300, 1, 1) - first_day).days)):
+        if offset_at(day + timedelta(days=1)) == offsets[-1]:
+            continue
+        lo, hi = 0, 86_400 # the switch is within (day + lo, day + hi] seconds
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            lo, hi = (mid, hi) if offset_at(day + timedelta(seconds=mid)) == offsets[-1] else (lo, mid)
+        switches.append(day + timedelta(seconds=hi))
+        offsets.append(offset_at(day + timedelta(days=1)))
+    periods, cursor = [], datetime.min
+    for switch_utc, offset_before, offset_after in zip(switches, offsets[:-1], offsets[1:]):
+        start = switch_utc + timedelta(seconds=min(offset_before, offset_after))
+        end = switch_utc + timedelta(seconds=max(offset_before, offset_after))
+        periods.append((cursor, start, "normal", offset_before, None))
+        periods.append((start, end, "nonexistent" if offset_after > offset_before else "ambiguous", None, switch_utc))
+        cursor = end
+    periods.append((cursor, datetime.max, "normal", offsets[-1], None))
+    return pd.DataFrame(periods, columns=["local_start", "local_end", "kind", "utc_offset", "switch_utc"])
+
+def _epoch_us(value: datetime) -> int:
+    return (value - datetime(1970, 1, 1)) // timedelta(microseconds=1)
+
+def _utc_epoch_us_sql(periods: list[dict], us: str) -> str:
+    # a binary search over the periods, written out as nested CASEs on the local epoch microseconds `us`
+    if len(periods) == 1:
+        period = periods[0]
+        if period["kind"] == "normal":
+            return f"{us} - {int(period['utc_offset']) * 1_000_000}"
+        if period["kind"] == "nonexistent":
+            return str(_epoch_us(period["switch_utc"]))
+        return "NULL"
+    mid = len(periods) // 2
+    return (
+        f"CASE WHEN {us} < {_epoch_us(periods[mid]['local_start'])} "
+        f"THEN {_utc_epoch_us_sql(periods[:mid], us)} ELSE {_utc_epoch_us_sql(periods[mid:], us)} END"
+    )
+
+def register_mimic_tz_conversion(conn: duckdb.DuckDBPyConnection):
+    """
+    Define the `mimic_to_utc(ts)` SQL macro on a connection: the in-engine equivalent of `convert_tz_to_utc`,
+    converting a local MIMIC TIMESTAMP to a UTC TIMESTAMPTZ. Also sets the session time zone to UTC
+    so that TIMESTAMPTZ columns come out of `.df()` as UTC.
+    """
+    periods = mimic_tz_periods().to_dict("records")
+    conn.execute("SET TimeZone = 'UTC'")
+    conn.execute(f"""
+    CREATE OR REPLACE TEMP MACRO _mimic_utc_epoch_us(us) AS {_utc_epoch_us_sql(periods, "us")}
+    """)
+    # make_timestamptz(micros) avoids the (much slower) ICU time zone conversion of a TIMESTAMP cast
+    conn.execute("""
+    CREATE OR REPLACE TEMP MACRO mimic_to_utc(ts) AS make_timestamptz(_mimic_utc_epoch_us(epoch_us(ts)))
+    """)
+
+# -----------
+#   DuckDB
+# -----------
+
+def duckdb_settings(**overrides) -> dict:
+    '''
+    The settings applied to every duckdb connection, from "duckdb" in config.json, updated with `overrides`.
+    '''
+    settings = {
+        "temp_directory": DUCKDB_TEMP_DIR,
+        "preserve_insertion_order": DUCKDB_CONFIG.get("preserve_insertion_order", 1) == 1,
+    }
+    for key in ["memory_limit", "threads", "max_temp_directory_size"]:
+        if DUCKDB_CONFIG.get(key):
+            settings[key] = DUCKDB_CONFIG[key]
+    settings.update(overrides)
+    return settings
+
+def configure_duckdb(conn: duckdb.DuckDBPyConnection, name: str, **overrides):
+    '''
+    Apply the out-of-core settings to a connection. Each connection (i.e. in-memory database) spills
+    to its own subdirectory of the temp directory, named after the process and `name`.
+    '''
+    settings = duckdb_settings(**overrides)
+    # duckdb creates the subdirectory when it first spills, but not its parents
+    Path(settings["temp_directory"]).mkdir(parents=True, exist_ok=True)
+    settings["temp_directory"] = f"{settings['temp_directory']}/{os.getpid()}_{name}"
+    for key, value in settings.items():
+        conn.execute(f"SET {key} = {value if isinstance(value, (bool, int, float)) else repr(str(value))}")
+
+# every connection the pipeline uses: `con` and the default connection used by `duckdb.query()`
+for _name, _conn in (("con", con), ("default", duckdb.default_connection())):
+    configure_duckdb(_conn, _name)
+    register_mimic_tz_conversion(_conn)
+
 def convert_and_sort_datetime(df: pd.DataFrame, additional_cols: list[str] = None):
     if not additional_cols:
         additional_cols = []
@@ -345,6 +851,16 @@ def find_duplicates(df: pd.DataFrame, cols: list[str] = ["hadm_id", "time", "ite
     """
     return df[df.duplicated(subset=cols, keep=False)]
 
+def cumulative_or(df: pd.DataFrame, flag_col: str, group_col: str) -> pd.Series:
+    '''
+    Whether `flag_col` has been true in any row so far of the same `group_col`, in the order of the rows of df:
+    a "once true, stays true" flag. Null flags count as false.
+    The same as `df.groupby(group_col)[flag_col].transform(lambda x: x.cumsum().astype(bool))`, but vectorized
+    (a cummax per group) instead of calling python once per group.
+    '''
+    flag = df[flag_col].fillna(False).astype(bool)
+    return flag.groupby(df[group_col], sort=False, dropna=False).cummax()
+
 def check_duplicates(df: pd.DataFrame, additional_cols: list = None):
     """
     Check whether there are duplicates -- more than one populated value -- for what is supposed to be
@@ -460,7 +976,7 @@ def fetch_mimic_events_by_eventtable(
         logger.warning(f"{table_name} not yet supported, thus returning all columns")
     query = f"""
     SELECT {cols}
-    FROM '{mimic_table_pathfinder(table_name)}' 
+    FROM {mimic_table_source(table_name, mimic_events_source(table_name, item_ids))}
     LEFT JOIN '{mimic_table_pathfinder("d_items")}' USING (itemid)
     WHERE itemid IN ({','.join(map(str, item_ids))})
     """
@@ -478,7 +994,7 @@ def fetch_mimic_events(item_ids: list[int], original: bool = False, for_labs: bo
     if for_labs:
         query = f"""
         SELECT *
-        FROM '{mimic_table_pathfinder("labevents")}'
+        FROM {mimic_table_source("labevents")}
         WHERE itemid IN ({','.join(map(str, item_ids))})
             AND hadm_id IS NOT NULL
         """
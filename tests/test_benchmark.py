@@ -0,0 +1,65 @@
+"""Tests for the comparison of benchmark results against the baseline."""
+import pytest
+from src.benchmark import compare_to_baseline, save_baseline, load_baseline
+
+
+@pytest.fixture
+def baseline() -> dict:
+    """Baseline measurements of two jobs at 1000 admissions.
+
+    Returns
+    -------
+    dict
+        {scale: {job: measurements}}, as stored in benchmarks/baseline.json.
+    """
+    return {
+        "1000": {
+            "labs": {"seconds": 10.0, "peak_rss_mb": 1000.0, "nodes": {"labs": {"le_labs": {"seconds": 6.0}}}},
+            "vitals": {"seconds": 5.0, "peak_rss_mb": 500.0, "nodes": {}},
+        }
+    }
+
+
+def test_no_regression_within_threshold(baseline):
+    results = {"1000": {
+        "labs": {"seconds": 11.5, "peak_rss_mb": 1100.0, "nodes": {}},
+        "vitals": {"seconds": 4.0, "peak_rss_mb": 500.0, "nodes": {}},
+    }}
+    assert compare_to_baseline(results, baseline, threshold=0.2) == []
+
+
+def test_slower_job_regresses_with_its_slowest_nodes(baseline):
+    results = {"1000": {
+        "labs": {"seconds": 15.0, "peak_rss_mb": 1000.0, "nodes": {"labs": {"le_labs": {"seconds": 11.0}}}},
+    }}
+    [regression] = compare_to_baseline(results, baseline, threshold=0.2)
+    assert (regression["job"], regression["metric"], regression["change"]) == ("labs", "seconds", 0.5)
+    assert regression["slowest_nodes"] == ["labs.le_labs (6.0s -> 11.0s)"]
+
+
+def test_small_absolute_changes_are_noise(baseline):
+    """A 40% slowdown of a 5-second job is within the 2-second margin."""
+    results = {"1000": {"vitals": {"seconds": 7.0, "peak_rss_mb": 500.0, "nodes": {}}}}
+    assert compare_to_baseline(results, baseline, threshold=0.2) == []
+    assert len(compare_to_baseline(results, baseline, threshold=0.2, min_deltas={"seconds": 1.0})) == 1
+
+
+def test_failed_job_and_memory_regress(baseline):
+    results = {"1000": {"labs": None, "vitals": {"seconds": 5.0, "peak_rss_mb": 800.0, "nodes": {}}}}
+    regressions = compare_to_baseline(results, baseline, threshold=0.2)
+    assert {(r["job"], r["metric"]) for r in regressions} == {("labs", "failed"), ("vitals", "peak_rss_mb")}
+
+
+def test_jobs_and_scales_without_baseline_are_skipped(baseline):
+    results = {"1000": {"adt": {"seconds": 100.0, "peak_rss_mb": 1.0}}, "10000": {"labs": None}}
+    assert compare_to_baseline(results, baseline) == []
+
+
+def test_save_baseline_merges(tmp_path, baseline):
+    path = tmp_path / "baseline.json"
+    save_baseline(baseline, path)
+    save_baseline({"1000": {"labs": {"seconds": 9.0}, "vitals": None}, "10000": {"labs": {"seconds": 90.0}}}, path)
+    merged = load_baseline(path)
+    assert merged["1000"]["labs"] == {"seconds": 9.0}
+    assert merged["1000"]["vitals"] == baseline["1000"]["vitals"]
+    assert merged["10000"]["labs"] == {"seconds": 90.0}
@@ -0,0 +1,79 @@
+"""Tests for restricting the MIMIC scans to the cohort configured under "cohort" in config.json."""
+import pytest
+import duckdb
+import src.utils
+from src.utils import mimic_table_source, mimic_table_pathfinder, cohort_settings
+from src.synthetic_mimic import generate_synthetic_mimic
+
+
+@pytest.fixture(scope="module")
+def synthetic_dir(tmp_path_factory):
+    """A small synthetic MIMIC-IV dataset.
+
+    Returns
+    -------
+    pathlib.Path
+        Directory holding the `hosp/` and `icu/` parquet files of 20 patients and 40 admissions.
+    """
+    output_dir = tmp_path_factory.mktemp("synthetic_mimic")
+    generate_synthetic_mimic(output_dir, n_patients=20, n_admissions=40, events_per_icu_day=50, seed=2)
+    return output_dir
+
+
+@pytest.fixture
+def cohort(monkeypatch, synthetic_dir):
+    """Point the MIMIC tables at the synthetic dataset, with no cohort restriction.
+
+    Returns
+    -------
+    Callable
+        Sets the cohort's subject_ids, hadm_ids and sample_fraction.
+    """
+    monkeypatch.setattr(src.utils, "MIMIC_PARQUET_DIR", str(synthetic_dir))
+    monkeypatch.setattr(src.utils, "COHORT_SUBJECT_IDS", [])
+    monkeypatch.setattr(src.utils, "COHORT_HADM_IDS", [])
+    monkeypatch.setattr(src.utils, "COHORT_SAMPLE_FRACTION", 1.0)
+
+    def set_cohort(subject_ids=(), hadm_ids=(), sample_fraction=1.0):
+        monkeypatch.setattr(src.utils, "COHORT_SUBJECT_IDS", sorted(subject_ids))
+        monkeypatch.setattr(src.utils, "COHORT_HADM_IDS", sorted(hadm_ids))
+        monkeypatch.setattr(src.utils, "COHORT_SAMPLE_FRACTION", sample_fraction)
+    return set_cohort
+
+
+def _ids(table: str, column: str) -> set[int]:
+    return {row[0] for row in duckdb.sql(f"SELECT DISTINCT {column} FROM {mimic_table_source(table)}").fetchall()}
+
+
+def test_no_cohort_reads_the_table(cohort):
+    assert mimic_table_source("admissions") == f"'{mimic_table_pathfinder('admissions')}'"
+    assert cohort_settings() == {}
+
+
+def test_hadm_ids_restrict_admissions_and_their_patients(cohort):
+    admissions = duckdb.sql(f"SELECT hadm_id, subject_id FROM '{mimic_table_pathfinder('admissions')}'").fetchall()
+    chosen = dict(admissions[:3])
+    cohort(hadm_ids=chosen)
+    assert _ids("admissions", "hadm_id") == set(chosen)
+    assert _ids("transfers", "hadm_id") <= set(chosen)
+    assert _ids("patients", "subject_id") == set(chosen.values())
+    # the dictionaries have neither column and are never restricted
+    assert mimic_table_source("d_items") == f"'{mimic_table_pathfinder('d_items')}'"
+
+
+def test_subject_ids_restrict_every_table(cohort):
+    cohort(subject_ids=[10000001, 10000002])
+    assert _ids("patients", "subject_id") == {10000001, 10000002}
+    assert _ids("chartevents", "subject_id") <= {10000001, 10000002}
+
+
+def test_hash_sample_is_deterministic_and_nested(cohort):
+    cohort(sample_fraction=0.5)
+    half = _ids("admissions", "hadm_id")
+    assert half == _ids("admissions", "hadm_id")
+    assert 0 < len(half) < 40
+    assert _ids("chartevents", "hadm_id") <= half
+    # a smaller sample keeps a subset of the admissions of a larger one
+    cohort(sample_fraction=0.2)
+    assert _ids("admissions", "hadm_id") <= half
+    assert cohort_settings() == {"sample_fraction": 0.2}
@@ -0,0 +1,60 @@
+"""Tests for the input and output tables built from a single scan of outputevents."""
+import pytest
+import pandas as pd
+import src.utils
+from src.scheduler import plan_jobs
+from src.synthetic_mimic import generate_synthetic_mimic
+from src.tables.input_output import (
+    input_mapping, input_mapping_to_map, output_mapping, output_mapping_to_map, outputevents_extracted,
+    clif_input, clif_output,
+)
+
+
+@pytest.fixture(scope="module")
+def synthetic_dir(tmp_path_factory):
+    """A small synthetic MIMIC-IV dataset.
+
+    Returns
+    -------
+    pathlib.Path
+        Directory holding the `hosp/` and `icu/` parquet files of 20 patients and 40 admissions.
+    """
+    output_dir = tmp_path_factory.mktemp("synthetic_mimic")
+    generate_synthetic_mimic(output_dir, n_patients=20, n_admissions=40, events_per_icu_day=50, seed=3)
+    return output_dir
+
+
+@pytest.fixture
+def mappings(monkeypatch, synthetic_dir) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Point the MIMIC tables at the synthetic dataset, with no cohort restriction.
+
+    Returns
+    -------
+    tuple[pd.DataFrame, pd.DataFrame]
+        The input and output mappings of the items to map.
+    """
+    monkeypatch.setattr(src.utils, "MIMIC_PARQUET_DIR", str(synthetic_dir))
+    monkeypatch.setattr(src.utils, "COHORT_SUBJECT_IDS", [])
+    monkeypatch.setattr(src.utils, "COHORT_HADM_IDS", [])
+    monkeypatch.setattr(src.utils, "COHORT_SAMPLE_FRACTION", 1.0)
+    monkeypatch.setattr(src.utils, "SHARD_COUNT", 1)
+    return input_mapping_to_map(input_mapping()), output_mapping_to_map(output_mapping())
+
+
+def _sorted(relation) -> pd.DataFrame:
+    df = relation.df()
+    return df.sort_values(list(df.columns), ignore_index=True)
+
+
+def test_both_tables_from_one_scan_match_separate_scans(mappings):
+    both = outputevents_extracted(*mappings, clif_tables=["input", "output"])
+    for clif_table, build in (("input", clif_input), ("output", clif_output)):
+        alone = outputevents_extracted(*mappings, clif_tables=[clif_table])
+        table = _sorted(build(both))
+        assert len(table) > 0
+        pd.testing.assert_frame_equal(table, _sorted(build(alone)))
+
+
+def test_input_and_output_are_built_by_one_job():
+    assert plan_jobs(["vitals", "input", "output"]) == ["vitals", "input_output"]
+    assert plan_jobs(["input", "vitals"]) == ["input", "vitals"]
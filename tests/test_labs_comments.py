@@ -0,0 +1,45 @@
+"""Parity of the in-engine parsing of lab comments (`_parse_labs_comment_sql`) with `_parse_labs_comment`."""
+import random
+import pytest
+import duckdb
+import numpy as np
+import pandas as pd
+from src.tables.labs import _parse_labs_comment, _parse_labs_comment_sql, le_labs_comments_parsed
+
+
+@pytest.fixture(scope="module")
+def comments() -> list[str]:
+    """Lab comments covering the rules of `_parse_labs_comment`, and random ones mixing their tokens.
+
+    Returns
+    -------
+    list[str]
+        Comments, including empty ones and ones without a number.
+    """
+    handcrafted = [
+        "1.5", "<0.5", ">1000", "12.", ".5", "1.2.3", "0012", "-5", "3 x 10^9", "HEMOLYZED 12,345",
+        "NOT DONE", "Test not done, 4.5", "Unable to report", "UNABLE TO REPORT DUE TO 3 CLOTS",
+        "PTT unable to calculate, 45.2", "ptt UNABLE", "ptt 150", "no number here", "", " ", "1e5", "1.5e3",
+    ]
+    rng = random.Random(0)
+    tokens = ["ptt", "PTT", "unable", "Unable", "not done", "NOT", "done", "1", "23", ".", "4.56", ",", " ", "x", "<"]
+    fuzzed = ["".join(rng.choices(tokens, k=rng.randint(1, 6))) for _ in range(2000)]
+    return handcrafted + fuzzed
+
+
+def test_sql_matches_python(comments):
+    df = pd.DataFrame({"comments": comments})
+    parsed = duckdb.sql(f"SELECT parsed: {_parse_labs_comment_sql('comments')} FROM df").df()["parsed"]
+    expected = pd.Series([_parse_labs_comment(comment) for comment in comments], dtype=float)
+    np.testing.assert_array_equal(parsed.to_numpy(dtype=float), expected.to_numpy())
+
+
+def test_only_missing_values_are_parsed():
+    le_labs_extracted = pd.DataFrame({
+        "valuenum": [7.0, np.nan, np.nan],
+        "value": ["7", None, None],
+        "comments": ["see 12", "unable to report", None],
+    })
+    parsed = le_labs_comments_parsed(le_labs_extracted).df()
+    assert list(parsed["valuenum"].fillna(-1)) == [7.0, -1, -1]
+    assert list(parsed["value"]) == ["7", "unable to report", None]
@@ -8,9 +8,12 @@ import pytest
 import pandas as pd
 from pathlib import Path
 from src.tables.medication_admin import (
-    cont_flattened, cont_deduped
+    cont_flattened, cont_deduped, med_route_mapping, med_route_mapping_by_id, med_route_mapped,
+    med_events_extracted, MED_ROUTE_COLS
 )
-from src.utils import mapping_path_finder
+import src.utils
+from src.utils import mapping_path_finder, mimic_table_pathfinder
+from src.synthetic_mimic import generate_synthetic_mimic
 import duckdb
 
 # --- Helper Fixtures for CSV Loading ---
@@ -216,3 +219,66 @@ def test_flatten_timestamps_combined(med_admin_input_data, med_admin_expected_ou
         expected_subset['mar_action_category'].reset_index(drop=True),
         check_names=False
     )
+
+
+def test_cont_deduped_is_a_checkpoint(med_admin_input_data):
+    """The flattened and the deduped continuous rows are each executed once into a temp table, which the
+    dedup window, the save and the counts read.
+
+    Parameters
+    ----------
+    med_admin_input_data : pd.DataFrame
+        Test fixture containing input medication events with start/end times.
+    """
+    input_df = med_admin_input_data
+    flattened = cont_flattened(duckdb.sql("SELECT * FROM input_df"))
+    mar_action_dedup_mapping = pd.read_csv(mapping_path_finder("mar_action_dedup"))
+    deduped = cont_deduped(flattened, mar_action_dedup_mapping)
+
+    temp_tables = duckdb.sql("SELECT table_name FROM duckdb_tables() WHERE temporary").df()["table_name"]
+    assert {"medication_admin_cont_flattened", "medication_admin_cont_deduped"} <= set(temp_tables)
+    assert flattened.fetchall() == duckdb.table("medication_admin_cont_flattened").fetchall()
+    assert deduped.fetchall() == duckdb.table("medication_admin_cont_deduped").fetchall()
+
+
+def test_route_mapping_keeps_one_row_per_event():
+    """Every route of the mappings, with and without the itemid and with each column nulled, maps to at most one
+    route category, so that the joins keep the number of events."""
+    mapping, mapping_by_id = med_route_mapping(), med_route_mapping_by_id()
+    mimic_cols = {f"mimic_{col}": col for col in MED_ROUTE_COLS}
+    routes = pd.concat([
+        mapping[list(mimic_cols)].assign(med_id=mapping_by_id["med_id"].iloc[0]),
+        mapping_by_id[list(mimic_cols) + ["med_id"]],
+        mapping_by_id[list(mimic_cols) + ["med_id"]].assign(mimic_secondaryordercategoryname="Continuous Med"),
+    ]).rename(columns=mimic_cols | {"med_id": "itemid"})
+    nulled = [routes.assign(**{col: None}) for col in MED_ROUTE_COLS]
+    med_events_extracted = pd.concat([routes, *nulled], ignore_index=True)
+    med_events_extracted["itemid"] = med_events_extracted["itemid"].astype(int)
+
+    mapped = med_route_mapped(med_events_extracted, mapping, mapping_by_id).df()
+    assert len(mapped) == len(med_events_extracted)
+    assert mapped["med_route_category"].notna().any() and mapped["med_route_category"].isna().any()
+    # the 'SPECIAL' routes are mapped by itemid
+    assert set(mapped["med_route_category"].dropna()) >= set(mapping_by_id["clif_med_route_category"].dropna())
+
+
+def test_med_events_are_extracted_in_engine_with_whitespace_collapsed(monkeypatch, tmp_path):
+    """The extract is a lazy relation over inputevents, with `ordercomponenttypedescription` normalized."""
+    generate_synthetic_mimic(tmp_path, n_patients=5, n_admissions=10, events_per_icu_day=20, seed=1)
+    monkeypatch.setattr(src.utils, "MIMIC_PARQUET_DIR", str(tmp_path))
+    monkeypatch.setattr(src.utils, "COHORT_SUBJECT_IDS", [])
+    monkeypatch.setattr(src.utils, "COHORT_HADM_IDS", [])
+    monkeypatch.setattr(src.utils, "COHORT_SAMPLE_FRACTION", 1.0)
+    monkeypatch.setattr(src.utils, "SHARD_COUNT", 1)
+    inputevents_path = mimic_table_pathfinder("inputevents")
+    inputevents = pd.read_parquet(inputevents_path)
+    inputevents["ordercomponenttypedescription"] = "  Main \t order  parameter "
+    inputevents.to_parquet(inputevents_path, index=False)
+    item_ids = inputevents["itemid"].drop_duplicates().head(3)
+
+    extracted = med_events_extracted(item_ids)
+    assert isinstance(extracted, duckdb.DuckDBPyRelation)
+    events = extracted.df()
+    assert len(events) == inputevents["itemid"].isin(item_ids).sum()
+    assert set(events["ordercomponenttypedescription"]) == {"Main order parameter"}
+    assert events["label"].notna().all()
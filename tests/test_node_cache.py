@@ -0,0 +1,85 @@
+"""Tests for the cross-run node cache: invalidation by the files a node reads, and the LRU eviction."""
+import os
+import duckdb
+import pytest
+import pandas as pd
+from hamilton import ad_hoc_utils, driver
+from src.fingerprint import track_input
+from src.node_cache import NodeCacheAdapter, evict_least_recently_used
+
+# nodes executed by the last run, appended to by the nodes of the module below
+executed: list[str] = []
+mapping_path: list[str] = []
+
+
+def mapping() -> pd.DataFrame:
+    executed.append("mapping")
+    return pd.read_csv(track_input(mapping_path[0]))
+
+
+def doubled(mapping: pd.DataFrame) -> pd.DataFrame:
+    executed.append("doubled")
+    return mapping * 2
+
+
+def events() -> pd.DataFrame:
+    executed.append("events")
+    return pd.DataFrame({"x": [1, 2, 3]})
+
+
+def joined(doubled: pd.DataFrame, events: pd.DataFrame) -> duckdb.DuckDBPyRelation:
+    executed.append("joined")
+    return duckdb.sql("FROM events JOIN doubled USING (x)")
+
+
+@pytest.fixture
+def table_module(tmp_path):
+    """A tiny table module reading a mapping csv, with a lazy relation as its final node.
+
+    Returns
+    -------
+    module
+        The Hamilton module, whose mapping csv is at `mapping_path[0]`.
+    """
+    mapping_path[:] = [str(tmp_path / "mapping.csv")]
+    pd.DataFrame({"x": [1, 2]}).to_csv(mapping_path[0], index=False)
+    return ad_hoc_utils.create_temporary_module(mapping, doubled, events, joined)
+
+
+def _run(table_module, cache_path) -> list[str]:
+    executed.clear()
+    dr = (
+        driver.Builder()
+        .with_modules(table_module)
+        .with_adapters(NodeCacheAdapter(table_module.__name__, path=cache_path, max_bytes=2**30))
+        .build()
+    )
+    dr.execute(["joined"])
+    return sorted(executed)
+
+
+def test_only_nodes_reading_changed_files_rerun(table_module, tmp_path):
+    cache_path = tmp_path / "node_cache"
+    assert _run(table_module, cache_path) == ["doubled", "events", "joined", "mapping"]
+    # relations are never cached
+    assert _run(table_module, cache_path) == ["joined"]
+    pd.DataFrame({"x": [1, 3]}).to_csv(mapping_path[0], index=False)
+    assert _run(table_module, cache_path) == ["doubled", "joined", "mapping"]
+
+
+def test_missing_sources_invalidate_the_result(table_module, tmp_path):
+    cache_path = tmp_path / "node_cache"
+    _run(table_module, cache_path)
+    for path in (cache_path / "sources").iterdir():
+        path.unlink()
+    assert _run(table_module, cache_path) == ["doubled", "events", "joined", "mapping"]
+
+
+def test_least_recently_used_files_are_evicted_first(tmp_path):
+    for age, name in enumerate(["newest", "middle", "oldest"]):
+        path = tmp_path / name
+        path.write_bytes(b"0" * 100)
+        os.utime(path, (1_000_000 - age, 1_000_000 - age))
+    (tmp_path / "metadata_store.db").write_bytes(b"0" * 1000)
+    assert evict_least_recently_used(tmp_path, max_bytes=150) == 200
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["metadata_store.db", "newest"]
@@ -0,0 +1,98 @@
+"""Tests for the patient assessments module: the fan-out of the single extraction to each assessment."""
+import pytest
+import duckdb
+import pandas as pd
+from src.tables.patient_assessments import (
+    rass_fetched, braden_fetched, cam_extracted, cam_wide, cam_total_computed, cam_long, cam_fetched,
+    sbt_id_to_category_mapper, sbt_extracted, sbt_translated, sbt_fetched, gcs_raw_fetched,
+    pa_category_to_group_mapping, merged_and_cleaned, gcs_fetched, PA_SCHEMA,
+)
+from src.utils import validate_clif_table
+
+RASS = 228096
+BRADEN_ACTIVITY, BRADEN_MOBILITY = 224054, 224056
+CAM_MS_CHANGE, CAM_INATTENTION, CAM_THINKING = 228300, 228337, 228302
+SBT_DELIVERY = 224717
+GCS_VERBAL, GCS_MOTOR, GCS_EYES = 223900, 223901, 220739
+
+
+def _events(rows: list[tuple]) -> duckdb.DuckDBPyRelation:
+    """Assessment events as extracted, from (hadm_id, hour, itemid, label, value) in file order."""
+    events = pd.DataFrame(rows, columns=["hadm_id", "hour", "itemid", "label", "value"])
+    events["time"] = pd.Timestamp("2150-01-01") + pd.to_timedelta(events.pop("hour"), unit="h")
+    events["subject_id"] = 1
+    events["stay_id"] = events["hadm_id"] + 100
+    events["charttime"] = events["time"]
+    events["valuenum"] = pd.to_numeric(events["value"], errors="coerce")
+    events["valueuom"] = None
+    events["event_order"] = range(len(events))
+    return duckdb.sql("FROM events")
+
+
+@pytest.fixture
+def assessment_events() -> duckdb.DuckDBPyRelation:
+    """One admission with a score of every assessment.
+
+    Returns
+    -------
+    duckdb.DuckDBPyRelation
+        The events, with the columns of the `assessment_events` node.
+    """
+    return _events([
+        (1, 0, RASS, "Richmond-RAS Scale", "-2 Light sedation"),
+        (1, 0, RASS, "Richmond-RAS Scale", "-2 Light sedation"),
+        (1, 0, BRADEN_ACTIVITY, "Braden Activity", "Bedfast"),
+        (1, 0, BRADEN_MOBILITY, "Braden Mobility", "Very Limited"),
+        (1, 1, CAM_MS_CHANGE, "CAM-ICU MS change", "Yes"),
+        (1, 1, CAM_INATTENTION, "CAM-ICU Inattention", "Yes"),
+        (1, 1, CAM_THINKING, "CAM-ICU Disorganized thinking", "Yes"),
+        (1, 2, SBT_DELIVERY, "SBT Successfully Completed", "No"),
+        (1, 3, GCS_VERBAL, "GCS - Verbal Response", "5"),
+        (1, 3, GCS_MOTOR, "GCS - Motor Response", "6"),
+        (1, 3, GCS_EYES, "GCS - Eye Opening", "4"),
+    ])
+
+
+def _cam(assessment_events) -> duckdb.DuckDBPyRelation:
+    return cam_fetched(cam_long(cam_total_computed(cam_wide(cam_extracted(assessment_events)))))
+
+
+def _sbt(assessment_events) -> duckdb.DuckDBPyRelation:
+    return sbt_fetched(sbt_translated(sbt_id_to_category_mapper(), sbt_extracted(assessment_events)))
+
+
+def test_rass_score_is_kept_once_per_time(assessment_events):
+    rass = rass_fetched(assessment_events).df()
+    assert list(rass["numerical_value"]) == [-2.0]
+    assert list(rass["text_value"]) == ["-2 Light sedation"]
+
+
+def test_braden_total_needs_every_sub_score(assessment_events):
+    braden = braden_fetched(assessment_events).df().set_index("assessment_category")
+    assert braden.loc["braden_activity", "numerical_value"] == 1
+    assert braden.loc["braden_mobility", "categorical_value"] == "Very Limited"
+    assert "braden_total" not in braden.index
+
+
+def test_cam_total_is_computed_from_sub_scores(assessment_events):
+    cam = _cam(assessment_events).df().set_index("assessment_category")
+    assert cam.loc["cam_total", "categorical_value"] == "Positive"
+    assert cam.loc["cam_mental", "assessment_name"] == "CAM-ICU MS Change"
+
+
+def test_merged_assessments_match_the_clif_schema(assessment_events):
+    merged = merged_and_cleaned(
+        pa_category_to_group_mapping(), gcs_fetched(assessment_events), rass_fetched(assessment_events),
+        braden_fetched(assessment_events), _cam(assessment_events), _sbt(assessment_events),
+    ).df()
+    assert merged.set_index("assessment_category").loc["gcs_total", "numerical_value"] == 15.0
+    assert merged.set_index("assessment_category").loc["sbt_delivery_pass_fail", "categorical_value"] == "Fail"
+    assert not merged["assessment_group"].isna().any()
+    # numerical_value is written as a double, where PA_SCHEMA still expects a float32
+    validate_clif_table(PA_SCHEMA.remove_columns(["numerical_value"]), merged.drop(columns="numerical_value"))
+
+
+def test_raw_gcs_keeps_the_sub_scores(assessment_events):
+    raw = gcs_raw_fetched(assessment_events).df().set_index("assessment_category")
+    assert raw["numerical_value"].to_dict() == {"gcs_verbal": 5.0, "gcs_motor": 6.0, "gcs_eyes": 4.0}
+    assert raw["text_value"].isna().all()
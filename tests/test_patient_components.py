@@ -0,0 +1,83 @@
+"""Tests for the patient table built from one scan of admissions and of patients, with the mappings as lookups."""
+import pytest
+import duckdb
+import pandas as pd
+from src.tables.patient import (
+    race_ethnicity_mapping, race_mapper, ethnicity_mapper, race_ethnicity_lookup, language_lookup,
+    sex_translated, race_ethn_translated, race_ethn_uninformative, race_ethn_ranked, race_ethn_cleaned,
+    test_no_null_race_ethn_categories as no_null_race_ethn_categories, death_extracted, language_translated,
+    merged, duplicates_removed, CLIF_PATIENT_SCHEMA,
+)
+from src.utils import validate_clif_table
+
+
+@pytest.fixture(scope="module")
+def race_ethnicity() -> pd.DataFrame:
+    """The race and ethnicity lookup table of the mapping csv.
+
+    Returns
+    -------
+    pd.DataFrame
+        Columns race_name, race_category and ethnicity_category.
+    """
+    mapping = race_ethnicity_mapping()
+    return race_ethnicity_lookup(race_mapper(mapping), ethnicity_mapper(mapping))
+
+
+def _admissions(rows: list[tuple]) -> duckdb.DuckDBPyRelation:
+    """Admissions as extracted, from (subject_id, hadm_id, race, language, day of admission, deathtime)."""
+    admissions = pd.DataFrame(rows, columns=["subject_id", "hadm_id", "race", "language", "day", "deathtime"])
+    admissions["admittime"] = pd.Timestamp("2150-01-01") + pd.to_timedelta(admissions.pop("day"), unit="D")
+    admissions["dischtime"] = admissions["admittime"] + pd.Timedelta(days=2)
+    admissions["deathtime"] = pd.to_datetime(admissions["deathtime"])
+    return duckdb.sql("FROM admissions SELECT subject_id, hadm_id, race, language, admittime, dischtime, deathtime")
+
+
+def _patients(rows: list[tuple]) -> duckdb.DuckDBPyRelation:
+    """Patients as extracted, from (subject_id, gender, dod)."""
+    patients = pd.DataFrame(rows, columns=["subject_id", "gender", "dod"])
+    patients["dod"] = pd.to_datetime(patients["dod"])
+    return duckdb.sql("FROM patients")
+
+
+def _patient(admissions, patients, race_ethnicity) -> pd.DataFrame:
+    race_ethn = race_ethn_cleaned(race_ethn_ranked(race_ethn_uninformative(
+        race_ethn_translated(admissions, race_ethnicity)
+    )))
+    assert no_null_race_ethn_categories(race_ethn)
+    patient = duplicates_removed(merged(
+        race_ethn, sex_translated(patients), death_extracted(admissions, patients),
+        language_translated(admissions, language_lookup()),
+    ))
+    validate_clif_table(CLIF_PATIENT_SCHEMA, patient)
+    return patient.df().sort_values("patient_id", ignore_index=True).set_index("patient_id")
+
+
+def test_most_frequent_informative_race_is_kept(race_ethnicity):
+    admissions = _admissions([
+        (1, 10, "UNKNOWN", "English", 0, None),
+        (1, 11, "WHITE", "English", 1, None),
+        (2, 20, None, "Klingon", 0, None),
+    ])
+    patient = _patient(admissions, _patients([(1, "F", None), (2, "M", None)]), race_ethnicity)
+    assert patient.loc["1", "race_category"] == "White"
+    assert patient.loc["1", "ethnicity_category"] == "Non-Hispanic"
+    assert patient.loc["2", "race_category"] == "Unknown"
+    assert patient.loc["1", "language_category"] == "English"
+    # a language missing from LANGUAGE_MAPPER
+    assert patient.loc["2", "language_category"] == "Unknown or NA"
+    assert list(patient["sex_category"]) == ["Female", "Male"]
+
+
+def test_death_in_hospital_is_preferred_over_date_of_death(race_ethnicity):
+    admissions = _admissions([
+        (1, 10, "WHITE", "English", 0, "2150-01-02 10:00"),
+        (2, 20, "WHITE", "English", 0, None),
+    ])
+    patients = _patients([(1, "F", "2150-01-03"), (2, "M", "2150-02-01"), (3, "M", None)])
+    patient = _patient(admissions, patients, race_ethnicity)
+    assert list(patient.index) == ["1", "2", "3"]
+    assert patient["death_dttm"].dt.tz_convert("America/New_York").dt.tz_localize(None).tolist()[:2] == [
+        pd.Timestamp("2150-01-02 10:00"), pd.Timestamp("2150-02-01"),
+    ]
+    assert pd.isna(patient.loc["3", "death_dttm"])
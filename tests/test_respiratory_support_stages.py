@@ -0,0 +1,116 @@
+"""Tests for the relational cleaning stages of the respiratory_support module.
+
+The stages are run on handcrafted events covering the cases the earlier pandas implementation
+resolved: outlying fio2_set values, duplicated devices of different ranks, the duplicated reads of the
+conflicting stay, the coalescing of the items of one variable, and the carrying forward of tracheostomy.
+"""
+import pytest
+import duckdb
+import numpy as np
+import pandas as pd
+from src.utils import cumulative_or
+from src.tables.respiratory_support import (
+    resp_mapping, resp_mapper, resp_device_mapper, resp_mode_mapper, resp_device_ranks, resp_mode_categories,
+    none_value_rows_removed, fio2_set_cleaned, duplicates_removed, pivoted_wider_and_coalesced,
+    renamed_reordered_recasted, tracheostomy_imputed, DEVICE_ITEM_ID, CONFLICTING_STAY_ID, RESP_COLUMNS,
+)
+
+FIO2 = 223835
+PEEP_SET = [220339, 227579]
+MODE_NAME = [223849, 229314, 227577]
+
+
+@pytest.fixture(scope="module")
+def mappers() -> dict:
+    """The mappings of the respiratory_support module, as its nodes are given them.
+
+    Returns
+    -------
+    dict
+        resp_mapper, resp_device_ranks and resp_mode_categories.
+    """
+    return {
+        "resp_mapper": resp_mapper(resp_mapping()),
+        "resp_device_ranks": resp_device_ranks(resp_device_mapper()),
+        "resp_mode_categories": resp_mode_categories(resp_mode_mapper()),
+    }
+
+
+def _events(rows: list[tuple]) -> duckdb.DuckDBPyRelation:
+    """Events as extracted, from (hadm_id, stay_id, hour, itemid, value) in file order."""
+    events = pd.DataFrame(rows, columns=["hadm_id", "stay_id", "hour", "itemid", "value"])
+    events["time"] = pd.Timestamp("2150-01-01") + pd.to_timedelta(events.pop("hour"), unit="h")
+    events["event_order"] = range(len(events))
+    return duckdb.sql("FROM events SELECT itemid, hadm_id, stay_id, time, value, event_order")
+
+
+def _cleaned(events: duckdb.DuckDBPyRelation, mappers: dict) -> pd.DataFrame:
+    cleaned = fio2_set_cleaned(none_value_rows_removed(events), mappers["resp_mapper"])
+    return duplicates_removed(cleaned, mappers["resp_device_ranks"]).order("event_order").df()
+
+
+def test_fio2_set_outliers_are_dropped(mappers):
+    events = _events([(1, 1, hour, FIO2, value) for hour, value in enumerate(["50", "0.4", "10", "0.1", "100"])])
+    assert list(_cleaned(events, mappers)["value"].astype(float)) == [0.5, 0.4, 1.0]
+
+
+def test_none_values_of_other_items_raise(mappers):
+    with pytest.raises(ValueError):
+        none_value_rows_removed(_events([(1, 1, 0, FIO2, "None")]))
+    assert len(none_value_rows_removed(_events([(1, 1, 0, DEVICE_ITEM_ID, "None")]))) == 0
+
+
+def test_duplicates_keep_the_first_of_the_highest_ranked(mappers):
+    events = _events([
+        # a nasal cannula and two endotracheal tubes (IMV, ranked higher) recorded at once
+        (1, 1, 0, DEVICE_ITEM_ID, "Nasal cannula"),
+        (1, 1, 0, DEVICE_ITEM_ID, "Endotracheal tube "),
+        (1, 1, 0, DEVICE_ITEM_ID, "Endotracheal tube"),
+        # the reads of the conflicting stay are dropped in favor of the other stay's
+        (2, CONFLICTING_STAY_ID, 0, PEEP_SET[0], "5"),
+        (2, 2, 0, PEEP_SET[0], "8"),
+        # other duplicated reads keep the first one
+        (3, 3, 0, PEEP_SET[0], "10"),
+        (3, 3, 0, PEEP_SET[0], "12"),
+        (3, 3, 1, PEEP_SET[0], "14"),
+    ])
+    cleaned = _cleaned(events, mappers)
+    assert list(cleaned["event_order"]) == [1, 4, 5, 7]
+
+
+def test_items_are_coalesced_in_mapping_order(mappers):
+    events = _events([
+        (1, 1, 0, PEEP_SET[1], "6"),
+        (1, 1, 0, MODE_NAME[1], "PCV+"),
+        (1, 1, 0, MODE_NAME[2], "Other mode"),
+        (1, 1, 1, PEEP_SET[0], "5"),
+        (1, 1, 1, PEEP_SET[1], "7"),
+        (1, 1, 1, DEVICE_ITEM_ID, "Endotracheal tube"),
+    ])
+    wider = pivoted_wider_and_coalesced(
+        duplicates_removed(events, mappers["resp_device_ranks"]), mappers["resp_mapper"],
+        mappers["resp_device_ranks"], mappers["resp_mode_categories"],
+    )
+    resp = renamed_reordered_recasted(wider)
+    assert list(resp["peep_set"]) == [6.0, 5.0]
+    assert (resp["mode_name"].iloc[0], resp["mode_category"].iloc[0]) == ("PCV+", "Pressure Control")
+    assert resp["device_category"].iloc[1] == "IMV"
+    assert resp["hospitalization_id"].dtype == "string"
+    assert str(resp["recorded_dttm"].dt.tz) == "UTC"
+
+
+def test_tracheostomy_stays_true_once_implied():
+    resp = pd.DataFrame({
+        "hospitalization_id": pd.Series(["1", "1", "1", "2", "2", "3"], dtype="string"),
+        "device_name": [None, " Trach mask", "Endotracheal tube", "Endotracheal tube", None, None],
+        "tracheostomy": [None, None, None, None, 1.0, 0.0],
+    }).reindex(columns=RESP_COLUMNS)
+    resp = tracheostomy_imputed(resp)
+    assert list(resp["tracheostomy"]) == [False, True, True, False, True, False]
+
+
+def test_cumulative_or_matches_cumsum_per_group():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"group": rng.integers(0, 50, 2000), "flag": rng.random(2000) < 0.05})
+    expected = df.groupby("group")["flag"].transform(lambda x: x.cumsum().astype(bool))
+    pd.testing.assert_series_equal(cumulative_or(df, "flag", "group"), expected, check_names=False)
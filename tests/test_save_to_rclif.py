@@ -0,0 +1,37 @@
+"""Tests for saving the CLIF tables to parquet through a temporary file."""
+import pytest
+import duckdb
+import pandas as pd
+import src.utils
+from src.utils import save_to_rclif, clif_table_pathfinder
+
+
+@pytest.fixture
+def output_dir(monkeypatch, tmp_path):
+    """Write the CLIF tables under a temporary directory.
+
+    Returns
+    -------
+    pathlib.Path
+        The directory the tables are saved to.
+    """
+    monkeypatch.setattr(src.utils, "OUTPUT_DIR", str(tmp_path))
+    monkeypatch.setattr(src.utils, "CLIF_OUTPUT_DIR_NAME", "rclif")
+    return tmp_path / "rclif"
+
+
+@pytest.mark.parametrize("as_relation", [False, True])
+def test_unexpected_row_count_keeps_the_previous_table(output_dir, as_relation):
+    previous = pd.DataFrame({"hospitalization_id": ["1", "2"]})
+    save_to_rclif(previous, "adt", expected_rows=2)
+    data = pd.DataFrame({"hospitalization_id": ["1", "2", "3"]})
+    with pytest.raises(ValueError, match="expected 2"):
+        save_to_rclif(duckdb.sql("FROM data") if as_relation else data, "adt", expected_rows=2)
+    assert pd.read_parquet(clif_table_pathfinder("adt")).equals(previous)
+    assert [path.name for path in output_dir.iterdir()] == ["clif_adt.parquet"]
+
+
+def test_failed_dataframe_write_leaves_no_partial_table(output_dir):
+    with pytest.raises(Exception):
+        save_to_rclif(pd.DataFrame({"hospitalization_id": [object()]}), "adt")
+    assert list(output_dir.iterdir()) == []
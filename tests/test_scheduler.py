@@ -0,0 +1,59 @@
+"""Tests for running the jobs of a build."""
+import sys
+import types
+import pytest
+import duckdb
+import src.utils
+import src.scheduler
+from src.scheduler import run_job
+from src.utils import materialize, save_to_rclif
+
+# the number of times each fake job was built
+builds: dict[str, int] = {}
+
+
+def _fake_job(name: str) -> types.ModuleType:
+    def _main():
+        builds[name] = builds.get(name, 0) + 1
+        checkpoint = materialize(duckdb.sql("FROM range(10)"), f"{name}_checkpoint")
+        save_to_rclif(checkpoint, name)
+
+    module = types.ModuleType(f"src.tables.{name}")
+    module._main = _main
+    return module
+
+
+@pytest.fixture
+def fake_jobs(monkeypatch, tmp_path) -> list[str]:
+    """Two table modules that each materialize a checkpoint and save a table, under a temporary directory.
+
+    Returns
+    -------
+    list[str]
+        The names of the jobs, whose modules are registered as `src.tables.<name>`.
+    """
+    monkeypatch.setattr(src.utils, "OUTPUT_DIR", str(tmp_path))
+    monkeypatch.setattr(src.utils, "CLIF_OUTPUT_DIR_NAME", "rclif")
+    monkeypatch.setattr(src.scheduler, "SKIP_UNCHANGED_TABLES", True)
+    builds.clear()
+    names = ["fake_table_a", "fake_table_b"]
+    for name in names:
+        monkeypatch.setitem(sys.modules, f"src.tables.{name}", _fake_job(name))
+    return names
+
+
+def test_changing_how_tables_are_written_rebuilds_them(fake_jobs, monkeypatch):
+    job = fake_jobs[0]
+    assert not run_job(job).get("skipped")
+    assert run_job(job).get("skipped")
+    monkeypatch.setattr(src.utils, "RCLIF_COMPRESSION", "zstd")
+    assert not run_job(job).get("skipped")
+    monkeypatch.setattr(src.utils, "RCLIF_ORDER_BY", {job: ["range"]})
+    assert not run_job(job).get("skipped")
+    assert builds[job] == 3
+
+
+def test_jobs_drop_their_temp_tables(fake_jobs):
+    results = src.scheduler._run_serially(fake_jobs)
+    assert all(results[job] and not results[job].get("skipped") for job in fake_jobs)
+    assert duckdb.sql("SELECT table_name FROM duckdb_tables()").fetchall() == []
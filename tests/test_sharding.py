@@ -0,0 +1,105 @@
+"""Tests for the hash-sharded build: how the MIMIC scans are split into shards, and how the shards are merged."""
+import pytest
+import duckdb
+import pandas as pd
+import src.utils
+import src.sharding
+from src.utils import parse_shard, mimic_table_source, set_shard_key, clif_table_pathfinder
+from src.sharding import merge_shards, shard_clif_dirs
+from src.synthetic_mimic import generate_synthetic_mimic
+
+
+@pytest.fixture(scope="module")
+def synthetic_dir(tmp_path_factory):
+    """A small synthetic MIMIC-IV dataset.
+
+    Returns
+    -------
+    pathlib.Path
+        Directory holding the `hosp/` and `icu/` parquet files of 20 patients and 40 admissions.
+    """
+    output_dir = tmp_path_factory.mktemp("synthetic_mimic")
+    generate_synthetic_mimic(output_dir, n_patients=20, n_admissions=40, events_per_icu_day=50, seed=3)
+    return output_dir
+
+
+@pytest.fixture
+def shard(monkeypatch, synthetic_dir):
+    """Point the MIMIC tables at the synthetic dataset, with no cohort restriction.
+
+    Returns
+    -------
+    Callable
+        Selects the shard (index, count) and the shard key that the MIMIC scans are restricted to.
+    """
+    monkeypatch.setattr(src.utils, "MIMIC_PARQUET_DIR", str(synthetic_dir))
+    monkeypatch.setattr(src.utils, "COHORT_SUBJECT_IDS", [])
+    monkeypatch.setattr(src.utils, "COHORT_HADM_IDS", [])
+    monkeypatch.setattr(src.utils, "COHORT_SAMPLE_FRACTION", 1.0)
+    monkeypatch.setattr(src.utils, "SHARD_KEY", "hadm_id")
+
+    def select_shard(index, count, key="hadm_id"):
+        monkeypatch.setattr(src.utils, "SHARD_INDEX", index)
+        monkeypatch.setattr(src.utils, "SHARD_COUNT", count)
+        set_shard_key(key)
+    return select_shard
+
+
+def _ids(table: str, column: str) -> list[int]:
+    return [row[0] for row in duckdb.sql(f"SELECT {column} FROM {mimic_table_source(table)}").fetchall()]
+
+
+def test_parse_shard():
+    assert parse_shard("2/4") == (2, 4)
+    for invalid in ["4/4", "-1/4", "1", "a/b"]:
+        with pytest.raises(ValueError):
+            parse_shard(invalid)
+
+
+@pytest.mark.parametrize("key", ["hadm_id", "subject_id"])
+def test_shards_partition_the_rows(shard, key):
+    """Every row of a table is in exactly one shard, whichever column it is sharded by."""
+    shard(0, 1)
+    all_transfers = sorted(_ids("transfers", "transfer_id"))
+    per_shard = []
+    for index in range(3):
+        shard(index, 3, key)
+        per_shard.append(_ids("transfers", "transfer_id"))
+    assert sorted(sum(per_shard, [])) == all_transfers
+    assert all(per_shard)
+
+
+def test_patients_follow_their_admissions(shard):
+    """In a shard by hadm_id, the patients table keeps the patients of the shard's admissions."""
+    shard(1, 3)
+    subjects = {row[0] for row in duckdb.sql(f"SELECT subject_id FROM {mimic_table_source('admissions')}").fetchall()}
+    assert set(_ids("patients", "subject_id")) == subjects
+
+
+def test_merge_is_independent_of_the_split(monkeypatch, tmp_path):
+    monkeypatch.setattr(src.utils, "OUTPUT_DIR", str(tmp_path / "output"))
+    monkeypatch.setattr(src.utils, "CLIF_OUTPUT_DIR_NAME", "rclif")
+    monkeypatch.setattr(src.sharding, "SHARDS_DIR", tmp_path / "shards")
+    table = pd.DataFrame({
+        "hospitalization_id": ["3", "1", "2", "1", "2"],
+        "recorded_dttm": pd.to_datetime(["2020-01-01", "2020-01-02", "2020-01-01", "2020-01-01", "2020-01-03"]),
+        "value": [1.0, 2.0, None, 4.0, 5.0],
+    })
+    merged = []
+    for splits in [[[0, 1], [2, 3, 4]], [[4], [], [3, 1, 0, 2]]]:
+        for shard_dir, rows in zip(shard_clif_dirs(len(splits)), splits):
+            shard_dir.mkdir(parents=True)
+            table.iloc[rows].to_parquet(shard_dir / "clif_vitals.parquet", index=False)
+        assert merge_shards(len(splits)) == {"vitals": 5}
+        merged.append(pd.read_parquet(clif_table_pathfinder("vitals")))
+    pd.testing.assert_frame_equal(merged[0], merged[1])
+    assert list(merged[0]["hospitalization_id"]) == ["1", "1", "2", "2", "3"]
+
+
+def test_merge_requires_every_shard(monkeypatch, tmp_path):
+    monkeypatch.setattr(src.sharding, "SHARDS_DIR", tmp_path / "shards")
+    first_shard = shard_clif_dirs(2)[0]
+    first_shard.mkdir(parents=True)
+    pd.DataFrame({"patient_id": ["1"]}).to_parquet(first_shard / "clif_patient.parquet", index=False)
+    with pytest.raises(FileNotFoundError):
+        merge_shards(2)
@@ -0,0 +1,88 @@
+"""Tests for the synthetic MIMIC-IV generator.
+
+The generated tables must have the layout and column types of the real MIMIC-IV parquet files,
+and chart every item that the CLIF tables read from `chartevents`.
+"""
+import pytest
+import duckdb
+from src.synthetic_mimic import generate_synthetic_mimic
+from src.mimic_schemas import MIMIC_CSV_SCHEMAS
+import src.utils
+from src.shared_extracts import CHARTEVENTS_CONSUMERS, chartevents_item_ids, extract_events
+from src.utils import MIMIC_TABLES_NEEDED_FOR_CLIF, HOSP_TABLES, mimic_events_source, mimic_table_source
+
+
+@pytest.fixture(scope="module")
+def synthetic_dir(tmp_path_factory):
+    """A small synthetic MIMIC-IV dataset.
+
+    Returns
+    -------
+    pathlib.Path
+        Directory holding the `hosp/` and `icu/` parquet files of 20 patients and 30 admissions.
+    """
+    output_dir = tmp_path_factory.mktemp("synthetic_mimic")
+    generate_synthetic_mimic(output_dir, n_patients=20, n_admissions=30, events_per_icu_day=200, seed=1)
+    return output_dir
+
+
+@pytest.mark.parametrize("table", MIMIC_TABLES_NEEDED_FOR_CLIF)
+def test_tables_match_mimic_schemas(synthetic_dir, table):
+    """Each table is written to its module's subdirectory with the MIMIC-IV columns and types, in order."""
+    path = synthetic_dir / ("hosp" if table in HOSP_TABLES else "icu") / f"{table}.parquet"
+    assert path.exists()
+    relation = duckdb.sql(f"FROM '{path}'")
+    expected = MIMIC_CSV_SCHEMAS[table]
+    assert relation.columns == list(expected)
+    assert [str(dtype) for dtype in relation.dtypes] == list(expected.values())
+    assert len(relation) > 0
+
+
+def test_every_chartevents_item_is_charted(synthetic_dir):
+    """Every chartevents item read by the CLIF tables is in d_items and charted at least once."""
+    item_ids = set(chartevents_item_ids(CHARTEVENTS_CONSUMERS))
+    d_items = {row[0] for row in duckdb.sql(f"SELECT itemid FROM '{synthetic_dir}/icu/d_items.parquet'").fetchall()}
+    charted = {
+        row[0] for row in duckdb.sql(f"SELECT DISTINCT itemid FROM '{synthetic_dir}/icu/chartevents.parquet'").fetchall()
+    }
+    assert item_ids <= d_items
+    assert item_ids - charted <= {
+        item_id for item_id, in duckdb.sql(
+            f"SELECT itemid FROM '{synthetic_dir}/icu/d_items.parquet' WHERE linksto != 'chartevents'"
+        ).fetchall()
+    }
+
+
+def test_extract_keeps_the_order_of_the_source_table(synthetic_dir, tmp_path, monkeypatch):
+    """The shared extract is fully ordered, and its events have the same `source_order` as in chartevents."""
+    monkeypatch.setattr(src.utils, "MIMIC_PARQUET_DIR", str(synthetic_dir))
+    monkeypatch.setattr(src.utils, "OUTPUT_DIR", str(tmp_path))
+    monkeypatch.setattr(src.utils, "COHORT_SUBJECT_IDS", [])
+    monkeypatch.setattr(src.utils, "COHORT_HADM_IDS", [])
+    monkeypatch.setattr(src.utils, "COHORT_SAMPLE_FRACTION", 1.0)
+    monkeypatch.setattr(src.utils, "SHARD_COUNT", 1)
+    item_ids = chartevents_item_ids(CHARTEVENTS_CONSUMERS)
+    extract_events("chartevents", item_ids)
+    extract_path = mimic_events_source("chartevents", item_ids)
+    assert extract_path == src.utils.shared_extract_pathfinder("chartevents")
+
+    extract = duckdb.sql(f"FROM {mimic_table_source('chartevents', extract_path, source_order=True)}")
+    assert extract.order("itemid, hadm_id, charttime, source_order").fetchall() == extract.fetchall()
+    events = f"FROM {{}} WHERE itemid IN ({','.join(map(str, item_ids))}) ORDER BY source_order"
+    assert duckdb.sql(events.format(mimic_table_source("chartevents", extract_path, source_order=True))).fetchall() \
+        == duckdb.sql(events.format(mimic_table_source("chartevents", source_order=True))).fetchall()
+    # the readers that do not ask for it do not see it
+    assert "source_order" not in duckdb.sql(f"FROM {mimic_table_source('chartevents', extract_path)}").columns
+
+
+def test_same_seed_same_data(tmp_path):
+    """The same arguments always produce the same events."""
+    for name in ["a", "b"]:
+        generate_synthetic_mimic(tmp_path / name, n_patients=5, n_admissions=5, events_per_icu_day=50, seed=7)
+    query = "SELECT itemid, charttime, value FROM '{}/icu/chartevents.parquet' ORDER BY ALL"
+    assert duckdb.sql(query.format(tmp_path / "a")).fetchall() == duckdb.sql(query.format(tmp_path / "b")).fetchall()
+
+
+def test_fewer_admissions_than_patients_raises(tmp_path):
+    with pytest.raises(ValueError):
+        generate_synthetic_mimic(tmp_path, n_patients=10, n_admissions=5)
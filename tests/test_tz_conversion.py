@@ -0,0 +1,63 @@
+"""Tests for the in-engine UTC conversion.
+
+The `mimic_to_utc` SQL macro must convert local MIMIC timestamps to UTC exactly like the
+pandas-based `convert_tz_to_utc`, including the ambiguous (-> NaT) and nonexistent
+(-> shifted forward) times around every DST switch.
+"""
+import pytest
+import pandas as pd
+import duckdb
+from src.utils import convert_tz_to_utc, register_mimic_tz_conversion, mimic_tz_periods
+
+
+@pytest.fixture
+def conn():
+    """A fresh duckdb connection with the `mimic_to_utc` macro registered."""
+    conn = duckdb.connect()
+    register_mimic_tz_conversion(conn)
+    return conn
+
+
+@pytest.fixture
+def local_timestamps() -> pd.DataFrame:
+    """Local timestamps covering every DST switch and a sample of the MIMIC years.
+
+    Returns
+    -------
+    pd.DataFrame
+        An index `i` and a column `ts` with every 10 minutes within 3 hours of each switch, every hour
+        of the first day of each month in 1900-2040, and every 7 hours and 13 minutes of 2100-2214.
+    """
+    periods = mimic_tz_periods()
+    switches = periods.loc[periods["kind"] != "normal", "local_start"].map(pd.Timestamp)
+    around_switches = [
+        pd.date_range(switch - pd.Timedelta(hours=3), periods=37, freq="10min")
+        for switch in switches
+    ]
+    month_starts = pd.date_range("1900-01-01", "2040-12-01", freq="MS")
+    first_days = [pd.date_range(day, periods=24, freq="h") for day in month_starts]
+    mimic_years = [pd.date_range("2100-01-01", "2214-12-31", freq="433min")]
+    ts = pd.DatetimeIndex(sorted(set().union(*around_switches, *first_days, *mimic_years)))
+    return pd.DataFrame({"i": range(len(ts)), "ts": ts.astype("datetime64[us]")})
+
+
+def test_mimic_to_utc_matches_pandas(conn, local_timestamps):
+    """The macro agrees with `convert_tz_to_utc` on every timestamp, NaT included."""
+    expected = convert_tz_to_utc(local_timestamps["ts"])
+    actual = conn.sql("SELECT mimic_to_utc(ts) AS ts FROM local_timestamps ORDER BY i").df()["ts"]
+    assert expected.isna().sum() > 0, "the sample should include ambiguous times"
+    pd.testing.assert_series_equal(actual, expected.rename("ts"), check_dtype=True)
+
+
+@pytest.mark.parametrize("local, utc", [
+    ("2180-07-01 12:00:00", "2180-07-01 17:00:00"),  # no DST beyond 2037 in the tz database
+    ("2030-07-01 12:00:00", "2030-07-01 16:00:00"),  # DST
+    ("2030-03-10 02:30:00", "2030-03-10 07:00:00"),  # nonexistent -> shifted forward
+    ("2030-11-03 01:30:00", None),                    # ambiguous -> NULL
+])
+def test_mimic_to_utc_examples(conn, local, utc):
+    result = conn.sql(f"SELECT mimic_to_utc(TIMESTAMP '{local}') AS ts").df()["ts"].iloc[0]
+    if utc is None:
+        assert pd.isna(result)
+    else:
+        assert result == pd.Timestamp(utc, tz="UTC")
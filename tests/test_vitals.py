@@ -0,0 +1,66 @@
+"""Tests for the vitals module: the unit conversions, the temperature coalescing and the dedup."""
+import pytest
+import duckdb
+import pandas as pd
+from src.tables.vitals import (
+    vitals_mapping, vital_item_ids, vital_names, standard_vitals, temp_pivoted_wider, temp_vitals, merged,
+    deduped, cast, CLIF_VITALS_SCHEMA, TEMP_F_ITEM_ID, TEMP_C_ITEM_ID, TEMP_SITE_ITEM_ID, WEIGHT_LB_ITEM_ID,
+)
+from src.utils import validate_clif_table
+
+HEART_RATE = 220045
+WEIGHT_KG = 226512
+
+
+@pytest.fixture(scope="module")
+def names() -> pd.DataFrame:
+    """vital_name and vital_category of the items in the vitals mapping.
+
+    Returns
+    -------
+    pd.DataFrame
+        Columns itemid, vital_name and vital_category.
+    """
+    mapping = vitals_mapping()
+    return vital_names(mapping, vital_item_ids(mapping))
+
+
+def _events(rows: list[tuple]) -> duckdb.DuckDBPyRelation:
+    """Events as extracted, from (hadm_id, hour, itemid, value) in file order."""
+    events = pd.DataFrame(rows, columns=["hadm_id", "hour", "itemid", "value"])
+    events["time"] = pd.Timestamp("2150-01-01") + pd.to_timedelta(events.pop("hour"), unit="h")
+    events["event_order"] = range(len(events))
+    return duckdb.sql("FROM events SELECT itemid, hadm_id, time, value, event_order")
+
+
+def _vitals(standard_rows: list[tuple], temp_rows: list[tuple], names: pd.DataFrame) -> pd.DataFrame:
+    standard = standard_vitals(_events(standard_rows), names)
+    temp = temp_vitals(temp_pivoted_wider(_events(temp_rows)))
+    return cast(deduped(merged(standard, temp))).df()
+
+
+def test_only_admission_weights_in_lbs_are_converted(names):
+    vitals = _vitals([(1, 0, WEIGHT_LB_ITEM_ID, "150"), (1, 1, HEART_RATE, "150")], [], names)
+    assert list(vitals["vital_value"]) == [68.0, 150.0]
+    assert list(vitals["vital_category"]) == ["weight_kg", "heart_rate"]
+
+
+def test_celsius_is_preferred_over_converted_fahrenheit(names):
+    vitals = _vitals([], [
+        (1, 0, TEMP_F_ITEM_ID, "102.8"), (1, 0, TEMP_SITE_ITEM_ID, "Oral"),
+        (1, 1, TEMP_F_ITEM_ID, "98.6"), (1, 1, TEMP_C_ITEM_ID, "37.2"),
+        # a site alone is not a measurement
+        (1, 2, TEMP_SITE_ITEM_ID, "Axillary"),
+    ], names)
+    assert list(vitals["vital_value"]) == [39.3, 37.2]
+    assert list(vitals["vital_name"]) == ["Temperature Fahrenheit", "Temperature Celsius"]
+    assert list(vitals["meas_site_name"]) == ["Oral", None]
+    validate_clif_table(CLIF_VITALS_SCHEMA, vitals)
+
+
+def test_same_value_at_the_same_time_is_kept_once(names):
+    vitals = _vitals([
+        (1, 0, WEIGHT_KG, "68"), (1, 0, WEIGHT_LB_ITEM_ID, "150"), (1, 0, WEIGHT_KG, "70"),
+    ], [], names)
+    assert list(vitals["vital_value"]) == [68.0, 70.0]
+    assert vitals["vital_name"].iloc[0] == "Admission Weight (Kg)"